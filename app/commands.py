@@ -0,0 +1,51 @@
+'''
+RPC commands of the device application.
+
+Commands are registered in ``rpc.REGISTRY`` by :func:`register_commands`, so
+that they may be called by opcode, without evaluating the command string.
+Used by ``main.py`` on the device, and by the emulator (``sim/device.py``).
+
+.. versionadded:: 0.12.0
+'''
+import gc
+
+import gcpolicy
+import machine
+import program
+import recipes
+import rpc
+import util
+
+
+def register_commands(motor_ctrl, i2c, registry=rpc.REGISTRY):
+    '''Register device commands.
+
+    Parameters
+    ----------
+    motor_ctrl : motor.GroveMotorControl
+        Motor controller (``motor_ctrl.*``, ``program.run`` and, if its pulse
+        engine is enabled, ``pulse.*`` commands).
+    i2c : i2cbus.Bus
+        I2C bus (``i2c.*`` commands).
+    registry : rpc.Registry, optional
+        Registry to add commands to.
+    '''
+    for name in ('pump', 'set_direction', 'state', 'invalidate', 'health',
+                 'reset_health'):
+        registry.register('motor_ctrl.' + name, getattr(motor_ctrl, name))
+    registry.register('program.run', program.Interpreter(motor_ctrl).run)
+    for name in ('save', 'load', 'delete', 'names', 'run'):
+        registry.register('recipes.' + name, getattr(recipes, name))
+    if motor_ctrl.engine is not None:
+        for name in ('stats', 'reset'):
+            registry.register('pulse.' + name,
+                              getattr(motor_ctrl.engine, name))
+    for name in ('scan', 'stats', 'reset', 'benchmark'):
+        registry.register('i2c.' + name, getattr(i2c, name))
+    for name in ('collect', 'mem_free', 'mem_alloc'):
+        registry.register('gc.' + name, getattr(gc, name))
+    for name in ('read_at', 'walk_files', 'walk_stat', 'exists'):
+        registry.register('util.' + name, getattr(util, name))
+    registry.register('machine.reset', machine.reset)
+    for name in ('configure', 'stats', 'reset'):
+        registry.register('gcpolicy.' + name, getattr(gcpolicy, name))
@@ -12,10 +12,13 @@ def load():
     '''
     .. versionchanged:: 0.8.1
         Check if config file exists before trying to open it.
+
+    .. versionchanged:: 0.12.0
+        Fix opening of config file.
     '''
     CONFIG.clear()
     if util.exists('config.json'):
-        with open( 'r') as input_:
+        with open('config.json', 'r') as input_:
             CONFIG.update(json.load(input_))
 
     return CONFIG
@@ -0,0 +1,76 @@
+'''
+Unsolicited event notifications pushed to RPC clients.
+
+Events are sent to each subscribed connection as a message of the form
+``{"event": <name>, "data": <data>}``.  A connection subscribes using the
+``__subscribe__`` command, passing a list of name prefixes (e.g.,
+``["pump."]``); the prefix ``"*"`` matches all events.
+
+.. versionadded:: 0.12.0
+'''
+import uasyncio as asyncio
+
+
+class Subscriber:
+    def __init__(self, send):
+        '''
+        Parameters
+        ----------
+        send : coroutine function
+            Called with each matching event message.
+        '''
+        self.send = send
+        self.prefixes = []
+
+    def matches(self, name):
+        for prefix in self.prefixes:
+            if prefix == '*' or name.startswith(prefix):
+                return True
+        return False
+
+
+SUBSCRIBERS = []
+
+
+def subscribe(subscriber, prefixes):
+    '''Set event name prefixes of subscriber.
+
+    An empty list of prefixes unsubscribes from all events.
+    '''
+    subscriber.prefixes = list(prefixes)
+    if not prefixes:
+        unsubscribe(subscriber)
+    elif subscriber not in SUBSCRIBERS:
+        SUBSCRIBERS.append(subscriber)
+
+
+def unsubscribe(subscriber):
+    if subscriber in SUBSCRIBERS:
+        SUBSCRIBERS.remove(subscriber)
+
+
+def active(name):
+    '''Return ``True`` if any subscriber matches event name.'''
+    for subscriber in SUBSCRIBERS:
+        if subscriber.matches(name):
+            return True
+    return False
+
+
+async def publish(name, data=None):
+    '''Send event to all matching subscribers.'''
+    message = None
+    for subscriber in SUBSCRIBERS:
+        if subscriber.matches(name):
+            if message is None:
+                message = {'event': name, 'data': data}
+            try:
+                await subscriber.send(message)
+            except Exception as exception:
+                print('error publishing `%s`: %s' % (name, exception))
+
+
+def emit(name, data=None):
+    '''Schedule :func:`publish` from non-async code.'''
+    if active(name):
+        asyncio.get_event_loop().create_task(publish(name, data))
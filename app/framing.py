@@ -0,0 +1,298 @@
+'''
+Message framing for RPC requests and responses.
+
+Two framings are supported:
+
+ - ``json``: one JSON document per line (default).
+ - ``msgpack``: a big-endian 16-bit payload length, followed by the payload
+   encoded using a subset of MessagePack.
+
+The framing of a connection is selected by the host using the ``__framing__``
+command; the device falls back to (and starts in) ``json``.
+
+This module is also imported by the host (see ``notebooks/rpc_host.py``), so
+it must run under both MicroPython and CPython.
+
+.. versionadded:: 0.12.0
+'''
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    import uio as io
+except ImportError:
+    import io
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is False:
+        out.append(0xc2)
+    elif obj is True:
+        out.append(0xc3)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xff)
+        elif 0 <= obj <= 0xff:
+            out.append(0xcc)
+            out.append(obj)
+        elif 0 <= obj <= 0xffff:
+            out.extend(struct.pack('>BH', 0xcd, obj))
+        elif 0 <= obj <= 0xffffffff:
+            out.extend(struct.pack('>BI', 0xce, obj))
+        elif -0x80 <= obj < 0:
+            out.extend(struct.pack('>Bb', 0xd0, obj))
+        elif -0x8000 <= obj < 0:
+            out.extend(struct.pack('>Bh', 0xd1, obj))
+        elif -0x80000000 <= obj < 0:
+            out.extend(struct.pack('>Bi', 0xd2, obj))
+        else:
+            raise ValueError('integer out of range: %s' % obj)
+    elif isinstance(obj, float):
+        out.extend(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode('utf8')
+        n = len(data)
+        if n < 0x20:
+            out.append(0xa0 | n)
+        elif n <= 0xff:
+            out.append(0xd9)
+            out.append(n)
+        else:
+            out.extend(struct.pack('>BH', 0xda, n))
+        out.extend(data)
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        if n <= 0xff:
+            out.append(0xc4)
+            out.append(n)
+        else:
+            out.extend(struct.pack('>BH', 0xc5, n))
+        out.extend(obj)
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 0x10:
+            out.append(0x90 | n)
+        else:
+            out.extend(struct.pack('>BH', 0xdc, n))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 0x10:
+            out.append(0x80 | n)
+        else:
+            out.extend(struct.pack('>BH', 0xde, n))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError('cannot serialize %r' % (obj, ))
+
+
+def packb(obj):
+    '''Serialize object using the supported MessagePack subset.
+
+    Supported types: ``None``, ``bool``, ``int`` (32-bit), ``float``, ``str``,
+    ``bytes``, ``list``/``tuple`` and ``dict``.
+    '''
+    out = bytearray()
+    _pack(obj, out)
+    return out
+
+
+class _Cursor(io.IOBase):
+    '''Write position in a fixed-size buffer, used in place of a
+    ``bytearray`` by :func:`_pack`, and as the stream of ``json.dump()``.
+
+    Raises ``IndexError`` if the buffer is full.
+    '''
+    def __init__(self, buf, offset):
+        self.buf = buf
+        self.offset = offset
+
+    def append(self, byte):
+        if self.offset >= len(self.buf):
+            raise IndexError('buffer full')
+        self.buf[self.offset] = byte
+        self.offset += 1
+
+    def extend(self, data):
+        end = self.offset + len(data)
+        if end > len(self.buf):
+            raise IndexError('buffer full')
+        self.buf[self.offset:end] = data
+        self.offset = end
+
+    def write(self, data):
+        # MicroPython streams write UTF-8 bytes; CPython `json.dump()` writes
+        # text.
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        self.extend(data)
+        return len(data)
+
+
+# Fixed-size types: code -> (struct format, size)
+_FIXED = {0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4),
+          0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4),
+          0xca: ('>f', 4), 0xcb: ('>d', 8)}
+
+
+def _unpack(data, i):
+    code = data[i]
+    i += 1
+    if code < 0x80:
+        return code, i
+    elif code >= 0xe0:
+        return code - 0x100, i
+    elif code in _FIXED:
+        fmt, size = _FIXED[code]
+        return struct.unpack_from(fmt, data, i)[0], i + size
+    elif code == 0xc0:
+        return None, i
+    elif code == 0xc2:
+        return False, i
+    elif code == 0xc3:
+        return True, i
+    elif 0xa0 <= code <= 0xbf or code in (0xd9, 0xda, 0xc4, 0xc5):
+        if code <= 0xbf:
+            n = code & 0x1f
+        elif code in (0xd9, 0xc4):
+            n = data[i]
+            i += 1
+        else:
+            n = struct.unpack_from('>H', data, i)[0]
+            i += 2
+        value = bytes(data[i:i + n])
+        if code < 0xc4 or code > 0xc5:
+            value = value.decode('utf8')
+        return value, i + n
+    elif 0x90 <= code <= 0x9f or code == 0xdc:
+        if code == 0xdc:
+            n = struct.unpack_from('>H', data, i)[0]
+            i += 2
+        else:
+            n = code & 0x0f
+        value = []
+        for j in range(n):
+            item, i = _unpack(data, i)
+            value.append(item)
+        return value, i
+    elif 0x80 <= code <= 0x8f or code == 0xde:
+        if code == 0xde:
+            n = struct.unpack_from('>H', data, i)[0]
+            i += 2
+        else:
+            n = code & 0x0f
+        value = {}
+        for j in range(n):
+            key, i = _unpack(data, i)
+            value[key], i = _unpack(data, i)
+        return value, i
+    raise ValueError('unsupported type code: 0x%02x' % code)
+
+
+def unpackb(data):
+    '''Deserialize object encoded with :func:`packb`.'''
+    value, i = _unpack(data, 0)
+    return value
+
+
+class JsonLines:
+    '''One JSON document per line.'''
+    name = 'json'
+
+    @staticmethod
+    async def read(areader, buf):
+        '''Read next message, or return ``None`` at end of stream.
+
+        The line is read into preallocated buffer ``buf`` and decoded in
+        place.
+        '''
+        line = await areader.readline_into(buf)
+        if not line:
+            return None
+        return json.loads(line)
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj) + '\r\n'
+
+    @staticmethod
+    def dump_into(obj, buf, offset):
+        '''Write message to ``buf`` at ``offset`` and return end offset.
+
+        The document is serialized directly into ``buf``.  Raises
+        ``IndexError`` if the message does not fit.
+        '''
+        cursor = _Cursor(buf, offset)
+        json.dump(obj, cursor)
+        cursor.append(0x0d)
+        cursor.append(0x0a)
+        return cursor.offset
+
+
+class LengthPrefixed:
+    '''16-bit big-endian length prefix, followed by :func:`packb` payload.'''
+    name = 'msgpack'
+
+    @staticmethod
+    async def read(areader, buf):
+        '''Read next message, or return ``None`` at end of stream.
+
+        The message is read into preallocated buffer ``buf`` and decoded in
+        place.  Raises ``ValueError`` (after discarding the payload) if the
+        payload does not fit in ``buf``.
+        '''
+        header = await areader.readinto(buf, 2)
+        if len(header) < 2:
+            return None
+        size = (header[0] << 8) | header[1]
+        if size > len(buf):
+            while size:
+                chunk = await areader.readinto(buf, min(size, len(buf)))
+                if not chunk:
+                    return None
+                size -= len(chunk)
+            raise ValueError('message too large')
+        payload = await areader.readinto(buf, size)
+        if len(payload) < size:
+            return None
+        return unpackb(payload)
+
+    @staticmethod
+    def dumps(obj):
+        payload = packb(obj)
+        if len(payload) > 0xffff:
+            raise ValueError('message too large (%d bytes)' % len(payload))
+        return struct.pack('>H', len(payload)) + payload
+
+    @staticmethod
+    def dump_into(obj, buf, offset):
+        '''Write message to ``buf`` at ``offset`` and return end offset.
+
+        The payload is serialized directly into ``buf``.  Raises
+        ``IndexError`` if the message does not fit.
+        '''
+        cursor = _Cursor(buf, offset + 2)
+        _pack(obj, cursor)
+        size = cursor.offset - offset - 2
+        if size > 0xffff:
+            raise ValueError('message too large (%d bytes)' % size)
+        buf[offset] = size >> 8
+        buf[offset + 1] = size & 0xff
+        return cursor.offset
+
+
+FRAMINGS = {JsonLines.name: JsonLines, LengthPrefixed.name: LengthPrefixed}
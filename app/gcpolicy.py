@@ -0,0 +1,152 @@
+'''
+Garbage collection policies.
+
+Code that previously called ``gc.collect()`` unconditionally (e.g., after each
+RPC response or pump run) calls :func:`collect` instead, and the RPC loop
+calls :func:`idle` when no commands are in flight.  The active policy decides
+whether (and when) a collection actually runs.
+
+Example ``config.json`` entry:
+
+    "gc": {"policy": "threshold", "min_free": 16384}
+
+.. versionadded:: 0.12.0
+'''
+import gc
+
+import utime
+
+
+class Always:
+    '''Collect every time :func:`collect` is called (original behaviour).'''
+    name = 'always'
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        #: Number of calls to :meth:`collect`.
+        self.requests = 0
+        #: Number of collections run.
+        self.collections = 0
+        #: Total and maximum duration of collections (in microseconds).
+        self.total_us = 0
+        self.max_us = 0
+
+    def should_collect(self):
+        return True
+
+    def collect(self):
+        self.requests += 1
+        if self.should_collect():
+            self.run()
+
+    def idle(self):
+        pass
+
+    def run(self):
+        start = utime.ticks_us()
+        gc.collect()
+        duration = utime.ticks_diff(utime.ticks_us(), start)
+        self.collections += 1
+        self.total_us += duration
+        if duration > self.max_us:
+            self.max_us = duration
+
+    def stats(self):
+        return {'policy': self.name, 'requests': self.requests,
+                'collections': self.collections, 'total_us': self.total_us,
+                'max_us': self.max_us, 'mem_free': gc.mem_free(),
+                'mem_alloc': gc.mem_alloc()}
+
+
+class Threshold(Always):
+    '''Collect only if free heap is below ``min_free`` bytes.'''
+    name = 'threshold'
+
+    def __init__(self, min_free=16384):
+        self.min_free = min_free
+        super().__init__()
+
+    def should_collect(self):
+        return gc.mem_free() < self.min_free
+
+
+class Allocation(Always):
+    '''Leave collection to the allocator, using ``gc.threshold()``.
+
+    A collection is triggered by the allocator after ``allocated`` bytes have
+    been allocated.  These collections are not included in the counters.
+    '''
+    name = 'allocation'
+
+    def __init__(self, allocated=8192):
+        gc.threshold(allocated)
+        super().__init__()
+
+    def should_collect(self):
+        return False
+
+
+class Idle(Always):
+    '''Defer collection until no RPC commands are in flight.
+
+    A collection still runs immediately if free heap is below ``min_free``
+    bytes.
+    '''
+    name = 'idle'
+
+    def __init__(self, min_free=4096):
+        self.min_free = min_free
+        self.pending = False
+        super().__init__()
+
+    def should_collect(self):
+        self.pending = True
+        return gc.mem_free() < self.min_free
+
+    def idle(self):
+        if self.pending:
+            self.run()
+
+    def run(self):
+        self.pending = False
+        super().run()
+
+
+POLICIES = {cls.name: cls for cls in (Always, Threshold, Allocation, Idle)}
+POLICY = Always()
+
+
+def configure(policy='always', **kwargs):
+    '''Select active policy.
+
+    Parameters
+    ----------
+    policy : str, optional
+        Policy name (see :data:`POLICIES`).
+    **kwargs
+        Keyword arguments for policy class, e.g., ``min_free``.
+    '''
+    global POLICY
+    if POLICY.name == 'allocation':
+        # Disable allocation threshold of previous policy.
+        gc.threshold(-1)
+    POLICY = POLICIES[policy](**kwargs)
+    return POLICY.name
+
+
+def collect():
+    POLICY.collect()
+
+
+def idle():
+    POLICY.idle()
+
+
+def stats():
+    return POLICY.stats()
+
+
+def reset():
+    POLICY.reset()
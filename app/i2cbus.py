@@ -0,0 +1,167 @@
+'''
+Instrumented I2C bus, with per-address transaction counters and a clock
+frequency benchmark.
+
+.. versionadded:: 0.12.0
+'''
+from machine import I2C
+import uasyncio as asyncio
+import utime
+
+import config
+
+
+#: Candidate clock frequencies for :meth:`Bus.benchmark` (in Hz).
+FREQUENCIES = (10000, 50000, 100000, 200000, 400000)
+
+
+class Bus:
+    '''I2C bus, counting transactions and their duration by address.
+
+    Has the same transaction methods as ``machine.I2C`` (other attributes
+    are looked up on the underlying ``machine.I2C`` instance).
+
+    Parameters
+    ----------
+    scl, sda : machine.Pin
+        Bus pins.
+    freq : int, optional
+        Clock frequency (in Hz).
+    '''
+    def __init__(self, scl, sda, freq=10000):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.i2c = I2C(scl=scl, sda=sda, freq=freq)
+        # Address -> [transactions, errors, total_us, max_us]
+        self.counters = {}
+
+    def __getattr__(self, name):
+        return getattr(self.i2c, name)
+
+    def init(self, freq):
+        '''Change clock frequency.'''
+        self.i2c.init(scl=self.scl, sda=self.sda, freq=freq)
+        self.freq = freq
+
+    def _call(self, method, address, *args):
+        start = utime.ticks_us()
+        counters = self.counters.get(address)
+        if counters is None:
+            counters = [0, 0, 0, 0]
+            self.counters[address] = counters
+        counters[0] += 1
+        try:
+            return method(address, *args)
+        except OSError:
+            counters[1] += 1
+            raise
+        finally:
+            duration = utime.ticks_diff(utime.ticks_us(), start)
+            counters[2] += duration
+            if duration > counters[3]:
+                counters[3] = duration
+
+    def writeto(self, address, *args):
+        return self._call(self.i2c.writeto, address, *args)
+
+    def readfrom(self, address, *args):
+        return self._call(self.i2c.readfrom, address, *args)
+
+    def readfrom_into(self, address, *args):
+        return self._call(self.i2c.readfrom_into, address, *args)
+
+    def writeto_mem(self, address, *args):
+        return self._call(self.i2c.writeto_mem, address, *args)
+
+    def readfrom_mem(self, address, *args):
+        return self._call(self.i2c.readfrom_mem, address, *args)
+
+    def readfrom_mem_into(self, address, *args):
+        return self._call(self.i2c.readfrom_mem_into, address, *args)
+
+    def scan(self):
+        return self.i2c.scan()
+
+    def stats(self):
+        '''Return clock frequency and transaction counters of each address.
+        '''
+        addresses = []
+        for address in sorted(self.counters):
+            transactions, errors, total_us, max_us = self.counters[address]
+            addresses.append({'address': address,
+                              'transactions': transactions, 'errors': errors,
+                              'total_us': total_us,
+                              'mean_us': total_us // transactions,
+                              'max_us': max_us})
+        return {'freq': self.freq, 'addresses': addresses}
+
+    def reset(self):
+        '''Reset transaction counters.'''
+        self.counters.clear()
+
+    async def benchmark(self, freqs=FREQUENCIES, addresses=None, count=20,
+                        save=True):
+        '''Measure transaction latency and error rate at each frequency.
+
+        Each address is probed (with an empty write) ``count`` times at each
+        frequency.  The bus is then set to the fastest frequency without
+        errors (or left at the current frequency, if every candidate had
+        errors).  Should be run while the bus is otherwise idle.
+
+        Parameters
+        ----------
+        freqs : list[int], optional
+            Candidate frequencies (in Hz).
+        addresses : list[int], optional
+            Addresses to probe (default: addresses found by :meth:`scan`).
+        count : int, optional
+            Number of transactions per address and frequency.
+        save : bool, optional
+            If ``True``, store selected frequency in ``config.json`` (as
+            ``i2c.freq``).
+
+        Returns
+        -------
+        dict
+            Selected frequency, and transactions, errors, mean and maximum
+            latency (in microseconds) for each candidate frequency.
+        '''
+        if addresses is None:
+            addresses = self.scan()
+        current = self.freq
+        results = []
+        selected = None
+        try:
+            for freq in sorted(freqs):
+                self.init(freq)
+                errors = 0
+                total_us = 0
+                max_us = 0
+                for i in range(count):
+                    for address in addresses:
+                        start = utime.ticks_us()
+                        try:
+                            self.i2c.writeto(address, b'')
+                        except OSError:
+                            errors += 1
+                        duration = utime.ticks_diff(utime.ticks_us(), start)
+                        total_us += duration
+                        if duration > max_us:
+                            max_us = duration
+                    # Let other tasks run.
+                    await asyncio.sleep_ms(0)
+                transactions = count * len(addresses)
+                results.append({'freq': freq, 'transactions': transactions,
+                                'errors': errors,
+                                'mean_us': (total_us // transactions
+                                            if transactions else 0),
+                                'max_us': max_us})
+                if not errors:
+                    selected = freq
+        finally:
+            self.init(current if selected is None else selected)
+        if selected is not None and save:
+            config.CONFIG.setdefault('i2c', {})['freq'] = selected
+            config.save()
+        return {'selected': selected, 'results': results}
@@ -0,0 +1,157 @@
+'''
+Benchmark of event loop scheduling cost at different queue sizes, and of
+the delay of periodic (pulse-like) edges under a flood of best-effort tasks.
+
+Each measurement is made on a fresh event loop (the running loop is not
+affected, but is blocked while the benchmark runs).  Run on the device, e.g.,
+from the REPL:
+
+    >>> import loopbench
+    >>> loopbench.run()
+    >>> loopbench.flood()
+
+.. versionadded:: 0.12.0
+'''
+import uasyncio as asyncio
+import utime
+import utimeq
+
+
+#: Queue sizes benchmarked by default.
+SIZES = (16, 32, 64, 128, 256)
+
+
+def _task(rounds):
+    for i in range(rounds):
+        yield
+
+
+def runq_cost(size, rounds=20):
+    '''Return mean time per coroutine step (us) with ``size // 2`` tasks.
+
+    Each task reschedules itself (through the run queue) ``rounds`` times.
+    '''
+    loop = asyncio.PollEventLoop(size, size)
+    count = max(size // 2, 1)
+    for i in range(count - 1):
+        loop.call_soon(_task(rounds))
+    start = utime.ticks_us()
+    loop.run_until_complete(_task(rounds))
+    return utime.ticks_diff(utime.ticks_us(), start) / (count * rounds)
+
+
+def waitq_cost(size):
+    '''Return mean time (us) to push and to pop an entry of a full waitq.'''
+    waitq = utimeq.utimeq(size)
+    now = utime.ticks_ms()
+    start = utime.ticks_us()
+    for i in range(size):
+        # Interleave deadlines, so entries are not pushed in order.
+        waitq.push(utime.ticks_add(now, (i * 7919) % size), None, ())
+    push_us = utime.ticks_diff(utime.ticks_us(), start) / size
+    entry = [0, 0, 0]
+    start = utime.ticks_us()
+    while waitq:
+        waitq.pop(entry)
+    pop_us = utime.ticks_diff(utime.ticks_us(), start) / size
+    return push_us, pop_us
+
+
+def run(sizes=SIZES, rounds=20):
+    '''Benchmark scheduling cost at each queue size.
+
+    Returns
+    -------
+    list[dict]
+        Per size: mean coroutine step time with ``size // 2`` runnable tasks
+        (``runq_us``), and mean waitq push and pop time (``push_us``,
+        ``pop_us``), in microseconds.
+    '''
+    results = []
+    print('%6s %10s %10s %10s' % ('size', 'runq_us', 'push_us', 'pop_us'))
+    for size in sizes:
+        step_us = runq_cost(size, rounds)
+        push_us, pop_us = waitq_cost(size)
+        results.append({'size': size, 'runq_us': step_us,
+                        'push_us': push_us, 'pop_us': pop_us})
+        print('%6d %10.1f %10.1f %10.1f' % (size, step_us, push_us, pop_us))
+    return results
+
+
+def _edges(period_ms, count, result, stop):
+    # Pulse-like task: sleep until just before each edge, then yield until
+    # it is due (as ``pulse.PulseEngine`` does in loop mode).
+    deadline = utime.ticks_us()
+    for i in range(count):
+        deadline = utime.ticks_add(deadline, period_ms * 1000)
+        while True:
+            delay = utime.ticks_diff(deadline, utime.ticks_us())
+            if delay <= 0:
+                break
+            yield delay // 1000
+        late = -delay
+        result[0] += late
+        if late > result[1]:
+            result[1] = late
+    stop[0] = True
+
+
+def _flood(step_us, stop):
+    # Best-effort task: busy for ``step_us`` at each step (e.g., decoding an
+    # RPC request).
+    while not stop[0]:
+        start = utime.ticks_us()
+        while utime.ticks_diff(utime.ticks_us(), start) < step_us:
+            pass
+        yield
+
+
+def flood_latency(high, tasks=8, step_us=1000, period_ms=20, count=50,
+                  budget_us=0):
+    '''Return mean and maximum delay (us) of periodic edges.
+
+    Parameters
+    ----------
+    high : bool
+        If ``True``, run edge task at high priority.
+    tasks : int, optional
+        Number of best-effort tasks, each busy for ``step_us`` at each step.
+    period_ms : int, optional
+        Interval between edges.
+    count : int, optional
+        Number of edges.
+    budget_us : int, optional
+        Event loop time budget for best-effort tasks (see
+        ``EventLoop.budget_us``).
+    '''
+    size = max(tasks * 2, 16)
+    loop = asyncio.PollEventLoop(size, size)
+    loop.budget_us = budget_us
+    result = [0, 0]
+    stop = [False]
+    for i in range(tasks):
+        loop.create_task(_flood(step_us, stop))
+    loop.create_task(_edges(period_ms, count, result, stop), high)
+    # Wait (as a best-effort task) until edge task is done.
+    loop.run_until_complete(_flood(0, stop))
+    return result[0] / count, result[1]
+
+
+def flood(tasks=8, step_us=1000, period_ms=20, count=50):
+    '''Compare edge delay of best-effort and high-priority edge task.
+
+    Returns
+    -------
+    list[dict]
+        Priority, and mean and maximum edge delay (in microseconds).
+    '''
+    results = []
+    print('%-8s %10s %10s' % ('priority', 'mean_us', 'max_us'))
+    for high in (False, True):
+        mean_us, max_us = flood_latency(high, tasks, step_us, period_ms,
+                                        count)
+        results.append({'priority': 'high' if high else 'best-effort',
+                        'mean_us': mean_us, 'max_us': max_us})
+        print('%-8s %10.1f %10d' % ('high' if high else 'best', mean_us,
+                                    max_us))
+    return results
@@ -1,16 +1,25 @@
+# Modules imported (but not used) here are available to evaluated RPC
+# commands (e.g., `recipes.names()`), since the RPC context is populated from
+# `globals()` (see `main()`).
 import gc
 import json
 
-from machine import Pin, I2C, UART
+from machine import Pin, UART
 import bootstrap
+import commands
 import config
+import gcpolicy
+import i2cbus
 import machine
 import motor
 import ota
+import program
+import recipes
 import rpc
 import uasyncio as asyncio
 import util
 import wifimgr
+import wiring
 
 
 def main():
@@ -18,21 +27,23 @@ def main():
     pin = Pin(LED_PIN, Pin.OUT)
     pin.value(0)
 
+    # Select garbage collection policy (see `gcpolicy` module).
+    gcpolicy.configure(**config.CONFIG.get('gc', {}))
+
     # Attempt to connect to Wifi network.
     wlan = wifimgr.get_connection()
 
-    # Bind to UART 2 to handle RPC requests.
+    # Bind to UART 2 to handle RPC requests (see `wiring` module for the
+    # output buffer settings).
     uart = UART(2, baudrate=115200)
-    uart_awriter = asyncio.StreamWriter(uart, {})
-    uart_areader = asyncio.StreamReader(uart)
+    uart_areader, uart_awriter = wiring.uart_streams(uart)
 
-    # Bind I2C connection for controlling motor drivers
-    i2c_config = config.CONFIG.get('i2c', {})
-    i2c = I2C(scl=Pin(i2c_config.get('scl', 22)),
-              sda=Pin(i2c_config.get('sda', 23)),
-              freq=i2c_config.get('freq', 10000))
+    # Bind I2C connection for controlling motor drivers.
+    i2c = wiring.i2c_bus()
 
-    motor_ctrl = motor.GroveMotorControl(i2c)
+    # Pumps run on a shared pulse engine timeline (see `pulse` and `wiring`
+    # modules).
+    motor_ctrl = wiring.motor_control(i2c)
 
     # Expose globals to RPC context
     context = globals().copy()
@@ -57,10 +68,20 @@ def main():
     # `rpc.rpc()` function.
     rpc = context.pop('rpc', None)
 
+    # Register commands, which may then be called by opcode, without
+    # evaluating the command string.
+    commands.register_commands(motor_ctrl, i2c, rpc.REGISTRY)
+
     # Reclaim memory associated with any temporary allocations.
     gc.collect()
 
-    loop = asyncio.get_event_loop()
+    # Size event loop queues (see `wiring` module).
+    loop = wiring.event_loop()
+
+    # Also serve RPC requests over TCP if connected to a Wifi network.
+    tcp_config = config.CONFIG.get('rpc_tcp', {})
+    if wlan is not None and tcp_config.get('enabled', True):
+        wiring.start_tcp_server(loop)
 
     pin = Pin(LED_PIN, Pin.OUT)
     pin.value(1)
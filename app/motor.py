@@ -1,14 +1,286 @@
-import gc
-
 import grove_i2c_motor as gm
+import utime
 
+import events
+import gcpolicy
+import pulse
 import pump
 
 
+#: Register of Grove I2C motor driver holding the state of all four outputs
+#: (bit ``i`` is output ``i``); see :attr:`Board.mask_write`.
+DIRECTION_SET = 0xaa
+
+#: Circuit breaker states of :class:`Board`: writes allowed (``closed``),
+#: writes rejected without accessing the bus (``open``), or a single trial
+#: write allowed after the cooldown (``half-open``).
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class Board:
+    '''Motor driver at a single I2C address, with a shadow copy of its
+    output state.
+
+    Writes of an output to the value it already has are skipped.  The state
+    of each output is unknown (``None``) until it is first written.
+
+    Failed I2C writes (``OSError``) are retried up to ``retries`` times,
+    after a short (blocking) backoff starting at ``backoff_us`` and doubling
+    with each retry.  After ``max_failures`` consecutive failed writes (i.e.,
+    with all retries failed), the circuit breaker of the board opens: writes
+    then raise ``OSError`` without accessing the bus, until ``cooldown_ms``
+    has elapsed and a trial write succeeds.
+
+    By default, each changed output is written with its own I2C transaction
+    (``digital_write()`` of the driver), so a write of several outputs costs
+    one transaction per changed output.  Writing all outputs in a single
+    transaction (``mask_write``, see :data:`DIRECTION_SET`) is opt-in: only
+    the per-output registers used by ``grove_i2c_motor`` are known to be
+    supported by the driver board firmware, and a board that ignores the
+    direction-set register would silently leave its outputs unchanged.
+    Enable it (``"pulse": {"mask_write": true}`` in ``config.json``) for
+    boards whose firmware is known to support it (the simulated board does,
+    see ``sim/modules/machine.py``).
+
+    .. versionadded:: 0.12.0
+    '''
+    def __init__(self, i2c, address, pins, mask_write=False, retries=2,
+                 backoff_us=500, max_failures=3, cooldown_ms=5000):
+        self.driver = gm.BaseDriver(i2c, address)
+        self.i2c = i2c
+        self.addr = address
+        self.pins = pins
+        self.outputs = [None] * len(pins)
+        #: If ``True``, write all outputs in a single I2C transaction to the
+        #: :data:`DIRECTION_SET` register (outputs with unknown state are
+        #: written as off).  Otherwise, each changed output is written using
+        #: ``digital_write()`` of the driver.
+        self.mask_write = mask_write
+        self._command = bytearray((DIRECTION_SET, 0, 0x01))
+        self.retries = retries
+        self.backoff_us = backoff_us
+        self.max_failures = max_failures
+        self.cooldown_ms = cooldown_ms
+        self.reset_health()
+
+    def reset_health(self):
+        '''Reset health counters and close circuit breaker.'''
+        self.state = CLOSED
+        #: Number of consecutive failed writes.
+        self.consecutive = 0
+        # Time circuit breaker opened (`utime.ticks_ms()`).
+        self._opened = 0
+        #: Number of successful writes.
+        self.writes = 0
+        #: Number of failed attempts (including retried attempts).
+        self.errors = 0
+        #: Number of retries.
+        self.retries_total = 0
+        #: Number of failed writes (all attempts failed).
+        self.failures = 0
+        #: Number of writes rejected by open circuit breaker.
+        self.rejected = 0
+        #: Total and maximum duration of successful writes, including
+        #: retries (us).
+        self.total_us = 0
+        self.max_us = 0
+
+    def health(self):
+        '''Return circuit breaker state and health counters.'''
+        return {'address': self.addr, 'state': self.state,
+                'writes': self.writes, 'errors': self.errors,
+                'retries': self.retries_total, 'failures': self.failures,
+                'rejected': self.rejected,
+                'mean_us': self.total_us // self.writes if self.writes else 0,
+                'max_us': self.max_us}
+
+    def _attempt(self, func, *args):
+        '''Call I2C write function, with retries and circuit breaker.'''
+        if self.state == OPEN:
+            if utime.ticks_diff(utime.ticks_ms(),
+                                self._opened) < self.cooldown_ms:
+                self.rejected += 1
+                raise OSError('board %d unavailable (circuit open)' %
+                              self.addr)
+            # Allow a single trial write.
+            self.state = HALF_OPEN
+        start = utime.ticks_us()
+        backoff_us = self.backoff_us
+        attempt = 0
+        while True:
+            try:
+                func(*args)
+                break
+            except OSError:
+                self.errors += 1
+                if attempt >= self.retries or self.state == HALF_OPEN:
+                    self.failures += 1
+                    self.consecutive += 1
+                    if (self.state == HALF_OPEN or
+                            self.consecutive >= self.max_failures):
+                        self.state = OPEN
+                        self._opened = utime.ticks_ms()
+                    raise
+            attempt += 1
+            self.retries_total += 1
+            utime.sleep_us(backoff_us)
+            backoff_us *= 2
+        duration = utime.ticks_diff(utime.ticks_us(), start)
+        self.writes += 1
+        self.total_us += duration
+        if duration > self.max_us:
+            self.max_us = duration
+        self.consecutive = 0
+        self.state = CLOSED
+
+    def digital_write(self, pin, value):
+        '''Write output (unless it already has the specified value).
+
+        Returns
+        -------
+        bool
+            ``True`` if the output was written.
+        '''
+        bit = 1 << self.pins.index(pin)
+        return self.write(bit, bit if value else 0) > 0
+
+    def write(self, mask, values):
+        '''Write multiple outputs.
+
+        Parameters
+        ----------
+        mask : int
+            Outputs to write (bit ``i`` selects output ``i``).
+        values : int
+            Output values (bit ``i`` is the value of output ``i``).
+
+        Returns
+        -------
+        int
+            Number of I2C writes (0 if no selected output changed).
+        '''
+        outputs = self.outputs
+        changed = 0
+        for i in range(len(outputs)):
+            bit = 1 << i
+            if mask & bit and outputs[i] != (1 if values & bit else 0):
+                changed |= bit
+        if not changed:
+            return 0
+        if self.mask_write:
+            state = 0
+            for i in range(len(outputs)):
+                bit = 1 << i
+                # Unchanged outputs keep their (shadow) value.
+                if values & bit if changed & bit else outputs[i]:
+                    state |= bit
+            self._command[1] = state
+            self._attempt(self.i2c.writeto, self.addr, self._command)
+            for i in range(len(outputs)):
+                outputs[i] = 1 if state & (1 << i) else 0
+            return 1
+        writes = 0
+        for i in range(len(outputs)):
+            bit = 1 << i
+            if changed & bit:
+                value = 1 if values & bit else 0
+                self._attempt(self.driver.digital_write, self.pins[i], value)
+                # Only update shadow state once write has succeeded.
+                outputs[i] = value
+                writes += 1
+        return writes
+
+    def invalidate(self):
+        '''Mark state of all outputs as unknown, e.g., after a board reset.'''
+        for i in range(len(self.outputs)):
+            self.outputs[i] = None
+
+
 class GroveMotorControl:
-    def __init__(self, i2c):
+    '''
+    .. versionchanged:: 0.12.0
+        Keep a :class:`Board` (driver and shadow output state) per I2C
+        address, instead of creating a driver for each call.
+
+        Add ``engine`` and ``tolerance_ms`` parameters.  If ``engine`` is
+        ``True`` (default), pumps run on a shared ``pulse.PulseEngine``
+        timeline.
+
+        Add ``timer`` parameter, to run pulse engine ticks from hardware timer
+        callbacks (see :mod:`pulse`).
+
+        Add ``board_options`` keyword arguments (e.g., ``mask_write``,
+        ``retries``), passed to each :class:`Board`.
+    '''
+    def __init__(self, i2c, engine=True, tolerance_ms=2, timer=None,
+                 **board_options):
         self.i2c = i2c
         self.pins = gm.IN1, gm.IN2, gm.IN3, gm.IN4
+        self.boards = {}
+        self.board_options = board_options
+        self.engine = (pulse.PulseEngine(self, tolerance_ms=tolerance_ms,
+                                         timer=timer) if engine else None)
+
+    def board(self, address):
+        '''Return (cached) :class:`Board` at I2C address.
+
+        .. versionadded:: 0.12.0
+        '''
+        board = self.boards.get(address)
+        if board is None:
+            board = Board(self.i2c, address, self.pins,
+                          **self.board_options)
+            self.boards[address] = board
+        return board
+
+    def state(self):
+        '''Return shadow output state of each board, without accessing I2C.
+
+        Returns
+        -------
+        list
+            One ``{'address': <address>, 'outputs': [...]}`` entry per board,
+            sorted by address; each output is ``0``, ``1`` or ``None``
+            (unknown).
+
+        .. versionadded:: 0.12.0
+        '''
+        return [{'address': address, 'outputs': self.boards[address].outputs}
+                for address in sorted(self.boards)]
+
+    def invalidate(self, address=None):
+        '''Mark output state of board (or all boards) as unknown.
+
+        The next write to each output is then sent to the board, even if
+        the shadow state matches.
+
+        .. versionadded:: 0.12.0
+        '''
+        boards = (self.boards.values() if address is None
+                  else [self.board(address)])
+        for board in boards:
+            board.invalidate()
+
+    def health(self):
+        '''Return circuit breaker state and health counters of each board.
+
+        .. versionadded:: 0.12.0
+        '''
+        return [self.boards[address].health()
+                for address in sorted(self.boards)]
+
+    def reset_health(self, address=None):
+        '''Reset health counters and close circuit breaker of board (or all
+        boards).
+
+        .. versionadded:: 0.12.0
+        '''
+        boards = (self.boards.values() if address is None
+                  else [self.board(address)])
+        for board in boards:
+            board.reset_health()
 
     async def pump(self, address, index, pulses, on_ms=50, off_ms=150):
         '''
@@ -24,14 +296,41 @@ class GroveMotorControl:
             Duration for which output should be turned **on**, in milliseconds.
         off_ms : int, optional
             Duration for which output should be turned **off**, in milliseconds.
+
+
+        .. versionchanged:: 0.12.0
+            Tag published events as ``'<address>-<index + 1>'``, e.g.,
+            ``'16-3'`` for ``address=16, index=2``.
+
+            Write through cached :class:`Board`.
+
+            Run on :attr:`engine` (if enabled).
+
+            Return edge timing of run, with at least the ``late_edges`` and
+            ``late_max_ms`` keys (see ``pump.pump()`` and
+            ``pulse.Channel.stats()``).
         '''
-        result = await pump.pump(self.i2c, address, self.pins[index], pulses,
-                                 on_ms=on_ms, off_ms=off_ms)
-        gc.collect()
+        tag = '%d-%d' % (address, index + 1)
+        if self.engine is not None:
+            result = await self.engine.pump(address, index, pulses,
+                                            on_ms=on_ms, off_ms=off_ms,
+                                            tag=tag)
+        else:
+            result = await pump.pump(self.i2c, address, self.pins[index],
+                                     pulses, on_ms=on_ms, off_ms=off_ms,
+                                     tag=tag, driver=self.board(address))
+        gcpolicy.collect()
         return result
 
     def set_direction(self, address, index, value):
-        driver = gm.BaseDriver(self.i2c, address)
-        driver.digital_write(self.pins[index], value)
-        del driver
-        gc.collect()
+        '''
+        .. versionchanged:: 0.12.0
+            Publish ``motor.direction`` event (see :mod:`events`).
+
+            Write through cached :class:`Board`; the write is skipped if the
+            output already has the specified value.
+        '''
+        self.board(address).digital_write(self.pins[index], value)
+        events.emit('motor.direction', {'tag': '%d-%d' % (address, index + 1),
+                                        'value': value})
+        gcpolicy.collect()
@@ -1,6 +1,6 @@
-import gc
 import os
 
+import gcpolicy
 import util
 
 from wifimgr import get_connection
@@ -42,7 +42,7 @@ def fetch_update(API_TOKEN, tag=None, output_dir='/ota-next', cache=False,
             raise
     with open(output_dir + '/VERSION', 'w') as output:
         output.write(tag + '\n')
-    gc.collect()
+    gcpolicy.collect()
     return downloaded
 
 
@@ -58,7 +58,7 @@ def swap(previous, current, next_):
             if util.exists(next_ + path):
                 os.rename(next_ + path, current + path)
                 print('updated: `%s`' % (current + path))
-            gc.collect()
+            gcpolicy.collect()
     finally:
         if util.exists(next_):
             util.rmtree(next_)
@@ -0,0 +1,134 @@
+'''
+Interpreter for compiled pulse programs.
+
+A program is a sequence of steps, each encoded as two 16-bit words (e.g., an
+``array('H')``, or its little-endian bytes):
+
+ - word 0: ``address << 8 | mask << 4 | values`` -- set the outputs selected
+   by bit mask ``mask`` (bit ``i`` is output ``i``) of the board at I2C
+   address ``address`` to the corresponding bits of ``values``.  A step with
+   ``mask == 0`` only waits.
+ - word 1: duration until the next step; in milliseconds, or in
+   microseconds if bit 15 (``0x8000``) is set.
+
+Step times are absolute deadlines computed from the start of the program.
+The interpreter sleeps on the event loop until just before each step and
+busy-waits the remainder, so steps may be microseconds apart.  While a
+program runs, its task has high priority on the event loop (see
+``EventLoop.set_priority()``).
+
+The busy-wait blocks the event loop: no other task runs (and no RPC request
+is read) for up to :data:`SPIN_US` before each step, and for the whole of any
+sequence of steps less than :data:`SPIN_US` apart.
+
+Programs are compiled on the host (see ``rpc_host.Program``) and run using the
+``program.run`` command.
+
+.. versionadded:: 0.12.0
+'''
+from array import array
+
+import uasyncio as asyncio
+import utime
+
+import events
+
+
+#: Duration flag: step duration is in microseconds.
+US = 0x8000
+#: Steps due within this many microseconds are busy-waited for (instead of
+#: sleeping on the event loop), blocking all other tasks meanwhile.
+SPIN_US = 2000
+
+
+class Interpreter:
+    '''
+    Parameters
+    ----------
+    motor_ctrl : motor.GroveMotorControl
+        Provides the (cached) board at each I2C address.
+    '''
+    def __init__(self, motor_ctrl):
+        self.motor_ctrl = motor_ctrl
+
+    async def run(self, steps, tag=None):
+        '''Run program.
+
+        If the program is interrupted (e.g., cancelled), all outputs it has
+        turned on are turned off.
+
+        Parameters
+        ----------
+        steps : array or bytes or list
+            Program words (see module docstring).
+        tag : object, optional
+            Identifier included in published ``program.start`` and
+            ``program.done`` events.
+
+        Returns
+        -------
+        dict
+            Number of steps, and total and maximum delay of steps after their
+            deadline (in microseconds).
+        '''
+        if not isinstance(steps, array):
+            steps = array('H', steps)
+        if len(steps) % 2:
+            raise ValueError('program must have an even number of words')
+        if events.active('program.start'):
+            await events.publish('program.start',
+                                 {'tag': tag, 'steps': len(steps) // 2})
+        boards = {}
+        # Outputs turned on by program, by board.
+        high = {}
+        late_total_us = 0
+        late_max_us = 0
+        complete = False
+        loop = asyncio.get_event_loop()
+        task = loop.cur_task
+        high_priority = loop.set_priority(task)
+        deadline = utime.ticks_us()
+        try:
+            for i in range(0, len(steps) + 2, 2):
+                delay = utime.ticks_diff(deadline, utime.ticks_us())
+                if delay > SPIN_US:
+                    await asyncio.sleep_ms((delay - SPIN_US) // 1000 + 1)
+                # Block the loop (even best-effort tasks do not run) until
+                # the step is due.
+                while utime.ticks_diff(deadline, utime.ticks_us()) > 0:
+                    pass
+                late = utime.ticks_diff(utime.ticks_us(), deadline)
+                late_total_us += late
+                if late > late_max_us:
+                    late_max_us = late
+                if i == len(steps):
+                    # Duration of last step has elapsed.
+                    break
+                word = steps[i]
+                mask = (word >> 4) & 0xf
+                if mask:
+                    values = word & 0xf
+                    board = boards.get(word >> 8)
+                    if board is None:
+                        board = self.motor_ctrl.board(word >> 8)
+                        boards[word >> 8] = board
+                    board.write(mask, values)
+                    high[board] = ((high.get(board, 0) & ~mask) |
+                                   (values & mask))
+                duration = steps[i + 1]
+                deadline = utime.ticks_add(deadline,
+                                           duration & ~US if duration & US
+                                           else duration * 1000)
+            complete = True
+        finally:
+            loop.set_priority(task, high_priority)
+            if not complete:
+                for board, mask in high.items():
+                    if mask:
+                        board.write(mask, 0)
+        result = {'steps': len(steps) // 2, 'late_total_us': late_total_us,
+                  'late_max_us': late_max_us}
+        if events.active('program.done'):
+            await events.publish('program.done', {'tag': tag,
+                                                  'result': result})
+        return result
@@ -0,0 +1,343 @@
+'''
+Pulse engine driving the pump outputs of all boards from a single timeline.
+
+Each pump run is a :class:`Channel`.  Edges of all channels that are due
+within ``tolerance_ms`` of each other are applied in the same tick, using a
+single ``motor.Board.write()`` per board for all of its outputs.  That is a
+single I2C transaction per board if ``mask_write`` is enabled, and otherwise
+one per changed output (see ``motor.Board``).
+Edges are scheduled relative to the deadline of the previous edge (not to
+the time it was actually applied), so channels started together stay in
+step.
+
+Ticks are either run by a task on the ``uasyncio`` event loop (default), or,
+if a ``timer`` is given, from the callback of a one-shot hardware timer via
+``micropython.schedule()``.  In timer mode, edges are not delayed by other
+tasks (e.g., decoding a long RPC request); the timer is armed to fire just
+before the next edge, and the callback waits out the remaining (sub-ms) time.
+Any object with the ``init(mode=, period=, callback=)`` and ``deinit()``
+methods of ``machine.Timer`` may be used as the timer.  In loop mode, the
+runner is a high-priority task (see ``EventLoop.create_task()``), so it runs
+before any other runnable task once an edge is due.  A high-priority task
+that yields without delay runs again before any best-effort task: with
+``tolerance_ms`` 0, the runner spins (yielding) for the last fraction of a
+millisecond before each edge, and best-effort tasks (e.g., RPC readers) do
+not run meanwhile, for up to 1 ms per edge.  With ``tolerance_ms`` of 1 or
+more, edges due within the current millisecond are applied at once instead.
+
+Example ``config.json`` entry (``timer`` is the hardware timer id; omit it to
+run ticks on the event loop):
+
+    "pulse": {"enabled": true, "tolerance_ms": 2, "mask_write": false,
+              "timer": 0}
+
+.. versionadded:: 0.12.0
+'''
+import micropython
+import uasyncio as asyncio
+import utime
+
+import events
+
+
+#: In timer mode, the timer callback busy-waits for edges due within this
+#: many microseconds (instead of arming the timer again).
+SPIN_US = 1000
+
+
+class Channel:
+    '''Pulse train on a single board output.
+
+    The edge table of the pulse train (the value and duration of each of the
+    two edges of a pulse) is computed up front.
+    '''
+    def __init__(self, board, index, pulses, on_ms, off_ms, tag, start_us):
+        self.board = board
+        self.bit = 1 << index
+        self.pulses = pulses
+        self.durations_us = (on_ms * 1000, off_ms * 1000)
+        self.tag = tag
+        #: Number of completed pulses.
+        self.count = 0
+        self.value = 0
+        #: Time of next edge (``utime.ticks_us()``).
+        self.deadline = start_us
+        self.done = False
+        self.error = None
+        #: Set once the run is complete or has failed (see :attr:`error`).
+        self.finished = asyncio.Event()
+        #: Number of edges applied.
+        self.edges = 0
+        #: Number of edges applied 1 ms or more after their deadline.
+        self.late_edges = 0
+        #: Total and maximum delay of edges after their deadline (us).
+        self.late_total_us = 0
+        self.late_max_us = 0
+
+    def stats(self):
+        '''Return edge count and timing of run.
+
+        Includes the keys returned by ``pump.pump()`` (``late_edges`` and
+        ``late_max_ms``).
+        '''
+        return {'edges': self.edges, 'late_edges': self.late_edges,
+                'late_max_ms': self.late_max_us // 1000,
+                'late_total_us': self.late_total_us,
+                'late_max_us': self.late_max_us}
+
+    def advance(self):
+        '''Move to next edge.
+
+        Returns
+        -------
+        int or None
+            New output value, or ``None`` if the run is complete (i.e., the
+            off period of the last pulse has elapsed).
+        '''
+        if self.value:
+            self.value = 0
+            self.count += 1
+            self.deadline = utime.ticks_add(self.deadline,
+                                            self.durations_us[1])
+            return 0
+        elif self.count >= self.pulses:
+            self.done = True
+            self.finished.set()
+            return None
+        self.value = 1
+        self.deadline = utime.ticks_add(self.deadline, self.durations_us[0])
+        return 1
+
+
+class PulseEngine:
+    '''
+    Parameters
+    ----------
+    motor_ctrl : motor.GroveMotorControl
+        Provides the (cached) board at each I2C address.
+    tolerance_ms : int, optional
+        Edges due within this many milliseconds of a tick are applied in that
+        tick.
+    timer : machine.Timer, optional
+        If specified, run ticks from callbacks of this timer, instead of from
+        a task on the event loop.
+    '''
+    def __init__(self, motor_ctrl, tolerance_ms=2, timer=None):
+        self.motor_ctrl = motor_ctrl
+        self.tolerance_ms = tolerance_ms
+        self.timer = timer
+        self.channels = []
+        # Each time the timeline must wake up earlier than planned, a new
+        # runner is started; runners of previous generations exit when they
+        # next wake up.
+        self._generation = 0
+        # Wake-up time of current runner (`None` if not running).
+        self._wake = None
+        # Set while channels are modified outside of a tick; timer callbacks
+        # are deferred meanwhile.
+        self._busy = False
+        # Allocate bound methods once (they are passed from timer interrupt).
+        self._timer_cb = self._on_timer
+        self._scheduled_cb = self._on_scheduled
+        self.reset()
+
+    def reset(self):
+        '''Reset timing statistics.'''
+        #: Number of edges applied.
+        self.edges = 0
+        #: Number of ticks (each applying one or more edges).
+        self.ticks = 0
+        #: Number of I2C writes.
+        self.writes = 0
+        #: Number of failed board writes.
+        self.errors = 0
+        #: Number of deferred timer callbacks.
+        self.deferred = 0
+        #: Total and maximum delay of edges after their deadline (us).
+        self.late_total_us = 0
+        self.late_max_us = 0
+        #: Maximum advance of edges merged into an earlier tick (us).
+        self.early_max_us = 0
+
+    def stats(self):
+        '''Return achieved edge timing (jitter) and write counts.'''
+        return {'mode': 'loop' if self.timer is None else 'timer',
+                'channels': len(self.channels),
+                'tolerance_ms': self.tolerance_ms, 'edges': self.edges,
+                'ticks': self.ticks, 'writes': self.writes,
+                'errors': self.errors, 'deferred': self.deferred,
+                'late_total_us': self.late_total_us,
+                'late_mean_us': (self.late_total_us // self.edges
+                                 if self.edges else 0),
+                'late_max_us': self.late_max_us,
+                'early_max_us': self.early_max_us}
+
+    async def pump(self, address, index, pulses, on_ms=50, off_ms=150,
+                   tag=None):
+        '''Run pulse train on output and wait until it is complete.
+
+        Parameters are the same as ``motor.GroveMotorControl.pump()``.
+        Publishes the same events as ``pump.pump()``.
+
+        Returns
+        -------
+        dict
+            Edge count and timing of run (see :meth:`Channel.stats`), also
+            included in the ``pump.done`` event.
+        '''
+        board = self.motor_ctrl.board(address)
+        if events.active('pump.start'):
+            await events.publish('pump.start', {'tag': tag, 'pulses': pulses})
+        channel = Channel(board, index, pulses, on_ms, off_ms, tag,
+                          utime.ticks_us())
+        self.channels.append(channel)
+        if self.timer is not None:
+            self._arm()
+        elif (self._wake is None or
+                utime.ticks_diff(channel.deadline, self._wake) < 0):
+            self._generation += 1
+            self._wake = channel.deadline
+            asyncio.get_event_loop().create_task(self._run(self._generation),
+                                                 high=True)
+        try:
+            await channel.finished.wait()
+        finally:
+            if not channel.done:
+                # Interrupted (e.g., cancelled); make sure output is off.
+                self._busy = True
+                try:
+                    self.channels.remove(channel)
+                    board.write(channel.bit, 0)
+                finally:
+                    self._busy = False
+        if channel.error is not None:
+            raise channel.error
+        result = channel.stats()
+        if events.active('pump.done'):
+            data = {'tag': tag, 'pulses': pulses}
+            data.update(result)
+            await events.publish('pump.done', data)
+        return result
+
+    def _next_deadline(self):
+        first = self.channels[0].deadline
+        for channel in self.channels:
+            if utime.ticks_diff(channel.deadline, first) < 0:
+                first = channel.deadline
+        return first
+
+    async def _run(self, generation):
+        try:
+            while self.channels and generation == self._generation:
+                first = self._next_deadline()
+                delay = utime.ticks_diff(first, utime.ticks_us())
+                if delay >= 1000:
+                    self._wake = first
+                    await asyncio.sleep_ms(delay // 1000)
+                    continue
+                elif delay > self.tolerance_ms * 1000:
+                    # Less than 1 ms to go; spin until edge is due (only
+                    # other high-priority tasks run meanwhile).
+                    await asyncio.sleep_ms(0)
+                    continue
+                self._tick(utime.ticks_us())
+                # Let other high-priority tasks run (e.g., `pump.pump()`),
+                # even if more edges are overdue.
+                await asyncio.sleep_ms(0)
+        finally:
+            if generation == self._generation:
+                self._wake = None
+
+    def _arm(self, delay_ms=None):
+        '''Arm timer to fire before next edge (timer mode).'''
+        if delay_ms is None:
+            if not self.channels:
+                self.timer.deinit()
+                return
+            delay_ms = utime.ticks_diff(self._next_deadline(),
+                                        utime.ticks_us()) // 1000
+            if delay_ms <= 0:
+                # Edge is due (e.g., run just started); apply it now, rather
+                # than when the timer fires (at least 1 ms late).  Not called
+                # from interrupt context.
+                self._on_scheduled(None)
+                return
+        self.timer.init(mode=self.timer.ONE_SHOT,
+                        period=delay_ms if delay_ms > 0 else 1,
+                        callback=self._timer_cb)
+
+    def _on_timer(self, timer):
+        # May run in interrupt context: do not allocate.
+        try:
+            micropython.schedule(self._scheduled_cb, None)
+        except RuntimeError:
+            # Schedule queue is full; try again.
+            self.deferred += 1
+            self._arm(1)
+
+    def _on_scheduled(self, arg):
+        if self._busy:
+            self.deferred += 1
+            self._arm(1)
+            return
+        while self.channels:
+            first = self._next_deadline()
+            delay = utime.ticks_diff(first, utime.ticks_us())
+            if delay > SPIN_US:
+                break
+            while delay > 0:
+                delay = utime.ticks_diff(first, utime.ticks_us())
+            self._tick(utime.ticks_us())
+        self._arm()
+
+    def _tick(self, now):
+        '''Apply all edges due within tolerance of ``now`` (``ticks_us()``).
+        '''
+        tolerance_us = self.tolerance_ms * 1000
+        writes = {}
+        finished = False
+        for channel in self.channels:
+            late = utime.ticks_diff(now, channel.deadline)
+            if late < -tolerance_us:
+                continue
+            value = channel.advance()
+            if value is None:
+                finished = True
+                continue
+            self.edges += 1
+            channel.edges += 1
+            if late > 0:
+                self.late_total_us += late
+                if late > self.late_max_us:
+                    self.late_max_us = late
+                channel.late_total_us += late
+                if late > channel.late_max_us:
+                    channel.late_max_us = late
+                if late >= 1000:
+                    channel.late_edges += 1
+            elif -late > self.early_max_us:
+                self.early_max_us = -late
+            mask, values = writes.get(channel.board, (0, 0))
+            writes[channel.board] = (mask | channel.bit,
+                                     values | (channel.bit if value else 0))
+            if not value:
+                events.emit('pump.pulse', {'tag': channel.tag,
+                                           'pulse': channel.count,
+                                           'pulses': channel.pulses})
+        for board, (mask, values) in writes.items():
+            try:
+                self.writes += board.write(mask, values)
+            except Exception as exception:
+                self.errors += 1
+                # Abort all runs on board.
+                for channel in self.channels:
+                    if channel.board is board:
+                        channel.error = exception
+                        channel.done = True
+                        channel.finished.set()
+                        finished = True
+        if writes:
+            self.ticks += 1
+        if finished:
+            self.channels = [channel for channel in self.channels
+                             if not channel.done]
@@ -1,10 +1,12 @@
-import gc
-
 import grove_i2c_motor as gm
 import uasyncio as asyncio
+import utime
+
+import events
 
 
-async def pump(i2c, i2c_address, pin, pulses, on_ms=50, off_ms=150):
+async def pump(i2c, i2c_address, pin, pulses, on_ms=50, off_ms=150,
+               tag=None, driver=None):
     '''
     Parameters
     ----------
@@ -20,13 +22,77 @@ async def pump(i2c, i2c_address, pin, pulses, on_ms=50, off_ms=150):
         Duration for which output should be turned **on**, in milliseconds.
     off_ms : int, optional
         Duration for which output should be turned **off**, in milliseconds.
+    tag : object, optional
+        Identifier included in published events.
+    driver : optional
+        Driver to write outputs through (e.g., a cached ``motor.Board``).
+        By default, a ``grove_i2c_motor.BaseDriver`` is created for
+        ``i2c_address``.
+
+
+    .. versionchanged:: 0.12.0
+        Publish ``pump.start``, ``pump.pulse`` (after each pulse) and
+        ``pump.done`` events (see :mod:`events`).
+
+        Turn output off if pumping is interrupted (e.g., cancelled).  If
+        turning output off fails, the original error is raised.
+
+        Add ``driver`` parameter.
+
+        Schedule each edge against an absolute deadline, computed from the
+        start time, so that write and scheduling latency does not accumulate
+        over pulses.  Edges applied after their deadline are counted and
+        returned (and included in the ``pump.done`` event) as
+        ``{'late_edges': <count>, 'late_max_ms': <max. delay>}``.  Do not
+        print each edge.
+
+        Run at high priority on the event loop (see
+        ``EventLoop.set_priority()``), so that edges are not delayed by
+        other runnable tasks.
     '''
-    driver = gm.BaseDriver(i2c, i2c_address)
+    if driver is None:
+        driver = gm.BaseDriver(i2c, i2c_address)
+    if events.active('pump.start'):
+        await events.publish('pump.start', {'tag': tag, 'pulses': pulses})
     await asyncio.sleep_ms(0)
-    for i in range(pulses):
-        print('pump %s (%d/%d) HI' % (driver.addr, i + 1, pulses))
-        driver.digital_write(pin, 1)
-        await asyncio.sleep_ms(on_ms)
-        print('pump %s (%d/%d) LOW' % (driver.addr, i + 1, pulses))
+    late_edges = 0
+    late_max_ms = 0
+    loop = asyncio.get_event_loop()
+    task = loop.cur_task
+    high = loop.set_priority(task)
+    deadline = utime.ticks_ms()
+    try:
+        for i in range(pulses):
+            for value, duration in ((1, on_ms), (0, off_ms)):
+                late = utime.ticks_diff(utime.ticks_ms(), deadline)
+                if late > 0:
+                    late_edges += 1
+                    if late > late_max_ms:
+                        late_max_ms = late
+                driver.digital_write(pin, value)
+                if not value and events.active('pump.pulse'):
+                    await events.publish('pump.pulse', {'tag': tag,
+                                                        'pulse': i + 1,
+                                                        'pulses': pulses})
+                deadline = utime.ticks_add(deadline, duration)
+                delay = utime.ticks_diff(deadline, utime.ticks_ms())
+                await asyncio.sleep_ms(delay if delay > 0 else 0)
+    except BaseException:
+        # Make sure output is off, e.g., if task is cancelled mid-pulse.
+        # A failing write must not replace the original error.
+        try:
+            driver.digital_write(pin, 0)
+        except Exception as exception:
+            print('error turning off pin %s of pump `%s`: %s' %
+                  (pin, tag, exception))
+        raise
+    else:
         driver.digital_write(pin, 0)
-        await asyncio.sleep_ms(off_ms)
+    finally:
+        loop.set_priority(task, high)
+    result = {'late_edges': late_edges, 'late_max_ms': late_max_ms}
+    if events.active('pump.done'):
+        await events.publish('pump.done', {'tag': tag, 'pulses': pulses,
+                                           'late_edges': late_edges,
+                                           'late_max_ms': late_max_ms})
+    return result
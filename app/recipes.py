@@ -0,0 +1,151 @@
+'''
+Named recipes (e.g., set valves, then pump), stored in flash and run on the
+device as a single task.
+
+A recipe is a dictionary of the form:
+
+    {"params": {"pulses": 20, "off_ms": 850},
+     "steps": [{"command": "motor_ctrl.set_direction", "args": [16, 1, 1]},
+               {"command": "motor_ctrl.pump", "args": [16, 2, "$pulses"],
+                "kwargs": {"on_ms": 150, "off_ms": "$off_ms"},
+                "async": true}],
+     "finally": [{"command": "motor_ctrl.set_direction",
+                  "args": [16, 1, 0]}]}
+
+Each step is a call in the same form as an RPC request (see ``rpc._call()``),
+and ``"sleep_ms"`` waits for the number of milliseconds given as argument.
+String values of the form ``"$<name>"`` are replaced by the parameter
+``<name>``; ``params`` holds the default parameter values.  Steps in
+``finally`` (optional) are run after the recipe completes, fails or is
+cancelled.
+
+:func:`run` returns a task handle (see :mod:`tasks`).  Progress is published
+as ``recipe.start``, ``recipe.step`` (before each step) and ``recipe.done``
+(or ``recipe.error``) events (see :mod:`events`).
+
+.. versionadded:: 0.12.0
+'''
+import json
+import os
+
+import uasyncio as asyncio
+
+import events
+import rpc
+import tasks
+import util
+
+
+#: Directory containing recipes, one ``<name>.json`` file per recipe.
+DIR = 'recipes'
+
+
+def _path(name):
+    if not name or '/' in name:
+        raise ValueError('invalid recipe name: `%s`' % name)
+    return '%s/%s.json' % (DIR, name)
+
+
+def _validate(recipe):
+    if not isinstance(recipe, dict) or not isinstance(recipe.get('steps'),
+                                                      list):
+        raise ValueError('recipe must be a dictionary with a list of `steps`')
+    for step in recipe['steps'] + recipe.get('finally', []):
+        if not isinstance(step, dict) or 'command' not in step:
+            raise ValueError('each step must be a dictionary with a '
+                             '`command`')
+
+
+def save(name, recipe):
+    '''Validate recipe and store it in flash.'''
+    _validate(recipe)
+    if not util.exists(DIR):
+        os.mkdir(DIR)
+    with open(_path(name), 'w') as output:
+        json.dump(recipe, output)
+
+
+def load(name):
+    '''Return stored recipe.'''
+    path = _path(name)
+    if not util.exists(path):
+        raise KeyError('unknown recipe: `%s`' % name)
+    with open(path, 'r') as input_:
+        return json.load(input_)
+
+
+def delete(name):
+    os.remove(_path(name))
+
+
+def names():
+    '''Return names of stored recipes.'''
+    if not util.exists(DIR):
+        return []
+    return sorted(filename[:-5] for filename in os.listdir(DIR)
+                  if filename.endswith('.json'))
+
+
+def _substitute(value, params):
+    if isinstance(value, str) and value.startswith('$'):
+        if value[1:] not in params:
+            raise KeyError('missing recipe parameter: `%s`' % value[1:])
+        return params[value[1:]]
+    elif isinstance(value, list):
+        return [_substitute(item, params) for item in value]
+    elif isinstance(value, dict):
+        return {key: _substitute(item, params) for key, item in value.items()}
+    return value
+
+
+async def _step(step):
+    if step['command'] == 'sleep_ms':
+        await asyncio.sleep_ms(step['args'][0])
+    else:
+        await rpc._call(step)
+
+
+async def _run(name, recipe, params):
+    steps = recipe['steps']
+    events.emit('recipe.start', {'name': name, 'steps': len(steps)})
+    try:
+        for i, step in enumerate(steps):
+            events.emit('recipe.step', {'name': name, 'step': i + 1,
+                                        'steps': len(steps),
+                                        'command': step['command']})
+            await _step(_substitute(step, params))
+    except Exception as exception:
+        events.emit('recipe.error', {'name': name, 'error': str(exception)})
+        raise
+    finally:
+        for step in recipe.get('finally', []):
+            try:
+                await _step(_substitute(step, params))
+            except Exception as exception:
+                print('error in `finally` step of recipe `%s`: %s' %
+                      (name, exception))
+    events.emit('recipe.done', {'name': name, 'steps': len(steps)})
+
+
+def run(name, params=None):
+    '''Run stored recipe as a task.
+
+    Parameters
+    ----------
+    name : str
+        Recipe name.
+    params : dict, optional
+        Parameter values, overriding the defaults of the recipe.
+
+    Returns
+    -------
+    int
+        Task handle (see :mod:`tasks`).
+    '''
+    recipe = load(name)
+    values = recipe.get('params', {})
+    if params:
+        values.update(params)
+    # Check parameters before starting.
+    _substitute(recipe['steps'] + recipe.get('finally', []), values)
+    return tasks.create(_run(name, recipe, values))
@@ -1,44 +1,381 @@
-import gc
-import json
-
 import uasyncio as asyncio
 
+import events
+import framing
+import gcpolicy
+import tasks
+
+
+class Registry:
+    '''Commands that may be called by name or by numeric opcode.
+
+    Opcodes are assigned in order of registration, starting at 0.
+
+    .. versionadded:: 0.12.0
+    '''
+    def __init__(self):
+        self.opcodes = {}
+        self.functions = []
+
+    def register(self, name, func):
+        '''Register callable under specified name.
+
+        Parameters
+        ----------
+        name : str
+            Command name, e.g., ``'motor_ctrl.pump'``.
+        func : callable
+            Function (or bound method) to call.
+
+        Returns
+        -------
+        int
+            Opcode assigned to command.
+        '''
+        opcode = self.opcodes.get(name)
+        if opcode is None:
+            opcode = len(self.functions)
+            self.opcodes[name] = opcode
+            self.functions.append(func)
+        else:
+            self.functions[opcode] = func
+        return opcode
+
+    def lookup(self, command):
+        '''Return function registered under opcode or name (or ``None``).'''
+        if isinstance(command, int):
+            if 0 <= command < len(self.functions):
+                return self.functions[command]
+            return None
+        opcode = self.opcodes.get(command)
+        return None if opcode is None else self.functions[opcode]
+
+    def describe(self):
+        '''Return mapping from each command name to its opcode.'''
+        return self.opcodes
+
+
+#: Registered commands, shared by all connections.
+REGISTRY = Registry()
+REGISTRY.register('__status__', tasks.status)
+REGISTRY.register('__cancel__', tasks.cancel)
+REGISTRY.register('__join__', tasks.join)
+#: Namespace used to evaluate commands on the ``eval`` slow path.
+CONTEXT = {}
+#: Size of receive buffer of each connection; limits request size (bytes).
+BUFFER_SIZE = 4096
+#: Default size of output buffer of TCP connections (bytes); see
+#: :meth:`Connection.send`.
+OUTPUT_BUFFER_SIZE = 1024
+# Number of command tasks in flight (across all connections).
+_inflight = 0
+
+
+class Connection:
+    '''State of a single RPC connection.
+
+    .. versionadded:: 0.12.0
+    '''
+    def __init__(self, areader, awriter, buffer_size=BUFFER_SIZE):
+        self.areader = areader
+        self.awriter = awriter
+        self.framing = framing.JsonLines
+        # Requests are read into (and decoded from) this buffer.
+        self.buf = bytearray(buffer_size)
+        # Serializes writes of messages sent by concurrent tasks (e.g.,
+        # responses and events).
+        self.lock = asyncio.Lock()
+        self.subscriber = events.Subscriber(self.send)
+        #: Set once the connection is lost (or :func:`rpc` has returned);
+        #: messages sent afterwards are dropped.
+        self.closed = False
+
+    async def send(self, message, framing_=None):
+        '''Write message (e.g., a response or an event).
+
+        If the writer has an output buffer (see
+        ``StreamWriter.set_buffer()``), the message is serialized directly
+        into the buffer, to be written out together with any other messages
+        sent before the buffer is flushed.
+
+        Messages sent concurrently (e.g., by a task and an event publisher)
+        are written one at a time, so their frames never interleave.
+
+        If the write fails (e.g., the client disconnected while a command
+        was in flight), the connection is marked :attr:`closed` and the
+        message is dropped, as are all messages sent afterwards.
+
+        Parameters
+        ----------
+        message : dict
+            Message to write.
+        framing_ : optional
+            Framing to use (default: current framing of connection).
+        '''
+        if framing_ is None:
+            framing_ = self.framing
+        async with self.lock:
+            if self.closed:
+                return
+            try:
+                if self.awriter.obuf is not None:
+                    try:
+                        await self.awriter.awrite_into(framing_.dump_into,
+                                                       message)
+                        return
+                    except IndexError:
+                        # Message does not fit in output buffer; write
+                        # through.
+                        pass
+                await self.awriter.awrite(framing_.dumps(message))
+            except OSError:
+                # Connection lost.
+                self.closed = True
+
+
+async def _reply(connection, framing_, response, request_id=None):
+    '''Write response, tagged with the request ``id`` (if one was given).
+
+    .. versionadded:: 0.12.0
+    '''
+    if request_id is not None:
+        response['id'] = request_id
+    await connection.send(response, framing_)
+    gcpolicy.collect()
+
+
+def _idle():
+    '''Notify garbage collection policy if no commands are in flight.
+
+    .. versionadded:: 0.12.0
+    '''
+    if not _inflight:
+        gcpolicy.idle()
+
+
+async def _call(message):
+    '''Execute a single command and return its result.
+
+    The command is either an opcode or the name of a command registered in
+    :data:`REGISTRY`.  If the message has ``eval`` set, any other command
+    string is evaluated as an expression in :data:`CONTEXT`.
+
+    .. versionadded:: 0.12.0
+    '''
+    command = message.get('command')
+    async_ = message.get('async')
+    func = REGISTRY.lookup(command)
+    if func is None:
+        if not message.get('eval'):
+            raise LookupError('unknown command: `%s`' % command)
+        # Slow path: evaluate command expression.
+        func = eval(command, CONTEXT)
+    result = func(*message.get('args', []), **message.get('kwargs', {}))
+    if async_ == 'task':
+        # create asyncio task and return its handle (see `tasks` module)
+        result = tasks.create(result)
+    elif async_:
+        # wait for async result
+        result = await result
+    return result
+
+
+async def _handle(connection, message):
+    '''Execute a single command and write its response.
+
+    Each command is run as its own task so that a slow awaited call does not
+    stall the reader loop; replies may therefore be written out of order.
+
+    .. versionadded:: 0.12.0
+    '''
+    global _inflight
+    _inflight += 1
+    try:
+        try:
+            response = {'result': await _call(message)}
+        except Exception as exception:
+            response = {'error': str(exception),
+                        'command': message.get('command')}
+        await _reply(connection, connection.framing, response,
+                     message.get('id'))
+    finally:
+        _inflight -= 1
+        _idle()
+
+
+async def _handle_batch(connection, message):
+    '''Execute list of calls in order and write a single response.
+
+    The ``result`` of the response is a list containing one response per
+    executed call.  If ``stop_on_error`` is set (default), calls following
+    the first failed call are skipped.
+
+    .. versionadded:: 0.12.0
+    '''
+    global _inflight
+    _inflight += 1
+    try:
+        stop_on_error = message.get('stop_on_error', True)
+        results = []
+        for call in message.get('calls', []):
+            try:
+                results.append({'result': await _call(call)})
+            except Exception as exception:
+                results.append({'error': str(exception),
+                                'command': call.get('command')})
+                if stop_on_error:
+                    break
+        await _reply(connection, connection.framing, {'result': results},
+                     message.get('id'))
+    finally:
+        _inflight -= 1
+        _idle()
+
 
 async def rpc(areader, awriter, context=None):
+    '''
+    .. versionchanged:: 0.12.0
+        Run each command as a separate task.  Requests may include an ``id``,
+        which is copied to the corresponding response.
+
+        Add ``__framing__`` command to select message framing (see
+        :mod:`framing`).
+
+        Add ``__describe__`` command, which returns the opcode of each
+        command in :data:`REGISTRY`.  Context is added to :data:`CONTEXT`
+        instead of the module globals.
+
+        Add ``__batch__`` command to execute a list of calls (see
+        :func:`_handle_batch`).
+
+        Add ``__subscribe__`` command to select events pushed to the
+        connection (see :mod:`events`).
+
+        Stop at end of stream, or if the connection is lost (replies to
+        commands still in flight are then dropped).
+
+        Read requests into a preallocated buffer (see :data:`BUFFER_SIZE`).
+
+        Return task handle for ``async: 'task'`` calls, which may be passed to
+        ``__status__``, ``__cancel__`` and ``__join__`` commands (see
+        :mod:`tasks`).
+
+        Serialize responses and events directly into the output buffer of
+        ``awriter``, if it has one (see :meth:`Connection.send`).
+
+        Add ``__loopstats__`` command, which returns event loop queue sizes
+        (``queues``) and, if enabled, instrumentation (loop lag and step time
+        histograms, per-task step time and queue high-water marks).  An
+        optional argument (``'enable'``, ``'disable'`` or ``'reset'``) is
+        applied first.
+    '''
     if context is not None:
-        globals().update(context)
+        CONTEXT.update(context)
         print('Context:\n%s' % sorted(context.keys()))
     loop = asyncio.get_event_loop()
+    connection = Connection(areader, awriter)
     stopped = False
     while not stopped:
-        message_str = await areader.readline()
+        request_id = None
+        # Reply using framing of request, even if the framing is changed.
+        framing_ = connection.framing
         try:
-            message = json.loads(message_str)
+            message = await framing_.read(areader, connection.buf)
+            if message is None:
+                # End of stream.
+                break
+            request_id = message.get('id')
             command = message.get('command')
-            async_ = message.get('async')
             if command == '__stop__':
                 stopped = True
                 response = {'result': None}
             elif command == '__globals__':
-                response = {'result': sorted(globals().keys())}
+                response = {'result': sorted(CONTEXT.keys())}
             elif command == '__locals__':
                 response = {'result': sorted(locals().keys())}
-            elif command:
-                try:
-                    func = eval(command)
-                    result = func(*message.get('args', []),
-                                  **message.get('kwargs', {}))
-                    if async_ == 'task':
-                        # create asyncio task and ignore result
-                        loop.create_task(result)
-                        result = None
-                    elif async_:
-                        # wait for async result
-                        result = await result
-                    response = {'result': result}
-                except Exception as exception:
-                    response = {'error': str(exception), 'command': command}
+            elif command == '__describe__':
+                response = {'result': REGISTRY.describe()}
+            elif command == '__framing__':
+                name = message.get('args', ['json'])[0]
+                if name not in framing.FRAMINGS:
+                    raise ValueError('unsupported framing: `%s`' % name)
+                connection.framing = framing.FRAMINGS[name]
+                response = {'result': name}
+            elif command == '__loopstats__':
+                # Optional action: 'enable', 'disable' or 'reset'.
+                action = (message.get('args') or [None])[0]
+                if action in ('enable', 'disable'):
+                    loop.instrument(action == 'enable')
+                elif action == 'reset':
+                    # Nothing to reset if instrumentation is disabled.
+                    if loop.stats:
+                        loop.stats.reset()
+                elif action is not None:
+                    raise ValueError('unsupported action: `%s`' % action)
+                result = loop.stats.report() if loop.stats else {}
+                result['queues'] = loop.queue_report()
+                response = {'result': result}
+            elif command == '__subscribe__':
+                events.subscribe(connection.subscriber,
+                                 message.get('args', [[]])[0])
+                response = {'result': connection.subscriber.prefixes}
+            elif command == '__batch__':
+                loop.create_task(_handle_batch(connection, message))
+                continue
+            elif command is not None:
+                loop.create_task(_handle(connection, message))
+                continue
+            else:
+                response = {'error': 'no command specified'}
+        except OSError:
+            # Connection lost.
+            break
         except Exception as exception:
             response = {'error': str(exception)}
-        await awriter.awrite(json.dumps(response) + '\r\n')
-        gc.collect()
+        await _reply(connection, framing_, response, request_id)
+        _idle()
+        if connection.closed:
+            break
+    # Drop replies of commands still in flight (the writer may be closed
+    # once this returns).
+    connection.closed = True
+    events.unsubscribe(connection.subscriber)
+
+
+def server(max_clients=4, buffer_size=OUTPUT_BUFFER_SIZE, flush_ms=0):
+    '''Return client handler for ``uasyncio.start_server()``.
+
+    Each client connection is served by :func:`rpc`, using its own reader
+    and writer.  Connections beyond ``max_clients`` are sent an error and
+    closed.
+
+    Replies of each connection are coalesced in an output buffer of
+    ``buffer_size`` bytes (0 to disable), flushed ``flush_ms`` after the
+    first buffered reply (see ``StreamWriter.set_buffer()``).
+
+    Example:
+
+        loop.create_task(asyncio.start_server(rpc.server(), '0.0.0.0', 5000))
+
+    .. versionadded:: 0.12.0
+    '''
+    clients = 0
+
+    async def client(areader, awriter):
+        nonlocal clients
+        try:
+            if clients >= max_clients:
+                await awriter.awrite(framing.JsonLines
+                                     .dumps({'error': 'too many clients'}))
+                return
+            clients += 1
+            if buffer_size:
+                awriter.set_buffer(buffer_size, flush_ms)
+            try:
+                await rpc(areader, awriter)
+            finally:
+                clients -= 1
+        finally:
+            await awriter.aclose()
+
+    return client
@@ -0,0 +1,126 @@
+'''
+Handles for background tasks started by RPC calls with ``async: 'task'``.
+
+Each task is identified by a small integer handle, which may be passed to
+the ``__status__``, ``__cancel__`` and ``__join__`` RPC commands.
+
+.. versionadded:: 0.12.0
+'''
+import uasyncio as asyncio
+
+
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'error'
+
+#: Number of finished tasks to keep for status queries (oldest discarded).
+MAX_FINISHED = 8
+
+
+class Task:
+    def __init__(self, handle):
+        self.handle = handle
+        self.status = RUNNING
+        self.result = None
+        self.error = None
+        self.coro = None
+        #: Set when the task finishes (see :func:`join`).
+        self.finished = asyncio.Event()
+
+    def info(self):
+        info = {'handle': self.handle, 'status': self.status}
+        if self.status == DONE:
+            info['result'] = self.result
+        elif self.status == FAILED:
+            info['error'] = self.error
+        return info
+
+
+TASKS = {}
+_finished = []
+_next_handle = 1
+
+
+async def _run(task, coro):
+    try:
+        task.result = await coro
+        task.status = DONE
+    except asyncio.CancelledError:
+        task.status = CANCELLED
+    except Exception as exception:
+        task.status = FAILED
+        task.error = str(exception)
+    task.finished.set()
+    _finished.append(task.handle)
+    while len(_finished) > MAX_FINISHED:
+        TASKS.pop(_finished.pop(0), None)
+
+
+def create(coro):
+    '''Schedule coroutine as a task and return its handle.'''
+    global _next_handle
+    task = Task(_next_handle)
+    _next_handle += 1
+    TASKS[task.handle] = task
+    task.coro = asyncio.get_event_loop().create_task(_run(task, coro))
+    return task.handle
+
+
+def _get(handle):
+    task = TASKS.get(handle)
+    if task is None:
+        raise KeyError('unknown task: %s' % handle)
+    return task
+
+
+def status(handle=None):
+    '''Return status of task, or of all known tasks if no handle is given.'''
+    if handle is None:
+        return [task.info() for task in TASKS.values()]
+    return _get(handle).info()
+
+
+def cancel(handle):
+    '''Cancel task.
+
+    The task is woken at once, even if it is sleeping or waiting, and
+    ``CancelledError`` is raised where it awaits.  It may still run
+    ``finally`` clauses (e.g., to turn outputs off) before it finishes.
+
+    Returns
+    -------
+    bool
+        ``False`` if the task had already finished.
+    '''
+    task = _get(handle)
+    if task.status != RUNNING:
+        return False
+    asyncio.cancel(task.coro)
+    return True
+
+
+async def join(handle, timeout_ms=None):
+    '''Wait for task to finish and return its result.
+
+    Raises
+    ------
+    RuntimeError
+        If the task failed or was cancelled.
+    asyncio.TimeoutError
+        If the task is still running after ``timeout_ms``.
+    '''
+    task = _get(handle)
+    if task.status == RUNNING:
+        if timeout_ms is None:
+            await task.finished.wait()
+        else:
+            try:
+                await asyncio.wait_for_ms(task.finished.wait(), timeout_ms)
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError('task %s still running' % handle)
+    if task.status == FAILED:
+        raise RuntimeError(task.error)
+    elif task.status == CANCELLED:
+        raise RuntimeError('task %s cancelled' % handle)
+    return task.result
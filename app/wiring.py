@@ -0,0 +1,134 @@
+'''
+Device objects, set up from ``config.json`` settings.
+
+Shared by ``main.py`` on the device and by the emulator (``sim/device.py``),
+so that both run the same configuration.
+
+.. versionadded:: 0.12.0
+'''
+from machine import Pin
+import machine
+import uasyncio as asyncio
+
+import config
+import i2cbus
+import motor
+import rpc
+
+
+def uart_streams(uart):
+    '''Return RPC ``(reader, writer)`` streams for UART.
+
+    Replies are coalesced in an output buffer, which is written out
+    ``flush_ms`` after the first buffered reply.  Example ``config.json``
+    entry:
+
+        "rpc": {"out_buffer": 1024, "flush_ms": 0}
+    '''
+    rpc_config = config.CONFIG.get('rpc', {})
+    writer = asyncio.StreamWriter(uart, {},
+                                  buffer_size=rpc_config
+                                  .get('out_buffer', 1024),
+                                  flush_ms=rpc_config.get('flush_ms', 0))
+    return asyncio.StreamReader(uart), writer
+
+
+def i2c_bus():
+    '''Return I2C bus for controlling motor drivers.
+
+    Transactions are counted by address (see ``i2cbus`` module).  The clock
+    frequency may be selected (and saved to ``config.json``) using the
+    ``i2c.benchmark`` command.  Example ``config.json`` entry:
+
+        "i2c": {"scl": 22, "sda": 23, "freq": 10000}
+    '''
+    i2c_config = config.CONFIG.get('i2c', {})
+    return i2cbus.Bus(Pin(i2c_config.get('scl', 22)),
+                      Pin(i2c_config.get('sda', 23)),
+                      freq=i2c_config.get('freq', 10000))
+
+
+def motor_control(i2c):
+    '''Return motor controller on I2C bus.
+
+    Pumps run on a shared pulse engine timeline (see ``pulse`` module).
+    Example ``config.json`` entry:
+
+        "pulse": {"enabled": true, "tolerance_ms": 2, "mask_write": false,
+                  "timer": 0}
+
+    If ``timer`` is set, pulse edges are driven by the specified hardware
+    timer, instead of by the event loop.
+
+    Failed I2C writes to motor boards are retried, and boards that keep
+    failing are skipped for a cooldown period (see ``motor.Board``).
+    Example ``config.json`` entry:
+
+        "motor": {"retries": 2, "backoff_us": 500, "max_failures": 3,
+                  "cooldown_ms": 5000}
+    '''
+    pulse_config = config.CONFIG.get('pulse', {})
+    timer_id = pulse_config.get('timer')
+    board_options = config.CONFIG.get('motor', {}).copy()
+    board_options['mask_write'] = pulse_config.get('mask_write', False)
+    return motor.GroveMotorControl(i2c,
+                                   engine=pulse_config.get('enabled', True),
+                                   tolerance_ms=pulse_config
+                                   .get('tolerance_ms', 2),
+                                   timer=None if timer_id is None
+                                   else machine.Timer(timer_id),
+                                   **board_options)
+
+
+def event_loop():
+    '''Return event loop, with queues sized as configured.
+
+    Optionally records event loop lag, step times and queue depths (see
+    ``__loopstats__`` RPC command).  If ``grow`` is set, full queues are
+    doubled in size (up to ``max_len`` entries) instead of raising an error.
+    Time-critical tasks (pulse edges, programs) run before other tasks;
+    ``budget_us`` (if non-zero) limits the time spent on other tasks before
+    timers and I/O are checked again.  Example ``config.json`` entry:
+
+        "loop": {"runq_len": 32, "waitq_len": 32, "grow": true,
+                 "max_len": 256, "budget_us": 5000, "instrument": true}
+    '''
+    loop_config = config.CONFIG.get('loop', {})
+    loop = asyncio.get_event_loop(loop_config.get('runq_len', 32),
+                                  loop_config.get('waitq_len', 32),
+                                  loop_config.get('grow', True),
+                                  loop_config.get('max_len', 256))
+    loop.budget_us = loop_config.get('budget_us', 5000)
+    if loop_config.get('instrument', False):
+        loop.instrument()
+    return loop
+
+
+def start_tcp_server(loop, host='0.0.0.0', port=None):
+    '''Serve RPC requests over TCP on event loop.
+
+    Example ``config.json`` entry:
+
+        "rpc_tcp": {"port": 5000, "max_clients": 4}
+
+    Parameters
+    ----------
+    loop : uasyncio.EventLoop
+        Event loop to run server on.
+    host : str, optional
+        Address to bind to.
+    port : int, optional
+        Port to listen on (default: ``port`` of ``rpc_tcp`` settings).
+    '''
+    rpc_config = config.CONFIG.get('rpc', {})
+    tcp_config = config.CONFIG.get('rpc_tcp', {})
+    if port is None:
+        port = tcp_config.get('port', 5000)
+    loop.create_task(asyncio
+                     .start_server(rpc.server(tcp_config
+                                              .get('max_clients', 4),
+                                              rpc_config
+                                              .get('out_buffer', 1024),
+                                              rpc_config.get('flush_ms', 0)),
+                                   host, port,
+                                   backlog=tcp_config.get('backlog', 2)))
@@ -2,6 +2,7 @@ import uerrno
 import uselect as select
 import usocket as _socket
 from uasyncio.core import *
+from uasyncio.synchro import Event, Lock
 
 
 DEBUG = 0
@@ -17,43 +18,61 @@ def set_debug(val):
 
 class PollEventLoop(EventLoop):
 
-    def __init__(self, runq_len=16, waitq_len=16):
-        EventLoop.__init__(self, runq_len, waitq_len)
+    def __init__(self, runq_len=16, waitq_len=16, grow=False, max_len=256):
+        EventLoop.__init__(self, runq_len, waitq_len, grow, max_len)
         self.poller = select.poll()
+        # id(sock) -> [reader, writer]: a socket may have both a task waiting
+        # to read and another waiting to write (e.g., an RPC connection
+        # reading the next request while a reply is written out).
         self.objmap = {}
 
+    def _poll_for(self, sock, entry):
+        # (Re-)register socket for the events its reader/writer wait for.
+        self.poller.register(sock, (select.POLLIN if entry[0] else 0) |
+                             (select.POLLOUT if entry[1] else 0))
+
+    def _add(self, sock, i, cb, args):
+        entry = self.objmap.get(id(sock))
+        if entry is None:
+            entry = self.objmap[id(sock)] = [None, None]
+        entry[i] = (cb, args) if args else cb
+        self._poll_for(sock, entry)
+
+    def _remove(self, sock, i):
+        entry = self.objmap.get(id(sock))
+        if entry is not None:
+            entry[i] = None
+            if entry[1 - i]:
+                self._poll_for(sock, entry)
+                return
+            del self.objmap[id(sock)]
+        self.poller.unregister(sock)
+
     def add_reader(self, sock, cb, *args):
         if DEBUG and __debug__:
             log.debug("add_reader%s", (sock, cb, args))
-        if args:
-            self.poller.register(sock, select.POLLIN)
-            self.objmap[id(sock)] = (cb, args)
-        else:
-            self.poller.register(sock, select.POLLIN)
-            self.objmap[id(sock)] = cb
+        self._add(sock, 0, cb, args)
 
     def remove_reader(self, sock):
         if DEBUG and __debug__:
             log.debug("remove_reader(%s)", sock)
-        self.poller.unregister(sock)
-        del self.objmap[id(sock)]
+        # May already have been removed by wait() (on POLLHUP/POLLERR).
+        try:
+            self._remove(sock, 0)
+        except OSError as e:
+            if e.args[0] != uerrno.ENOENT:
+                raise
 
     def add_writer(self, sock, cb, *args):
         if DEBUG and __debug__:
             log.debug("add_writer%s", (sock, cb, args))
-        if args:
-            self.poller.register(sock, select.POLLOUT)
-            self.objmap[id(sock)] = (cb, args)
-        else:
-            self.poller.register(sock, select.POLLOUT)
-            self.objmap[id(sock)] = cb
+        self._add(sock, 1, cb, args)
 
     def remove_writer(self, sock):
         if DEBUG and __debug__:
             log.debug("remove_writer(%s)", sock)
         try:
-            self.poller.unregister(sock)
-            self.objmap.pop(id(sock), None)
+            self._remove(sock, 1)
         except OSError as e:
             # StreamWriter.awrite() first tries to write to a socket,
             # and if that succeeds, yield IOWrite may never be called
@@ -62,6 +81,15 @@ class PollEventLoop(EventLoop):
             if e.args[0] != uerrno.ENOENT:
                 raise
 
+    def _wake(self, cb):
+        if DEBUG and __debug__:
+            log.debug("Calling IO callback: %r", cb)
+        if isinstance(cb, tuple):
+            cb[0](*cb[1])
+        else:
+            cb.pend_throw(None)
+            self.call_soon(cb)
+
     def wait(self, delay):
         if DEBUG and __debug__:
             log.debug("poll.wait(%d)", delay)
@@ -72,21 +100,36 @@ class PollEventLoop(EventLoop):
         # https://github.com/micropython/micropython/issues/2716 fixed.
         if res:
             for sock, ev in res:
-                cb = self.objmap[id(sock)]
+                entry = self.objmap.get(id(sock))
+                if entry is None:
+                    continue
+                reader, writer = entry
                 if ev & (select.POLLHUP | select.POLLERR):
                     # These events are returned even if not requested, and
                     # are sticky, i.e. will be returned again and again.
                     # If the caller doesn't do proper error handling and
                     # unregister this sock, we'll busy-loop on it, so we
-                    # as well can unregister it now "just in case".
-                    self.remove_reader(sock)
-                if DEBUG and __debug__:
-                    log.debug("Calling IO callback: %r", cb)
-                if isinstance(cb, tuple):
-                    cb[0](*cb[1])
+                    # as well can unregister it now "just in case".  Both
+                    # reader and writer are woken (to get the error).
+                    del self.objmap[id(sock)]
+                    self.poller.unregister(sock)
                 else:
-                    cb.pend_throw(None)
-                    self.call_soon(cb)
+                    # Only wake the side that is ready; the other one is
+                    # polled for again (one-shot polling disabled both).
+                    if ev & select.POLLIN:
+                        entry[0] = None
+                    else:
+                        reader = None
+                    if ev & select.POLLOUT:
+                        entry[1] = None
+                    else:
+                        writer = None
+                    if entry[0] or entry[1]:
+                        self._poll_for(sock, entry)
+                if reader:
+                    self._wake(reader)
+                if writer:
+                    self._wake(writer)
 
 
 class StreamReader:
@@ -96,8 +139,44 @@ class StreamReader:
             ios = polls
         self.polls = polls
         self.ios = ios
+        # Data read past the end of the last readinto()/readline_into() call
+        # is kept in buffer `_buf`, between offsets `_start` and `_end`.
+        self._buf = None
+        self._start = 0
+        self._end = 0
+
+    def _drain(self, n=-1, line=False):
+        # Return (and consume) up to `n` bytes of data left over by
+        # readinto()/readline_into(), stopping after newline if `line` is set.
+        start = self._start
+        if start == self._end:
+            return b""
+        stop = self._end if n < 0 else min(self._end, start + n)
+        if line:
+            for i in range(start, stop):
+                if self._buf[i] == 0x0a:
+                    stop = i + 1
+                    break
+        self._start = stop
+        return bytes(self._buf[start:stop])
+
+    def _shift(self, buf):
+        # Move left over data to the start of `buf`; return its length.
+        start = self._start
+        n = self._end - start
+        if n and (buf is not self._buf or start):
+            src = self._buf
+            for i in range(n):
+                buf[i] = src[start + i]
+        self._buf = buf
+        self._start = 0
+        self._end = n
+        return n
 
     def read(self, n=-1):
+        res = self._drain(n)
+        if res:
+            return res
         while True:
             yield IORead(self.polls)
             res = self.ios.read(n)
@@ -111,7 +190,8 @@ class StreamReader:
         return res
 
     def readexactly(self, n):
-        buf = b""
+        buf = self._drain(n)
+        n -= len(buf)
         while n:
             yield IORead(self.polls)
             res = self.ios.read(n)
@@ -126,8 +206,8 @@ class StreamReader:
     def readline(self):
         if DEBUG and __debug__:
             log.debug("StreamReader.readline()")
-        buf = b""
-        while True:
+        buf = self._drain(line=True)
+        while not buf or buf[-1] != 0x0a:
             yield IORead(self.polls)
             res = self.ios.readline()
             assert res is not None
@@ -135,12 +215,75 @@ class StreamReader:
                 yield IOReadDone(self.polls)
                 break
             buf += res
-            if buf[-1] == 0x0a:
-                break
         if DEBUG and __debug__:
             log.debug("StreamReader.readline(): %s", buf)
         return buf
 
+    def readinto(self, buf, n=-1):
+        # Read exactly `n` bytes (default: `len(buf)`) into preallocated
+        # `buf` and return memoryview of data (shorter at end of stream).
+        #
+        # Unlike readexactly(), nothing is allocated per chunk.  Any data
+        # left over by a previous call is consumed first.
+        mv = memoryview(buf)
+        if n < 0:
+            n = len(buf)
+        end = self._shift(buf)
+        if end >= n:
+            self._start = n
+            return mv[:n]
+        # No data will be left over.
+        self._end = 0
+        while end < n:
+            yield IORead(self.polls)
+            res = self.ios.readinto(mv[end:n])
+            if res is None:
+                continue
+            if not res:
+                yield IOReadDone(self.polls)
+                break
+            end += res
+        return mv[:end]
+
+    def readline_into(self, buf):
+        # Read line (including newline) into preallocated `buf` and return
+        # memoryview of line (without newline at end of stream).
+        #
+        # Data read past the newline is kept in `buf` for the next call, so
+        # the returned view is only valid until the next read.  Raises
+        # `ValueError` (after discarding the line) if the line does not fit.
+        if DEBUG and __debug__:
+            log.debug("StreamReader.readline_into()")
+        mv = memoryview(buf)
+        size = len(buf)
+        end = self._shift(buf)
+        start = 0
+        overflow = False
+        while True:
+            for i in range(start, end):
+                if buf[i] == 0x0a:
+                    self._start = i + 1
+                    self._end = end
+                    if overflow:
+                        raise ValueError("line too long")
+                    return mv[:i + 1]
+            if end == size:
+                # Discard data; keep reading until end of line.
+                overflow = True
+                end = 0
+            start = end
+            yield IORead(self.polls)
+            res = self.ios.readinto(mv[end:])
+            if res is None:
+                continue
+            if not res:
+                yield IOReadDone(self.polls)
+                self._start = self._end = 0
+                if overflow:
+                    raise ValueError("line too long")
+                return mv[:end]
+            end += res
+
     def aclose(self):
         yield IOReadDone(self.polls)
         self.ios.close()
@@ -151,16 +294,36 @@ class StreamReader:
 
 class StreamWriter:
 
-    def __init__(self, s, extra):
+    def __init__(self, s, extra, buffer_size=0, flush_ms=0):
         self.s = s
         self.extra = extra
-
-    def awrite(self, buf, off=0, sz=-1):
-        # This method is called awrite (async write) to not proliferate
-        # incompatibility with original asyncio. Unlike original asyncio
-        # whose .write() method is both not a coroutine and guaranteed
-        # to return immediately (which means it has to buffer all the
-        # data), this method is a coroutine.
+        self.obuf = None
+        self.olen = 0
+        self._flushing = False
+        # Set when no task is writing out the output buffer.
+        self._flushed = Event()
+        self._flushed.set()
+        self._flush_pending = False
+        self._flush_cb = self._on_flush_timer
+        # Write error of a flush (see aflush()); raised by further writes.
+        self._error = None
+        if buffer_size:
+            self.set_buffer(buffer_size, flush_ms)
+
+    def set_buffer(self, buffer_size, flush_ms=0, flush_size=-1):
+        # Enable buffered mode: small writes are coalesced in a preallocated
+        # output buffer, which is written out:
+        #  - `flush_ms` after data is first buffered (if `flush_ms` >= 0; 0
+        #    flushes on the next pass of the event loop);
+        #  - once `flush_size` bytes (default: half the buffer) are buffered;
+        #  - when more data does not fit;
+        #  - on demand, using aflush().
+        self.obuf = bytearray(buffer_size)
+        self.olen = 0
+        self.flush_ms = flush_ms
+        self.flush_size = buffer_size // 2 if flush_size < 0 else flush_size
+
+    def _write(self, buf, off=0, sz=-1):
         if sz == -1:
             sz = len(buf) - off
         if DEBUG and __debug__:
@@ -184,12 +347,134 @@ class StreamWriter:
             if DEBUG and __debug__:
                 log.debug("StreamWriter.awrite(): can write more")
 
+    def awrite(self, buf, off=0, sz=-1):
+        # This method is called awrite (async write) to not proliferate
+        # incompatibility with original asyncio. Unlike original asyncio
+        # whose .write() method is both not a coroutine and guaranteed
+        # to return immediately (which means it has to buffer all the
+        # data), this method is a coroutine.
+        if self.obuf is None:
+            yield from self._write(buf, off, sz)
+            return
+        self._check()
+        if isinstance(buf, str):
+            buf = buf.encode()
+        if sz == -1:
+            sz = len(buf) - off
+        if sz > len(self.obuf):
+            # Too large to buffer; write through (after buffered data).
+            yield from self.aflush()
+            yield from self._write(buf, off, sz)
+            return
+        while self.olen + sz > len(self.obuf):
+            yield from self._wait_flush()
+        self.obuf[self.olen:self.olen + sz] = memoryview(buf)[off:off + sz]
+        self.olen += sz
+        yield from self._buffered()
+
+    def awrite_into(self, func, arg):
+        # Serialize directly into output buffer (buffered mode only).
+        #
+        # `func(arg, buf, offset)` must write to `buf` starting at `offset`
+        # and return the end offset, or raise `IndexError` if the data does
+        # not fit.  `IndexError` is propagated if the data does not fit
+        # even in the empty buffer.
+        self._check()
+        while True:
+            try:
+                end = func(arg, self.obuf, self.olen)
+                break
+            except IndexError:
+                if not self.olen:
+                    raise
+            yield from self._wait_flush()
+        self.olen = end
+        yield from self._buffered()
+
+    def _buffered(self):
+        # Called after data was added to output buffer.
+        if self.olen >= self.flush_size:
+            yield from self.aflush()
+        elif self.flush_ms >= 0 and not self._flush_pending:
+            self._flush_pending = True
+            get_event_loop().call_later_ms(self.flush_ms, self._flush_cb)
+
+    def _on_flush_timer(self):
+        self._flush_pending = False
+        if self.olen and not self._flushing:
+            get_event_loop().create_task(self._flush_task())
+
+    def _flush_task(self):
+        # Flush started by the flush timer.  A write error (e.g., the stream
+        # was closed) must not stop the event loop; it is raised by the next
+        # awrite()/aflush() instead.
+        try:
+            yield from self.aflush()
+        except OSError:
+            pass
+
+    def _check(self):
+        # Raise error of a failed flush.
+        if self._error is not None:
+            raise self._error
+
+    def _wait_flush(self):
+        # Make room in output buffer.
+        if self._flushing:
+            # Another task is writing out the buffer.
+            yield from self._flushed.wait()
+            self._check()
+        else:
+            yield from self.aflush()
+
+    def aflush(self):
+        # Write out buffered data.  If another task is already writing out
+        # the buffer, wait for it to finish (and write out anything buffered
+        # since), so that all data written so far has been written out on
+        # return.
+        #
+        # If a write fails, buffered data is discarded, and the error is
+        # raised again by any further awrite()/aflush() (the stream has
+        # failed, e.g., it was closed by the peer).
+        while self._flushing:
+            yield from self._flushed.wait()
+        self._check()
+        self._flushing = True
+        self._flushed.clear()
+        try:
+            obuf = self.obuf
+            while self.olen:
+                n = self.olen
+                yield from self._write(obuf, 0, n)
+                # Move data buffered while writing to start of buffer.
+                rest = self.olen - n
+                for i in range(rest):
+                    obuf[i] = obuf[n + i]
+                self.olen = rest
+        except OSError as e:
+            self._error = e
+            self.olen = 0
+            raise
+        finally:
+            self._flushing = False
+            self._flushed.set()
+
     # Write piecewise content from iterable (usually, a generator)
     def awriteiter(self, iterable):
         for buf in iterable:
             yield from self.awrite(buf)
+        if self.obuf is not None:
+            # Content was coalesced in output buffer; write it out now.
+            yield from self.aflush()
 
     def aclose(self):
+        # Close only once output buffer is empty (i.e., also wait for a
+        # flush in progress in another task).
+        if self.olen or self._flushing:
+            try:
+                yield from self.aflush()
+            except OSError:
+                pass
         yield IOWriteDone(self.s)
         self.s.close()
 
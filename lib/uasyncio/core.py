@@ -1,3 +1,5 @@
+from array import array
+
 import utime as time
 import utimeq
 import ucollections
@@ -24,29 +26,226 @@ class TimeoutError(CancelledError):
     pass
 
 
+def _bucket(value, n):
+    # Index of log2 histogram bucket: 0 for value <= 1, i for
+    # 2**(i - 1) < value <= 2**i (last bucket is open-ended).
+    i = 0
+    value -= 1
+    while value > 0 and i < n - 1:
+        value >>= 1
+        i += 1
+    return i
+
+
+class LoopStats:
+    # Event loop instrumentation (see EventLoop.instrument()).
+    #
+    # All counters are preallocated, so that recording does not allocate
+    # memory.
+
+    BUCKETS = 16
+    # Number of tasks for which step time is accumulated.
+    TASKS = 8
+
+    def __init__(self):
+        self.lag_ms = array('I', [0] * self.BUCKETS)
+        self.step_us = array('I', [0] * self.BUCKETS)
+        self.tasks = [None] * self.TASKS
+        self.task_us = array('I', [0] * self.TASKS)
+        self.task_steps = array('I', [0] * self.TASKS)
+        self.reset()
+
+    def reset(self):
+        for i in range(self.BUCKETS):
+            self.lag_ms[i] = 0
+            self.step_us[i] = 0
+        for i in range(self.TASKS):
+            self.tasks[i] = None
+            self.task_us[i] = 0
+            self.task_steps[i] = 0
+        self.steps = 0
+        self.lag_max_ms = 0
+        self.step_max_us = 0
+        self.slowest = None
+        self.runq_max = 0
+        self.waitq_max = 0
+
+    def lag(self, lag):
+        # Record delay of waitq entry after its scheduled time (ms).
+        self.lag_ms[_bucket(lag, self.BUCKETS)] += 1
+        if lag > self.lag_max_ms:
+            self.lag_max_ms = lag
+
+    def step(self, cb, start):
+        # Record duration of callback or coroutine step started at `start`
+        # (`ticks_us()`).
+        duration = time.ticks_diff(time.ticks_us(), start)
+        self.steps += 1
+        self.step_us[_bucket(duration, self.BUCKETS)] += 1
+        if duration > self.step_max_us:
+            self.step_max_us = duration
+            self.slowest = cb
+        tasks = self.tasks
+        slot = -1
+        for i in range(self.TASKS):
+            if tasks[i] is cb:
+                slot = i
+                break
+        if slot < 0:
+            # Take free slot, or the slot of the task with least time.
+            slot = 0
+            for i in range(self.TASKS):
+                if tasks[i] is None:
+                    slot = i
+                    break
+                if self.task_us[i] < self.task_us[slot]:
+                    slot = i
+            tasks[slot] = cb
+            self.task_us[slot] = 0
+            self.task_steps[slot] = 0
+        self.task_us[slot] += duration
+        self.task_steps[slot] += 1
+
+    def queues(self, runq, waitq):
+        if runq > self.runq_max:
+            self.runq_max = runq
+        if waitq > self.waitq_max:
+            self.waitq_max = waitq
+
+    def report(self):
+        # Histogram bucket `i` counts values up to 2**i (ms or us).
+        tasks = [{'task': repr(self.tasks[i]), 'us': self.task_us[i],
+                  'steps': self.task_steps[i]}
+                 for i in range(self.TASKS) if self.tasks[i] is not None]
+        tasks.sort(key=lambda task: -task['us'])
+        return {'steps': self.steps, 'lag_ms': list(self.lag_ms),
+                'lag_max_ms': self.lag_max_ms,
+                'step_us': list(self.step_us),
+                'step_max_us': self.step_max_us,
+                'slowest': repr(self.slowest), 'tasks': tasks,
+                'runq_max': self.runq_max, 'waitq_max': self.waitq_max}
+
+
 class EventLoop:
 
-    def __init__(self, runq_len=16, waitq_len=16):
+    def __init__(self, runq_len=16, waitq_len=16, grow=False, max_len=256):
         self.runq = ucollections.deque((), runq_len, True)
         self.waitq = utimeq.utimeq(waitq_len)
+        self.runq_len = runq_len
+        self.waitq_len = waitq_len
+        # If `grow` is set, a full queue is replaced by one twice the size
+        # (up to `max_len` entries); otherwise, IndexError is raised, with a
+        # report of queue sizes (see queue_report()).
+        self.grow = grow
+        self.max_len = max_len
+        self.grown = 0
+        # High-priority (time-critical) tasks, see create_task().  When
+        # runnable, they are queued in `hiq` (instead of `runq`), and always
+        # run before best-effort entries of `runq`.
+        self.high = set()
+        self.hiq = ucollections.deque((), runq_len, True)
+        # If non-zero, maximum time (us) spent on best-effort entries of
+        # `runq` before expired timers and I/O are checked again.
+        self.budget_us = 0
         # Current task being run. Task is a top-level coroutine scheduled
         # in the event loop (sub-coroutines executed transparently by
         # yield from/await, event loop "doesn't see" them).
         self.cur_task = None
+        # Instrumentation (see instrument()), None if disabled.
+        self.stats = None
+
+    def instrument(self, enable=True):
+        # Enable (or disable) recording of loop lag, step times and queue
+        # high-water marks in `self.stats` (see LoopStats).
+        if not enable:
+            self.stats = None
+        elif self.stats is None:
+            self.stats = LoopStats()
+        return self.stats
+
+    def queue_report(self):
+        # Sizes, current lengths and high-water marks (if instrumented) of
+        # run and wait queues.
+        stats = self.stats
+        return {'runq_len': self.runq_len, 'runq': len(self.runq),
+                'runq_max': stats.runq_max if stats else None,
+                'hiq': len(self.hiq), 'high': len(self.high),
+                'waitq_len': self.waitq_len, 'waitq': len(self.waitq),
+                'waitq_max': stats.waitq_max if stats else None,
+                'grow': self.grow, 'max_len': self.max_len,
+                'grown': self.grown}
+
+    def _full(self, name, size):
+        # Make room in full queue, or raise IndexError.  The new size is
+        # capped at `max_len`.
+        if not self.grow or size >= self.max_len:
+            raise IndexError('%s overflow: %r' % (name, self.queue_report()))
+        size = min(size * 2, self.max_len)
+        if name == 'runq':
+            # High-priority queue has the same size as `runq`.
+            runq = ucollections.deque((), size, True)
+            while self.runq:
+                runq.append(self.runq.popleft())
+            hiq = ucollections.deque((), size, True)
+            while self.hiq:
+                hiq.append(self.hiq.popleft())
+            self.runq = runq
+            self.hiq = hiq
+            self.runq_len = size
+        else:
+            waitq = utimeq.utimeq(size)
+            entry = [0, 0, 0]
+            while self.waitq:
+                self.waitq.pop(entry)
+                waitq.push(entry[0], entry[1], entry[2])
+            self.waitq = waitq
+            self.waitq_len = size
+        self.grown += 1
 
     def time(self):
         return time.ticks_ms()
 
-    def create_task(self, coro):
+    def create_task(self, coro, high=False):
         # CPython 3.4.2
+        # If `high` is set, the task is time-critical (see set_priority()).
+        if high:
+            self.high.add(coro)
         self.call_later_ms(0, coro)
-        # CPython asyncio incompatibility: we don't return Task object
+        # CPython asyncio incompatibility: we don't return Task object, but
+        # return coroutine so that it may be passed to `cancel()`.
+        return coro
+
+    def set_priority(self, coro, high=True):
+        # Mark task as high-priority (or best-effort, if `high` is False),
+        # from the next time it is scheduled.  Runnable high-priority tasks
+        # run before any best-effort task; a best-effort pass over `runq` is
+        # interrupted as soon as a timer expires (see run_forever()).  A
+        # high-priority task that yields without delay (`sleep_ms(0)`) is
+        # queued in hiq again: best-effort tasks do not run until it sleeps
+        # with a delay, waits for I/O or an event, or finishes.
+        # Returns previous priority, e.g., to restore it.
+        previous = coro in self.high
+        if high:
+            self.high.add(coro)
+        else:
+            self.high.discard(coro)
+        return previous
 
     def call_soon(self, callback, *args):
         if __debug__ and DEBUG:
             log.debug("Scheduling in runq: %s", (callback, args))
+        is_gen = isinstance(callback, type_gen)
+        if is_gen and self.high and callback in self.high:
+            if len(self.hiq) >= self.runq_len:
+                self._full('runq', self.runq_len)
+            self.hiq.append(callback)
+            return
+        # Check for room first, so that a callback is never queued without
+        # its arguments.
+        if len(self.runq) + (1 if is_gen else 2) > self.runq_len:
+            self._full('runq', self.runq_len)
         self.runq.append(callback)
-        if not isinstance(callback, type_gen):
+        if not is_gen:
             self.runq.append(args)
 
     def call_later(self, delay, callback, *args):
@@ -60,8 +259,25 @@ class EventLoop:
     def call_at_(self, time, callback, args=()):
         if __debug__ and DEBUG:
             log.debug("Scheduling in waitq: %s", (time, callback, args))
+        if len(self.waitq) >= self.waitq_len:
+            self._full('waitq', self.waitq_len)
         self.waitq.push(time, callback, args)
 
+    def remove_waiting(self, callback):
+        # Remove entries of callback (e.g., a sleeping task) from waitq.
+        # Returns True if any entry was removed.
+        found = False
+        waitq = utimeq.utimeq(self.waitq_len)
+        entry = [0, 0, 0]
+        while self.waitq:
+            self.waitq.pop(entry)
+            if entry[1] is callback:
+                found = True
+            else:
+                waitq.push(entry[0], entry[1], entry[2])
+        self.waitq = waitq
+        return found
+
     def wait(self, delay):
         # Default wait implementation, to be overriden in subclasses
         # with IO scheduling
@@ -72,6 +288,9 @@ class EventLoop:
     def run_forever(self):
         cur_task = [0, 0, 0]
         while True:
+            stats = self.stats
+            if stats:
+                stats.queues(len(self.runq), len(self.waitq))
             # Expire entries in waitq and move them to runq
             tnow = self.time()
             while self.waitq:
@@ -79,36 +298,68 @@ class EventLoop:
                 delay = time.ticks_diff(t, tnow)
                 if delay > 0:
                     break
+                if stats:
+                    stats.lag(-delay)
                 self.waitq.pop(cur_task)
                 if __debug__ and DEBUG:
                     log.debug("Moving from waitq to runq: %s", cur_task[1])
                 self.call_soon(cur_task[1], *cur_task[2])
 
-            # Process runq
-            l = len(self.runq)
+            # Process hiq, and entries present in runq at start of pass.
+            # High-priority tasks are run first, including those made
+            # runnable by a best-effort step.  After each best-effort step,
+            # the pass ends early if the time budget is exhausted, or if a
+            # timer has expired while high-priority tasks exist.
+            n = l = len(self.runq)
+            if stats:
+                stats.queues(l, len(self.waitq))
             if __debug__ and DEBUG:
                 log.debug("Entries in runq: %d", l)
-            while l:
-                cb = self.runq.popleft()
-                l -= 1
+            budget = self.budget_us
+            if budget:
+                end = time.ticks_add(time.ticks_us(), budget)
+            while l or self.hiq:
+                if self.hiq:
+                    # Only coroutines are queued in hiq.
+                    cb = self.hiq.popleft()
+                else:
+                    if l < n:
+                        if budget and \
+                                time.ticks_diff(time.ticks_us(), end) >= 0:
+                            break
+                        if self.high and self.waitq and \
+                                time.ticks_diff(self.waitq.peektime(),
+                                                self.time()) <= 0:
+                            break
+                    cb = self.runq.popleft()
+                    l -= 1
                 args = ()
                 if not isinstance(cb, type_gen):
                     args = self.runq.popleft()
                     l -= 1
                     if __debug__ and DEBUG:
                         log.info("Next callback to run: %s", (cb, args))
-                    cb(*args)
+                    if stats:
+                        start = time.ticks_us()
+                        cb(*args)
+                        stats.step(cb, start)
+                    else:
+                        cb(*args)
                     continue
 
                 if __debug__ and DEBUG:
                     log.info("Next coroutine to run: %s", (cb, args))
                 self.cur_task = cb
                 delay = 0
+                if stats:
+                    start = time.ticks_us()
                 try:
                     if args is ():
                         ret = next(cb)
                     else:
                         ret = cb.send(*args)
+                    if stats:
+                        stats.step(cb, start)
                     if __debug__ and DEBUG:
                         log.info("Coroutine %s yield result: %s", cb, ret)
                     if isinstance(ret, SysCall1):
@@ -133,22 +384,29 @@ class EventLoop:
                             assert False, "Unknown syscall yielded: %r (of type %r)" % (ret, type(ret))
                     elif isinstance(ret, type_gen):
                         self.call_soon(ret)
+                    elif ret is False:
+                        # Don't reschedule (checked before int, as bool is
+                        # a subclass of int)
+                        continue
                     elif isinstance(ret, int):
                         # Delay
                         delay = ret
                     elif ret is None:
                         # Just reschedule
                         pass
-                    elif ret is False:
-                        # Don't reschedule
-                        continue
                     else:
                         assert False, "Unsupported coroutine yield value: %r (of type %r)" % (ret, type(ret))
                 except StopIteration as e:
+                    if stats:
+                        stats.step(cb, start)
+                    self.high.discard(cb)
                     if __debug__ and DEBUG:
                         log.debug("Coroutine finished: %s", cb)
                     continue
                 except CancelledError as e:
+                    if stats:
+                        stats.step(cb, start)
+                    self.high.discard(cb)
                     if __debug__ and DEBUG:
                         log.debug("Coroutine cancelled: %s", cb)
                     continue
@@ -162,7 +420,7 @@ class EventLoop:
 
             # Wait until next waitq task or I/O availability
             delay = 0
-            if not self.runq:
+            if not self.runq and not self.hiq:
                 delay = -1
                 if self.waitq:
                     tnow = self.time()
@@ -218,10 +476,10 @@ class IOWriteDone(SysCall1):
 
 _event_loop = None
 _event_loop_class = EventLoop
-def get_event_loop(runq_len=16, waitq_len=16):
+def get_event_loop(runq_len=16, waitq_len=16, grow=False, max_len=256):
     global _event_loop
     if _event_loop is None:
-        _event_loop = _event_loop_class(runq_len, waitq_len)
+        _event_loop = _event_loop_class(runq_len, waitq_len, grow, max_len)
     return _event_loop
 
 def sleep(secs):
@@ -258,8 +516,11 @@ sleep_ms = SleepMs()
 
 
 def cancel(coro):
+    # Cancel task at once: a task waiting for I/O or an Event/Lock (pending
+    # value False), or sleeping (in waitq), is rescheduled now, and
+    # CancelledError is raised where it awaits.
     prev = coro.pend_throw(CancelledError())
-    if prev is False:
+    if prev is False or _event_loop.remove_waiting(coro):
         _event_loop.call_soon(coro)
 
 
@@ -283,7 +544,8 @@ def wait_for_ms(coro, timeout):
                 log.debug("timeout_func: cancelling %s", timeout_obj.coro)
             prev = timeout_obj.coro.pend_throw(TimeoutError())
             #print("prev pend", prev)
-            if prev is False:
+            if prev is False or \
+                    _event_loop.remove_waiting(timeout_obj.coro):
                 _event_loop.call_soon(timeout_obj.coro)
 
     timeout_obj = TimeoutObj(_event_loop.cur_task)
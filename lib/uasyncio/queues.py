@@ -0,0 +1,55 @@
+import ucollections
+
+from uasyncio.synchro import _park, _wake
+
+
+class QueueEmpty(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Queue:
+    # Bounded FIFO queue.  Items are stored in a preallocated deque of
+    # `maxsize` entries; get() waits while the queue is empty, and put()
+    # while it is full.
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._queue = ucollections.deque((), maxsize, True)
+        self.getters = []
+        self.putters = []
+
+    def qsize(self):
+        return len(self._queue)
+
+    def empty(self):
+        return not self._queue
+
+    def full(self):
+        return len(self._queue) >= self.maxsize
+
+    def get(self):
+        while not self._queue:
+            yield from _park(self.getters)
+        return self.get_nowait()
+
+    def get_nowait(self):
+        if not self._queue:
+            raise QueueEmpty()
+        item = self._queue.popleft()
+        _wake(self.putters)
+        return item
+
+    def put(self, item):
+        while len(self._queue) >= self.maxsize:
+            yield from _park(self.putters)
+        self.put_nowait(item)
+
+    def put_nowait(self, item):
+        if len(self._queue) >= self.maxsize:
+            raise QueueFull()
+        self._queue.append(item)
+        _wake(self.getters)
@@ -0,0 +1,84 @@
+from uasyncio import core
+
+
+# Waiting tasks are parked (not rescheduled, like tasks waiting for I/O)
+# in a list, and rescheduled with call_soon() when woken.  Lists keep their
+# capacity, so that parking does not allocate in steady state.
+
+def _park(waiting):
+    task = core.get_event_loop().cur_task
+    waiting.append(task)
+    # Let cancel() reschedule parked task.
+    task.pend_throw(False)
+    try:
+        yield False
+    except core.CancelledError:
+        if task in waiting:
+            waiting.remove(task)
+        else:
+            # Woken before being cancelled; pass wake-up on.
+            _wake(waiting)
+        raise
+
+
+def _wake(waiting):
+    # Reschedule first waiting task.  Returns False if there was none.
+    if not waiting:
+        return False
+    task = waiting.pop(0)
+    task.pend_throw(None)
+    core.get_event_loop().call_soon(task)
+    return True
+
+
+class Event:
+
+    def __init__(self):
+        self.state = False
+        self.waiting = []
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        # Wake all waiting tasks.
+        self.state = True
+        while _wake(self.waiting):
+            pass
+
+    def clear(self):
+        self.state = False
+
+    def wait(self):
+        while not self.state:
+            yield from _park(self.waiting)
+        return True
+
+
+class Lock:
+
+    def __init__(self):
+        self.state = False
+        self.waiting = []
+
+    def locked(self):
+        return self.state
+
+    def acquire(self):
+        while self.state:
+            yield from _park(self.waiting)
+        self.state = True
+        return True
+
+    def release(self):
+        if not self.state:
+            raise RuntimeError('Lock not acquired')
+        self.state = False
+        _wake(self.waiting)
+
+    def __aenter__(self):
+        return self.acquire()
+
+    def __aexit__(self, *args):
+        self.release()
+        yield from ()
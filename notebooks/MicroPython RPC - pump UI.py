@@ -39,7 +39,13 @@ uart2_port = host.get_port(vid=0x0403, pid=0x6015)
 print('found uart2 port: %s' % uart2_port.device)
 
 adevice = BackgroundSerialAsync(port=uart2_port.device, baudrate=115200)
-aremote = AsyncRemote(adevice)
+# Use pipelined mode to receive pump progress events in the background.
+aremote = AsyncRemote(adevice, pipelined=True)
+# Cache opcode table to send registered commands by opcode.
+asyncio.run_coroutine_threadsafe(aremote.describe(),
+                                 aremote.device.loop).result()
+asyncio.run_coroutine_threadsafe(aremote.subscribe('pump.', 'recipe.'),
+                                 aremote.device.loop).result()
 
 # # Configuration
 
@@ -120,8 +120,10 @@ class RemoteBase:
 class Remote(RemoteBase):
     def _base_call(self, base_message, command, *args, **kwargs):
         message = base_message.copy()
+        # Commands not registered on the device (e.g., `ota.latest_version`)
+        # are evaluated there.
         message.update({'command': command, 'args': args,
-                        'kwargs': kwargs})
+                        'kwargs': kwargs, 'eval': True})
         self.device.write(json.dumps(message).encode('utf8') + b'\r\n')
         response = json.loads(self.device.readline())
         if 'error' in response:
@@ -132,8 +134,10 @@ class Remote(RemoteBase):
 class AsyncRemote(RemoteBase):
     async def _base_call(self, base_message, command, *args, **kwargs):
         message = base_message.copy()
+        # Commands not registered on the device (e.g., `ota.latest_version`)
+        # are evaluated there.
         message.update({'command': command, 'args': args,
-                        'kwargs': kwargs})
+                        'kwargs': kwargs, 'eval': True})
         await self.device.write(json.dumps(message).encode('utf8') + b'\r\n')
         response = json.loads(await self.device.readline())
         if 'error' in response:
@@ -57,14 +57,31 @@ def pump_widget(aremote, pumps):
         return asyncio.wait_for(aremote.call('motor_ctrl.set_direction', addr, index, on), timeout=2)
 
     buttons = []
+    progress = {}
     for name_i, pump_i in pumps.items():
         button_i = ipw.Button(description='Pump %s' % name_i)
         pulses_i = ipw.IntSlider(min=0, max=125, value=25, description='Pulses')
         period_i = ipw.FloatSlider(min=0., max=125., value=1.,
                                    description='Period (s)')
+        progress_i = ipw.IntProgress(min=0, max=1, value=0)
         button_i.on_click(ft.partial(do_pump, aremote, pump_i['addr'],
                                      pump_i['index'], pulses_i, period_i))
-        buttons.append(ipw.HBox([button_i, pulses_i, period_i]))
+        buttons.append(ipw.HBox([button_i, pulses_i, period_i, progress_i]))
+        # Pump events are tagged as `<addr>-<index + 1>`.
+        progress['%d-%d' % (pump_i['addr'], pump_i['index'] + 1)] = progress_i
+
+    def on_pump_event(name, data):
+        # Show live progress pushed by the device (see `AsyncRemote.subscribe`).
+        progress_i = progress.get(data['tag'])
+        if progress_i is None:
+            return
+        if name == 'pump.start':
+            progress_i.max = max(data['pulses'], 1)
+            progress_i.value = 0
+        elif name == 'pump.pulse':
+            progress_i.value = data['pulse']
+
+    aremote.on('pump.', on_pump_event)
 
     single_pump_ui = ipw.VBox(buttons)
     return single_pump_ui
@@ -120,8 +137,9 @@ def control_widget(aremote, pumps, valves):
             value = (message['new'] == 1)
 
             async def switch_valve():
-                await aremote.call('motor_ctrl.set_direction', addr, index, value)
-                await aremote.call('gc.collect')
+                async with aremote.batch() as batch:
+                    batch.call('motor_ctrl.set_direction', addr, index, value)
+                    batch.call('gc.collect')
 
             loop = asyncio.get_event_loop()
             loop.create_task(asyncio.wait_for(switch_valve(), timeout=2))
@@ -134,44 +152,149 @@ def control_widget(aremote, pumps, valves):
     return ipw.HBox([pump_ui, valves_ui])
 
 
-def valved_pump_widget(aremote, valve_configs, pump, default_pulses=20):
-    def _do_pump(valve_configs, pump, pulses_widget, period_widget, *args):
-        for valve, state in valve_configs:
-            asyncio.run_coroutine_threadsafe(
-                aremote.call('motor_ctrl.set_direction', valve['addr'],
-                             valve['index'], state),
-                aremote.device.loop).result()
-        do_pump(aremote, pump['addr'], pump['index'], pulses_widget, period_widget)
+def valved_pump_widget(aremote, valve_configs, pump, default_pulses=20,
+                       name=None):
+    '''
+    .. versionchanged:: 0.12.0
+        Store a recipe to set the valves and then pump (see
+        :func:`valved_pump_recipe`) on the device, and return a
+        :func:`recipe_widget` to run it.  The recipe is stored as ``name``
+        (default: derived from the pump and valve states, e.g.,
+        ``pump_16-3_valve_16-2_1``).
+    '''
+    if name is None:
+        # Outputs are named as `<addr>-<index + 1>`, as in pump event tags.
+        name = 'pump_%d-%d' % (pump['addr'], pump['index'] + 1)
+        name += ''.join('_valve_%d-%d_%d' % (valve['addr'],
+                                             valve['index'] + 1, state)
+                        for valve, state in valve_configs)
+    save_recipes(aremote, {name: valved_pump_recipe(valve_configs, pump,
+                                                    default_pulses)})
+    return recipe_widget(aremote, name, default_pulses=default_pulses)
+
+
+def valved_pump_recipe(valve_configs, pump, default_pulses=20):
+    '''Return recipe to set valves and then pump (see ``app/recipes.py``).
+
+    Parameters ``pulses``, ``on_ms`` and ``off_ms`` may be set when the recipe
+    is run.
+
+    .. versionadded:: 0.12.0
+    '''
+    steps = [{'command': 'motor_ctrl.set_direction',
+              'args': [valve['addr'], valve['index'], state]}
+             for valve, state in valve_configs]
+    steps.append({'command': 'motor_ctrl.pump',
+                  'args': [pump['addr'], pump['index'], '$pulses'],
+                  'kwargs': {'on_ms': '$on_ms', 'off_ms': '$off_ms'},
+                  'async': True})
+    return {'params': {'pulses': default_pulses, 'on_ms': 150,
+                       'off_ms': 850},
+            'steps': steps}
+
+
+def bead_recipes(valves, pumps):
+    '''Return wash, lysate and elution recipes, by name.
+
+    .. versionadded:: 0.12.0
+    '''
+    pump = pumps['16-3']
+    return {'wash_to_beads':
+            valved_pump_recipe([(valves['16-2'], 1)], pump,
+                               default_pulses=20),
+            'lysate_to_beads':
+            valved_pump_recipe([(valves['16-1'], 0), (valves['16-2'], 0)],
+                               pump, default_pulses=100),
+            'elution_to_beads':
+            valved_pump_recipe([(valves['16-1'], 1), (valves['16-2'], 0)],
+                               pump, default_pulses=100)}
+
+
+def save_recipes(aremote, recipes):
+    '''Store recipes on the device, in a single round trip.
+
+    .. versionadded:: 0.12.0
+    '''
+    async def _save():
+        async with aremote.batch() as batch:
+            for name, recipe in recipes.items():
+                batch.call('recipes.save', name, recipe)
+
+    asyncio.run_coroutine_threadsafe(asyncio.wait_for(_save(), timeout=5),
+                                     aremote.device.loop).result()
+
 
+def recipe_widget(aremote, name, default_pulses=20):
+    '''Button to run stored recipe on the device with a single call.
+
+    The recipe runs as a task on the device; its progress is shown in a
+    label (from ``recipe.*`` events).
+
+    .. versionadded:: 0.12.0
+    '''
     button = ipw.Button(description='Pump')
     pulses = ipw.IntSlider(min=0, max=125, value=default_pulses, description='Pulses')
     period = ipw.FloatSlider(min=0.2, max=125., value=1.,
                                description='Period (s)')
-    button.on_click(ft.partial(_do_pump, valve_configs, pump, pulses, period))
-    return ipw.HBox([button, pulses, period])
+    status = ipw.Label()
+
+    def on_click(*args):
+        params = {'pulses': pulses.value, 'on_ms': 150,
+                  'off_ms': int(period.value * 1e3) - 150}
+        asyncio.run_coroutine_threadsafe(asyncio
+                                         .wait_for(aremote.call('recipes.run',
+                                                                name, params),
+                                                   timeout=2),
+                                         aremote.device.loop).result()
+
+    def on_recipe_event(event, data):
+        if data.get('name') != name:
+            return
+        if event == 'recipe.step':
+            status.value = 'step %(step)d/%(steps)d' % data
+        elif event == 'recipe.error':
+            status.value = 'error: %s' % data['error']
+        else:
+            status.value = event.split('.')[-1]
+
+    aremote.on('recipe.', on_recipe_event)
+    button.on_click(on_click)
+    return ipw.HBox([button, pulses, period, status])
 
 
 def pump_wash_to_beads_widget(aremote, valves, pumps):
-    valve_configs = [(valves['16-2'], 1)]
-    pump = pumps['16-3']
-    return valved_pump_widget(aremote, valve_configs, pump, default_pulses=20)
+    '''
+    .. versionchanged:: 0.12.0
+        Run ``wash_to_beads`` recipe on the device (see
+        :func:`bead_recipes`).
+    '''
+    return recipe_widget(aremote, 'wash_to_beads', default_pulses=20)
 
 
 def pump_lysate_to_beads_widget(aremote, valves, pumps):
-    valve_configs = [(valves['16-1'], 0),
-                       (valves['16-2'], 0)]
-    pump = pumps['16-3']
-    return valved_pump_widget(aremote, valve_configs, pump, default_pulses=100)
+    '''
+    .. versionchanged:: 0.12.0
+        Run ``lysate_to_beads`` recipe on the device (see
+        :func:`bead_recipes`).
+    '''
+    return recipe_widget(aremote, 'lysate_to_beads', default_pulses=100)
 
 
 def pump_elution_to_beads_widget(aremote, valves, pumps):
-    valve_configs = [(valves['16-1'], 1),
-                     (valves['16-2'], 0)]
-    pump = pumps['16-3']
-    return valved_pump_widget(aremote, valve_configs, pump, default_pulses=100)
+    '''
+    .. versionchanged:: 0.12.0
+        Run ``elution_to_beads`` recipe on the device (see
+        :func:`bead_recipes`).
+    '''
+    return recipe_widget(aremote, 'elution_to_beads', default_pulses=100)
 
 
 def tasks_widget(aremote, pumps, valves):
+    '''
+    .. versionchanged:: 0.12.0
+        Store bead recipes on the device; each task runs as a recipe.
+    '''
+    save_recipes(aremote, bead_recipes(valves, pumps))
     pump_wash_to_beads_ui = pump_wash_to_beads_widget(aremote, valves, pumps)
     pump_lysate_to_beads_ui = pump_lysate_to_beads_widget(aremote, valves, pumps)
     pump_elution_to_beads_ui = pump_elution_to_beads_widget(aremote, valves, pumps)
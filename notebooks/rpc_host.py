@@ -1,16 +1,236 @@
 '''
 .. versionadded:: 0.11.0
 '''
+import array
 import asyncio
 import functools as ft
+import importlib.util
+import itertools as it
 import json
+import logging
 import os
 import pathlib
+import sys
+import threading
+import timeit
+
+
+def _load_device_module(name):
+    '''Load module from the device application directory (i.e., ``app``).
+
+    .. versionadded:: 0.12.0
+    '''
+    path = pathlib.Path(__file__).resolve().parents[1].joinpath('app',
+                                                                name + '.py')
+    spec = importlib.util.spec_from_file_location(name, str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Use the same message encoders as the device.
+framing = _load_device_module('framing')
+
+
+class BackgroundTcpAsync:
+    '''TCP connection to device RPC server (see ``rpc.server()`` on device).
+
+    Drop-in replacement for ``asyncserial.BackgroundSerialAsync``, e.g.:
+
+        adevice = BackgroundTcpAsync('192.168.1.50', 5000)
+        aremote = AsyncRemote(adevice, pipelined=True)
+
+    The connection is served by an event loop running in a background thread
+    (:attr:`loop`).  The ``read*()`` and ``write()`` coroutines may be awaited
+    from any event loop.
+
+    .. versionadded:: 0.12.0
+    '''
+    def __init__(self, host, port=5000):
+        loop_started = threading.Event()
+
+        def start():
+            self.loop = asyncio.new_event_loop()
+            self.loop.call_soon(loop_started.set)
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=start)
+        self.thread.daemon = True
+        self.thread.start()
+        loop_started.wait()
+
+        self.reader, self.writer = asyncio.run_coroutine_threadsafe(
+            asyncio.open_connection(host, port), self.loop).result()
+
+    def _run(self, coro):
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro,
+                                                                    self.loop))
+
+    async def _write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def write(self, data):
+        return self._run(self._write(data))
+
+    def read(self, n=-1):
+        return self._run(self.reader.read(n))
+
+    def read_exactly(self, n):
+        return self._run(self.reader.readexactly(n))
+
+    def readline(self):
+        return self._run(self.reader.readline())
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class RemoteTask:
+    '''Handle to a task started on the device with ``create_task()``.
+
+    For :class:`AsyncRemote`, each method returns a coroutine, e.g.,
+    ``await task.result()``.
+
+    .. versionadded:: 0.12.0
+    '''
+    def __init__(self, remote, handle):
+        self.remote = remote
+        self.handle = handle
+
+    def status(self):
+        '''Return dictionary with ``status`` (``'running'``, ``'done'``,
+        ``'cancelled'`` or ``'error'``) and ``result`` or ``error``.'''
+        return self.remote.call('__status__', self.handle)
+
+    def cancel(self):
+        '''Request cancellation; returns ``False`` if already finished.'''
+        return self.remote.call('__cancel__', self.handle)
+
+    def result(self, timeout_ms=None):
+        '''Wait for task to finish and return its result.'''
+        return self.remote.await_('__join__', self.handle, timeout_ms)
+
+    def __repr__(self):
+        return '<RemoteTask %s>' % self.handle
+
+
+class Batch:
+    '''Collect calls and send them to the device in a single request.
+
+    Calls are executed on the device in order.  Use as a context manager
+    (``with`` for :class:`Remote`, ``async with`` for :class:`AsyncRemote`);
+    collected calls are sent on exit.  Each ``call``/``await_``/``create_task``
+    method returns the index of the corresponding entry in :attr:`results`.
+
+    If ``stop_on_error`` is set, calls following the first failed call are
+    skipped and a ``RuntimeError`` is raised on exit.  Otherwise, each failed
+    call has a ``RuntimeError`` in its place in :attr:`results`.
+
+    .. versionadded:: 0.12.0
+    '''
+    def __init__(self, remote, stop_on_error=True):
+        self.remote = remote
+        self.stop_on_error = stop_on_error
+        self.calls = []
+        self.results = None
+
+    def _add(self, base_message, command, *args, **kwargs):
+        self.calls.append(self.remote._message(base_message, command, args,
+                                               kwargs))
+        return len(self.calls) - 1
+
+    def call(self, command, *args, **kwargs):
+        return self._add({}, command, *args, **kwargs)
+
+    def await_(self, command, *args, **kwargs):
+        return self._add({'async': True}, command, *args, **kwargs)
+
+    def create_task(self, command, *args, **kwargs):
+        '''Note that the corresponding entry in :attr:`results` is the task
+        handle (see :class:`RemoteTask`).'''
+        return self._add({'async': 'task'}, command, *args, **kwargs)
+
+    def _send(self):
+        calls, self.calls = self.calls, []
+        return self.remote._base_call({'calls': calls,
+                                       'stop_on_error': self.stop_on_error},
+                                      '__batch__')
+
+    def _set_results(self, responses):
+        self.results = [RuntimeError('Error: `%s`' % r['error'])
+                        if 'error' in r else r['result'] for r in responses]
+        errors = [r for r in self.results if isinstance(r, RuntimeError)]
+        if errors and self.stop_on_error:
+            raise errors[0]
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._set_results(self._send())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._set_results(await self._send())
 
 
 class RemoteBase:
+    '''
+    .. versionchanged:: 0.12.0
+        Add :attr:`framing` attribute; see ``negotiate()`` method of
+        :class:`Remote` and :class:`AsyncRemote`.
+
+        Add :attr:`opcodes` attribute; see ``describe()`` method of
+        :class:`Remote` and :class:`AsyncRemote`.
+
+        Add :meth:`subscribe` and :meth:`on` to receive events pushed by the
+        device.
+    '''
     def __init__(self, device):
         self.device = device
+        self.framing = framing.JsonLines
+        # Opcode of each registered device command (cached by `describe()`).
+        self.opcodes = None
+        self._event_handlers = []
+
+    def _message(self, base_message, command, args, kwargs):
+        '''Build request message.
+
+        Registered commands are sent by opcode (if the opcode table has been
+        cached).  Any other command string is flagged to be evaluated on the
+        device (slow path).
+
+        .. versionadded:: 0.12.0
+        '''
+        message = base_message.copy()
+        if self.opcodes is not None and command in self.opcodes:
+            command = self.opcodes[command]
+        elif not command.startswith('__'):
+            message['eval'] = True
+        message['command'] = command
+        if args:
+            message['args'] = args
+        if kwargs:
+            message['kwargs'] = kwargs
+        return message
+
+    def _encode(self, message):
+        data = self.framing.dumps(message)
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        return data
 
     def _base_call(self, base_message, command, *args, **kwargs):
         raise NotImplementedError
@@ -24,37 +244,332 @@ class RemoteBase:
     def create_task(self, command, *args, **kwargs):
         return self._base_call({'async': 'task'}, command, *args, **kwargs)
 
+    def subscribe(self, *prefixes):
+        '''Select events pushed by the device, by event name prefix.
+
+        For example, ``subscribe('pump.')`` selects ``pump.start``,
+        ``pump.pulse`` and ``pump.done`` events; ``'*'`` selects all events.
+        Call without arguments to unsubscribe from all events.
+
+        .. versionadded:: 0.12.0
+        '''
+        return self.call('__subscribe__', list(prefixes))
+
+    def on(self, prefix, callback):
+        '''Call ``callback(name, data)`` for each received event matching
+        name prefix.
+
+        Returns
+        -------
+        tuple
+            Handler, which may be passed to :meth:`off`.
+
+
+        .. versionadded:: 0.12.0
+        '''
+        handler = (prefix, callback)
+        self._event_handlers.append(handler)
+        return handler
+
+    def off(self, handler):
+        '''.. versionadded:: 0.12.0'''
+        self._event_handlers.remove(handler)
+
+    def _dispatch_event(self, message):
+        name = message['event']
+        for prefix, callback in list(self._event_handlers):
+            if prefix == '*' or name.startswith(prefix):
+                try:
+                    callback(name, message.get('data'))
+                except Exception:
+                    logging.exception('Error handling event `%s`', name)
+
+    def batch(self, stop_on_error=True):
+        '''Return context manager to send several calls in one request.
+
+        See :class:`Batch`.
+
+        .. versionadded:: 0.12.0
+        '''
+        return Batch(self, stop_on_error=stop_on_error)
+
 
 class Remote(RemoteBase):
+    def _read_message(self):
+        if self.framing is framing.LengthPrefixed:
+            header = self.device.read(2)
+            return framing.unpackb(self.device.read((header[0] << 8) |
+                                                    header[1]))
+        return json.loads(self.device.readline())
+
+    def _read_response(self):
+        '''Read next reply, dispatching any events received before it.
+
+        .. versionadded:: 0.12.0
+        '''
+        while True:
+            message = self._read_message()
+            if 'event' not in message:
+                return message
+            self._dispatch_event(message)
+
     def _base_call(self, base_message, command, *args, **kwargs):
-        message = base_message.copy()
-        message.update({'command': command, 'args': args,
-                        'kwargs': kwargs})
-        self.device.write(json.dumps(message).encode('utf8') + b'\r\n')
-        response = json.loads(self.device.readline())
+        message = self._message(base_message, command, args, kwargs)
+        self.device.write(self._encode(message))
+        response = self._read_response()
         if 'error' in response:
             raise RuntimeError('Error: `%s`' % response['error'])
         return response['result']
 
+    def create_task(self, command, *args, **kwargs):
+        '''
+        .. versionchanged:: 0.12.0
+            Return :class:`RemoteTask`.
+        '''
+        return RemoteTask(self, super().create_task(command, *args,
+                                                    **kwargs))
+
+    def describe(self):
+        '''Fetch and cache opcode of each registered device command.
+
+        Returns
+        -------
+        dict
+            Mapping from command name to opcode.
+
+
+        .. versionadded:: 0.12.0
+        '''
+        self.opcodes = self.call('__describe__')
+        return self.opcodes
+
+    def negotiate(self, name='msgpack'):
+        '''Select message framing, falling back to JSON lines.
+
+        Must be called before any other calls are made.
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of framing (see ``framing.FRAMINGS``).
+
+        Returns
+        -------
+        str
+            Name of selected framing.
+
+
+        .. versionadded:: 0.12.0
+        '''
+        try:
+            self.framing = framing.FRAMINGS[self.call('__framing__', name)]
+        except RuntimeError:
+            # Device does not support requested framing.
+            self.framing = framing.JsonLines
+        return self.framing.name
+
 
 class AsyncRemote(RemoteBase):
-    def __init__(self, *args, **kwargs):
+    '''
+    .. versionchanged:: 0.12.0
+        Add pipelined mode (see :meth:`__init__`).
+
+        Add :meth:`events` async iterator.  Note that events are only
+        received while a reply is being read, unless in pipelined mode (where
+        replies and events are read continuously in the background).
+    '''
+    def __init__(self, device, pipelined=False, window=8):
+        '''
+        Parameters
+        ----------
+        device : asyncserial.BackgroundSerialAsync
+            Asynchronous serial device.
+        pipelined : bool, optional
+            If ``True``, tag each request with an ``id`` and allow up to
+            :data:`window` requests to be outstanding at once.  Replies are
+            read by a single background task and matched to their request by
+            ``id``, so they may arrive in any order.
+
+            Otherwise, serialize calls such that only a single request is
+            outstanding at any time.
+        window : int, optional
+            Maximum number of outstanding requests in pipelined mode.
+
+
+        .. versionchanged:: 0.12.0
+            Add ``pipelined`` and ``window`` arguments.
+        '''
         self.lock = asyncio.Lock()
-        super().__init__(*args, **kwargs)
+        self.pipelined = pipelined
+        self.window = window
+        self._ids = it.count(1)
+        self._pending = {}
+        self._window = None
+        self._write_lock = None
+        self._reader = None
+        super().__init__(device)
 
     async def _base_call(self, base_message, command, *args, **kwargs):
-        message = base_message.copy()
-        message.update({'command': command, 'args': args,
-                        'kwargs': kwargs})
-        with await self.lock:
-            await self.device.write(json.dumps(message).encode('utf8') +
-                                    b'\r\n')
-            response_bytes = await self.device.readline()
-            response = json.loads(response_bytes.decode('utf8'))
+        message = self._message(base_message, command, args, kwargs)
+        if self.pipelined:
+            response = await self._pipelined_call(message)
+        else:
+            async with self.lock:
+                await self.device.write(self._encode(message))
+                response = await self._read_response()
         if 'error' in response:
             raise RuntimeError('Error: `%s`' % response['error'])
         return response['result']
 
+    async def _read_message(self):
+        '''
+        .. versionadded:: 0.12.0
+        '''
+        if self.framing is framing.LengthPrefixed:
+            header = await self.device.read_exactly(2)
+            payload = await self.device.read_exactly((header[0] << 8) |
+                                                     header[1])
+            return framing.unpackb(payload)
+        response_bytes = await self.device.readline()
+        return json.loads(response_bytes.decode('utf8'))
+
+    async def describe(self):
+        '''Fetch and cache opcode of each registered device command.
+
+        Returns
+        -------
+        dict
+            Mapping from command name to opcode.
+
+
+        .. versionadded:: 0.12.0
+        '''
+        self.opcodes = await self.call('__describe__')
+        return self.opcodes
+
+    async def create_task(self, command, *args, **kwargs):
+        '''
+        .. versionchanged:: 0.12.0
+            Return :class:`RemoteTask`.
+        '''
+        return RemoteTask(self, await super().create_task(command, *args,
+                                                          **kwargs))
+
+    async def _read_response(self):
+        '''Read next reply, dispatching any events received before it.
+
+        .. versionadded:: 0.12.0
+        '''
+        while True:
+            message = await self._read_message()
+            if 'event' not in message:
+                return message
+            self._dispatch_event(message)
+
+    async def events(self, prefix='*'):
+        '''Iterate over received events matching name prefix.
+
+        Yields
+        ------
+        tuple
+            Event name and data.
+
+
+        .. versionadded:: 0.12.0
+        '''
+        queue = asyncio.Queue()
+        handler = self.on(prefix, lambda name, data:
+                          queue.put_nowait((name, data)))
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.off(handler)
+
+    async def negotiate(self, name='msgpack'):
+        '''Select message framing, falling back to JSON lines.
+
+        Must be called before any other calls are made.
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of framing (see ``framing.FRAMINGS``).
+
+        Returns
+        -------
+        str
+            Name of selected framing.
+
+
+        .. versionadded:: 0.12.0
+        '''
+        if self._reader is not None:
+            raise RuntimeError('Framing must be negotiated before any '
+                               'pipelined calls are made.')
+        message = {'command': '__framing__', 'args': [name]}
+        if self.pipelined:
+            message['id'] = next(self._ids)
+        async with self.lock:
+            await self.device.write(self._encode(message))
+            response = await self._read_response()
+        if 'error' in response:
+            # Device does not support requested framing.
+            self.framing = framing.JsonLines
+        else:
+            self.framing = framing.FRAMINGS[response['result']]
+        return self.framing.name
+
+    async def _pipelined_call(self, message):
+        '''Send request and wait for the reply with the matching ``id``.
+
+        .. versionadded:: 0.12.0
+        '''
+        if self._window is None:
+            # Create primitives lazily so they bind to the device event loop.
+            self._window = asyncio.Semaphore(self.window)
+            self._write_lock = asyncio.Lock()
+        async with self._window:
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.ensure_future(self._read_replies())
+            request_id = next(self._ids)
+            message['id'] = request_id
+            future = asyncio.get_event_loop().create_future()
+            self._pending[request_id] = future
+            try:
+                async with self._write_lock:
+                    await self.device.write(self._encode(message))
+                return await future
+            finally:
+                self._pending.pop(request_id, None)
+
+    async def _read_replies(self):
+        '''Read replies and resolve the future of the matching request.
+
+        .. versionadded:: 0.12.0
+        '''
+        try:
+            while True:
+                try:
+                    response = await self._read_message()
+                except ValueError as exception:
+                    logging.warning('Invalid reply: `%s`', exception)
+                    continue
+                if 'event' in response:
+                    self._dispatch_event(response)
+                    continue
+                future = self._pending.get(response.get('id'))
+                if future is None:
+                    logging.warning('Unexpected reply: `%s`', response)
+                elif not future.done():
+                    future.set_result(response)
+        except Exception as exception:
+            # Propagate read errors to all outstanding requests.
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(exception)
+            raise
+
     async def flush(self):
         while True:
             data = await self.device.read(1024)
@@ -74,6 +589,10 @@ class AsyncRemote(RemoteBase):
         except Exception:
             pass
 
+        # Device restarts with JSON framing and a new opcode table.
+        self.framing = framing.JsonLines
+        self.opcodes = None
+
         # Wait for device to reboot.
         print('Wait for device to reboot.')
         await asyncio.sleep(delay)
@@ -172,3 +691,155 @@ class AsyncRemote(RemoteBase):
 
         asyncio.run_coroutine_threadsafe(refresh_remote_tree(), loop)
         return widget
+
+
+def framing_report(messages=None, baudrate=115200, number=1000):
+    '''Compare size and cost of JSON lines and binary framing of messages.
+
+    Parameters
+    ----------
+    messages : list[dict], optional
+        Request messages.  By default, use typical pump and valve calls.
+    baudrate : int, optional
+        UART baud rate, used to compute transmission time (10 bits per byte).
+    number : int, optional
+        Number of repetitions used to time encoding and decoding on the host.
+
+    Returns
+    -------
+    list[dict]
+        One record per message, containing the encoded size in bytes, the
+        transmission time in milliseconds and the host encode/decode time in
+        microseconds for each framing.
+
+
+    .. versionadded:: 0.12.0
+    '''
+    if messages is None:
+        messages = [{'command': 'motor_ctrl.pump', 'args': [16, 2, 25],
+                     'kwargs': {'on_ms': 150, 'off_ms': 850},
+                     'async': 'task', 'id': 1},
+                    {'command': 'motor_ctrl.set_direction',
+                     'args': [16, 1, True], 'kwargs': {}, 'id': 2},
+                    {'command': 'gc.collect', 'args': [], 'kwargs': {},
+                     'id': 3},
+                    {'result': None, 'id': 2},
+                    {'result': 104976, 'id': 3}]
+
+    records = []
+    for message in messages:
+        record = {'message': message}
+        for framing_ in (framing.JsonLines, framing.LengthPrefixed):
+            data = framing_.dumps(message)
+            if isinstance(data, str):
+                data = data.encode('utf8')
+            if framing_ is framing.LengthPrefixed:
+                decode = ft.partial(framing.unpackb, data[2:])
+            else:
+                decode = ft.partial(json.loads, data)
+            encode_us = (timeit.timeit(ft.partial(framing_.dumps, message),
+                                       number=number) / number * 1e6)
+            decode_us = timeit.timeit(decode, number=number) / number * 1e6
+            record[framing_.name] = {'bytes': len(data),
+                                     'wire_ms': len(data) * 10e3 / baudrate,
+                                     'encode_us': encode_us,
+                                     'decode_us': decode_us}
+        records.append(record)
+    return records
+
+
+class Program:
+    '''Pulse program, compiled on the host and run on the device.
+
+    Each step sets outputs of one board and then waits; the program is sent
+    to the device once and run by the ``program.run`` command (see
+    ``app/program.py``), so step timing does not depend on host round trips.
+
+    Example:
+
+        program = Program()
+        program.set(15, 0, True)          # switch valve
+        program.pump(16, 2, 10, on_ms=50, off_ms=150)
+        program.set(15, 0, False)
+        result = await aremote.await_('program.run', program.encode(aremote))
+
+
+    .. versionadded:: 0.12.0
+    '''
+    #: Duration flag: step duration is in microseconds.
+    US = 0x8000
+    #: Maximum duration of a single step (in either unit).
+    MAX_DURATION = 0x7fff
+
+    def __init__(self):
+        self.steps = array.array('H')
+
+    def __len__(self):
+        return len(self.steps) // 2
+
+    def write(self, address, mask, values, duration_ms=0, duration_us=None):
+        '''Append step setting outputs of a board.
+
+        Parameters
+        ----------
+        address : int
+            I2C address of board.
+        mask : int
+            Outputs to set (bit ``i`` selects output ``i``); 0 to only wait.
+        values : int
+            Output values (bit ``i`` is the value of output ``i``).
+        duration_ms, duration_us : int, optional
+            Time until the next step (``duration_us`` takes precedence).
+            Long durations are split into additional wait steps.
+        '''
+        if not 0 <= address <= 0xff or not 0 <= mask <= 0xf:
+            raise ValueError('invalid address or mask')
+        if duration_us is not None:
+            duration, flag = duration_us, self.US
+        else:
+            duration, flag = duration_ms, 0
+        word = (address << 8) | (mask << 4) | (values & mask)
+        while True:
+            chunk = min(duration, self.MAX_DURATION)
+            self.steps.extend((word, chunk | flag))
+            duration -= chunk
+            if duration <= 0:
+                break
+            # Continue waiting.
+            word = 0
+        return self
+
+    def wait(self, duration_ms=0, duration_us=None):
+        '''Append step that only waits.'''
+        return self.write(0, 0, 0, duration_ms=duration_ms,
+                          duration_us=duration_us)
+
+    def set(self, address, index, value, duration_ms=0, duration_us=None):
+        '''Append step setting a single output (e.g., a valve).'''
+        bit = 1 << index
+        return self.write(address, bit, bit if value else 0,
+                          duration_ms=duration_ms, duration_us=duration_us)
+
+    def pump(self, address, index, pulses, on_ms=50, off_ms=150):
+        '''Append pulse train on output (as ``motor_ctrl.pump``).'''
+        for i in range(pulses):
+            self.set(address, index, True, duration_ms=on_ms)
+            self.set(address, index, False, duration_ms=off_ms)
+        return self
+
+    def tobytes(self):
+        '''Return program words as little-endian bytes.'''
+        steps = array.array('H', self.steps)
+        if sys.byteorder != 'little':
+            steps.byteswap()
+        return steps.tobytes()
+
+    def encode(self, remote=None):
+        '''Return program as argument of ``program.run``.
+
+        Bytes are returned if the remote uses binary framing; otherwise (JSON
+        framing), a list of words.
+        '''
+        if remote is not None and remote.framing is framing.LengthPrefixed:
+            return self.tobytes()
+        return self.steps.tolist()
@@ -0,0 +1,130 @@
+'''
+Run device code (``app/`` and ``lib/``) under CPython.
+
+Call :func:`install` before importing any device module.  It puts stand-ins
+for MicroPython-only modules (``utime``, ``utimeq``, ``ucollections``, ...)
+and the device ``lib``/``app`` directories on ``sys.path``, and adapts the
+bundled ``uasyncio`` to CPython generators and coroutines.
+
+Device code runs in real time; see :mod:`sim.virtual` to run it against a
+virtual clock instead (e.g., to run long pump protocols instantly).
+'''
+import pathlib
+import sys
+import types
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SIM_DIR = pathlib.Path(__file__).resolve().parent / 'modules'
+
+CO_GENERATOR = 0x20
+CO_ITERABLE_COROUTINE = 0x100
+
+
+class SimTask:
+    '''Generator-like wrapper adding MicroPython ``pend_throw()`` semantics.
+
+    ``pend_throw(value)`` stores ``value`` (returning the previous pending
+    value).  On next resume, a pending exception is thrown into the
+    coroutine; ``None``/``False`` are cleared without effect.
+    '''
+    def __init__(self, coro):
+        self.coro = coro
+        self.pending = None
+
+    def pend_throw(self, value):
+        previous, self.pending = self.pending, value
+        return previous
+
+    def send(self, value):
+        pending, self.pending = self.pending, None
+        if isinstance(pending, BaseException) or \
+                (isinstance(pending, type) and
+                 issubclass(pending, BaseException)):
+            return self.coro.throw(pending)
+        return self.coro.send(value)
+
+    def __next__(self):
+        return self.send(None)
+
+    def __iter__(self):
+        return self
+
+    def throw(self, *args):
+        return self.coro.throw(*args)
+
+    def close(self):
+        return self.coro.close()
+
+    def __repr__(self):
+        return '<SimTask %r>' % self.coro
+
+
+def task(coro):
+    return coro if isinstance(coro, SimTask) else SimTask(coro)
+
+
+def _iterable_coroutine(code):
+    '''Flag generator code (and nested generator code) as awaitable.'''
+    consts = tuple(_iterable_coroutine(c) if isinstance(c, types.CodeType)
+                   else c for c in code.co_consts)
+    flags = code.co_flags
+    if flags & CO_GENERATOR:
+        flags |= CO_ITERABLE_COROUTINE
+    return code.replace(co_flags=flags, co_consts=consts)
+
+
+def adapt(module):
+    '''Make generator-based coroutines of module awaitable from ``async def``
+    code, as they are in MicroPython.'''
+    for value in list(vars(module).values()):
+        functions = []
+        if isinstance(value, types.FunctionType) and \
+                value.__module__ == module.__name__:
+            functions.append(value)
+        elif isinstance(value, type) and value.__module__ == module.__name__:
+            functions.extend(v for v in vars(value).values()
+                             if isinstance(v, types.FunctionType))
+        for function in functions:
+            function.__code__ = _iterable_coroutine(function.__code__)
+
+
+def _patch_uasyncio():
+    import uasyncio
+    import uasyncio.core as core
+    import uasyncio.queues as queues
+    import uasyncio.synchro as synchro
+
+    for module in (core, synchro, queues, uasyncio):
+        adapt(module)
+    core.SleepMs.__await__ = core.SleepMs.__iter__
+    core.type_gen = (SimTask, types.GeneratorType, types.CoroutineType)
+
+    class SimEventLoop(uasyncio.PollEventLoop):
+        def create_task(self, coro, high=False):
+            coro = task(coro)
+            super().create_task(coro, high)
+            return coro
+
+        def call_soon(self, callback, *args):
+            if isinstance(callback, (types.GeneratorType,
+                                     types.CoroutineType)):
+                callback = SimTask(callback)
+            return super().call_soon(callback, *args)
+
+        def call_at_(self, time, callback, args=()):
+            if isinstance(callback, (types.GeneratorType,
+                                     types.CoroutineType)):
+                callback = SimTask(callback)
+            return super().call_at_(time, callback, args)
+
+    core._event_loop_class = SimEventLoop
+    uasyncio.SimEventLoop = SimEventLoop
+    return SimEventLoop
+
+
+def install(app=True):
+    for path in (SIM_DIR, ROOT / 'lib') + ((ROOT / 'app', ) if app else ()):
+        if str(path) not in sys.path:
+            sys.path.insert(0, str(path))
+    return _patch_uasyncio()
@@ -0,0 +1,206 @@
+'''
+Virtual ESP32: serve the device RPC interface over a pseudo-terminal.
+
+Runs the device application (``app/rpc.py``, ``app/motor.py``,
+``app/pump.py``, ...) under CPython, with motor boards on a simulated I2C
+bus, and the RPC UART (UART 2 on the device) exposed as a pseudo-terminal
+(see the ``machine`` stand-in in ``sim/modules``).  For example:
+
+    $ python -m sim.device --boards 16 17 --latency-us 200 --link /tmp/esp32
+    UART 2: /dev/pts/3 (/tmp/esp32)
+
+The host then opens the pseudo-terminal as it would the serial port of the
+device, e.g.:
+
+    >>> adevice = BackgroundSerialAsync(port='/tmp/esp32', baudrate=115200)
+    >>> aremote = AsyncRemote(adevice)
+
+Device files (``config.json``, recipes, ...) are stored in the directory
+given by ``--root`` (default: a new temporary directory).  ``machine.reset``
+restarts the emulator, keeping the same pseudo-terminal.
+
+In addition to the commands of the device (see ``app/commands.py``), the
+emulator registers:
+
+ - ``sim.boards``: output state and write count of each simulated board;
+ - ``sim.edges``: recorded output changes of a board, as
+   ``[ticks_us, outputs]`` pairs;
+ - ``sim.configure``: change I2C latency and error rate.
+'''
+import argparse
+import gc
+import os
+import sys
+import tempfile
+
+from . import install, ROOT
+
+
+#: Value returned by ``gc.mem_free()`` (CPython has no fixed heap).
+MEM_FREE = 100000
+#: Heap size, for ``gc.mem_alloc()``.
+HEAP_SIZE = 111168
+
+
+def _patch_gc():
+    # MicroPython-only `gc` functions.
+    threshold = [-1]
+
+    def gc_threshold(amount=None):
+        if amount is None:
+            return threshold[0]
+        threshold[0] = amount
+
+    gc.mem_free = lambda: MEM_FREE
+    gc.mem_alloc = lambda: HEAP_SIZE - MEM_FREE
+    gc.threshold = gc_threshold
+
+
+def _device_loop(SimEventLoop):
+    import machine
+    import micropython
+
+    class DeviceEventLoop(SimEventLoop):
+        '''Event loop running ``micropython.schedule()`` callbacks (e.g., of
+        :class:`machine.Timer`), checked at least every millisecond while
+        a timer is armed.
+        '''
+        def wait(self, delay):
+            micropython.run_scheduled()
+            if (machine.Timer.ARMED or micropython.SCHEDULED) and \
+                    (delay < 0 or delay > 1):
+                delay = 1
+            super().wait(delay)
+            micropython.run_scheduled()
+
+    return DeviceEventLoop
+
+
+def _sim_commands(registry):
+    import machine
+
+    def boards():
+        return {address: device.state()
+                for address, device in machine.I2C.DEVICES.items()}
+
+    def edges(address, clear=False):
+        device = machine.I2C.DEVICES[address]
+        result = [[ticks, outputs] for ticks, outputs in device.edges]
+        if clear:
+            del device.edges[:]
+        return result
+
+    def configure(latency_us=None, error_rate=None):
+        if latency_us is not None:
+            machine.I2C.LATENCY_US = latency_us
+        if error_rate is not None:
+            machine.I2C.ERROR_RATE = error_rate
+        return {'latency_us': machine.I2C.LATENCY_US,
+                'error_rate': machine.I2C.ERROR_RATE}
+
+    registry.register('sim.boards', boards)
+    registry.register('sim.edges', edges)
+    registry.register('sim.configure', configure)
+
+
+def boot(link=None, tcp_port=None):
+    '''Start device application (see ``main.main()`` on the device).
+
+    Objects are set up from ``config.json`` as on the device (see
+    ``app/wiring.py``).
+
+    Serves RPC requests on UART 2 (and on ``tcp_port``, if specified) until
+    interrupted.
+    '''
+    from machine import UART
+    import commands
+    import config
+    import gcpolicy
+    import machine
+    import motor
+    import program
+    import recipes
+    import rpc
+    import util
+    import wiring
+
+    gcpolicy.configure(**config.CONFIG.get('gc', {}))
+
+    uart = UART(2, baudrate=115200)
+    if link is not None:
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(uart.port, link)
+    print('UART 2: %s%s' % (uart.port, '' if link is None
+                             else ' (%s)' % link), flush=True)
+    uart_areader, uart_awriter = wiring.uart_streams(uart)
+    i2c = wiring.i2c_bus()
+    motor_ctrl = wiring.motor_control(i2c)
+
+    context = {'i2c': i2c, 'motor_ctrl': motor_ctrl, 'uart': uart,
+               'wlan': None, 'config': config, 'gc': gc, 'machine': machine,
+               'motor': motor, 'program': program, 'recipes': recipes,
+               'util': util}
+
+    registry = rpc.REGISTRY
+    commands.register_commands(motor_ctrl, i2c, registry)
+    _sim_commands(registry)
+
+    loop = wiring.event_loop()
+    if tcp_port is not None:
+        wiring.start_tcp_server(loop, '127.0.0.1', tcp_port)
+
+    loop.run_until_complete(rpc.rpc(uart_areader, uart_awriter,
+                                    context=context))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='python -m sim.device',
+                                     description=__doc__.split('\n\n')[0])
+    parser.add_argument('--boards', type=int, nargs='*', default=[16, 17],
+                        help='I2C addresses of motor boards')
+    parser.add_argument('--latency-us', type=int, default=100,
+                        help='fixed time per I2C transaction (in addition '
+                        'to clocking bytes at the bus frequency)')
+    parser.add_argument('--error-rate', type=float, default=0.,
+                        help='probability that an I2C transaction fails')
+    parser.add_argument('--root', help='device file system directory')
+    parser.add_argument('--link', help='create symbolic link to UART '
+                        'pseudo-terminal')
+    parser.add_argument('--tcp', type=int, metavar='PORT',
+                        help='also serve RPC over TCP on localhost')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    argv = list(sys.argv[1:] if args is None else args)
+    args = parse_args(argv)
+    root = args.root or tempfile.mkdtemp(prefix='esp32-')
+    os.chdir(root)
+
+    SimEventLoop = install()
+    _patch_gc()
+    import machine
+    import uasyncio.core
+
+    uasyncio.core._event_loop_class = _device_loop(SimEventLoop)
+    for address in args.boards:
+        machine.I2C.DEVICES[address] = machine.MotorBoard()
+    machine.I2C.LATENCY_US = args.latency_us
+    machine.I2C.ERROR_RATE = args.error_rate
+    # Restart in the same directory, after `machine.reset()`.
+    if not args.root:
+        argv += ['--root', root]
+    paths = os.environ.get('PYTHONPATH', '').split(os.pathsep)
+    if str(ROOT) not in paths:
+        os.environ['PYTHONPATH'] = os.pathsep.join([str(ROOT)] +
+                                                   list(filter(None, paths)))
+    machine.RESTART_ARGS = [sys.executable, '-m', 'sim.device'] + argv
+    try:
+        boot(link=args.link, tcp_port=args.tcp)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
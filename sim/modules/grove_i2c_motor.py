@@ -0,0 +1,14 @@
+'''Stand-in for ``grove_i2c_motor`` driver, writing to a (fake) I2C bus.'''
+IN1 = 0x01
+IN2 = 0x02
+IN3 = 0x04
+IN4 = 0x08
+
+
+class BaseDriver:
+    def __init__(self, i2c, addr):
+        self.i2c = i2c
+        self.addr = addr
+
+    def digital_write(self, pin, value):
+        self.i2c.writeto(self.addr, bytes([pin, 1 if value else 0]))
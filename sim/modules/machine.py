@@ -0,0 +1,293 @@
+'''
+Stand-in for MicroPython ``machine`` module (see :mod:`sim.device`).
+
+ - :class:`I2C`: bus shared by simulated :class:`MotorBoard` devices (see
+   :data:`I2C.DEVICES`), with a configurable latency per transaction;
+ - :class:`UART`: pseudo-terminal, opened by the host as it would the serial
+   port of the device;
+ - :class:`Timer`: fires callbacks from a background thread;
+ - :func:`reset`: restarts the process (keeping UART pseudo-terminals).
+'''
+import errno
+import os
+import random
+import sys
+import threading
+import tty
+
+import utime
+
+
+#: Environment variable passing UART file descriptors across :func:`reset`.
+UART_FDS = 'SIM_MACHINE_UART_FDS'
+#: Command line run by :func:`reset` (default: same as current process).
+RESTART_ARGS = None
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = 0 if value is None else value
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def __repr__(self):
+        return 'Pin(%s)' % self.id
+
+
+class MotorBoard:
+    '''Grove I2C motor driver, as seen by ``grove_i2c_motor`` and
+    ``motor.Board`` writes.
+
+    Records the time (``utime.ticks_us()``) and state of each change of
+    its outputs.
+    '''
+    PINS = (0x01, 0x02, 0x04, 0x08)
+    DIRECTION_SET = 0xaa
+
+    def __init__(self):
+        self.outputs = [0] * len(self.PINS)
+        self.writes = 0
+        #: ``(ticks_us, outputs)`` after each change of outputs.
+        self.edges = []
+
+    def write(self, data):
+        self.writes += 1
+        outputs = list(self.outputs)
+        if len(data) == 3 and data[0] == self.DIRECTION_SET:
+            # Set all outputs at once.
+            for i in range(len(outputs)):
+                outputs[i] = 1 if data[1] & (1 << i) else 0
+        elif len(data) == 2 and data[0] in self.PINS:
+            outputs[self.PINS.index(data[0])] = 1 if data[1] else 0
+        if outputs != self.outputs:
+            self.outputs = outputs
+            self.edges.append((utime.ticks_us(), outputs))
+
+    def state(self):
+        return {'outputs': self.outputs, 'writes': self.writes,
+                'edges': len(self.edges)}
+
+
+class I2C:
+    '''I2C bus.
+
+    Each transaction takes :attr:`LATENCY_US`, plus the time to clock the
+    address and data bytes (9 bits each) at the bus frequency, and fails
+    (``OSError(ENODEV)``, as for a missing device) with probability
+    :attr:`ERROR_RATE`.
+    '''
+    #: Fixed time taken by each transaction (us).
+    LATENCY_US = 100
+    #: Probability that a transaction fails.
+    ERROR_RATE = 0.
+    #: Devices on the bus, by address (shared by all instances).
+    DEVICES = {}
+
+    def __init__(self, id=-1, scl=None, sda=None, freq=400000):
+        self.init(scl=scl, sda=sda, freq=freq)
+
+    def init(self, scl=None, sda=None, freq=400000):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+
+    def _transaction(self, address, size):
+        utime.sleep_us(self.LATENCY_US +
+                       (size + 1) * 9 * 1000000 // self.freq)
+        device = self.DEVICES.get(address)
+        if device is None or (self.ERROR_RATE and
+                              random.random() < self.ERROR_RATE):
+            raise OSError(errno.ENODEV)
+        return device
+
+    def scan(self):
+        return sorted(self.DEVICES)
+
+    def writeto(self, address, buf, stop=True):
+        device = self._transaction(address, len(buf))
+        if buf:
+            device.write(bytes(buf))
+        return len(buf)
+
+    def readfrom(self, address, nbytes, stop=True):
+        self._transaction(address, nbytes)
+        return bytes(nbytes)
+
+    def readfrom_into(self, address, buf, stop=True):
+        self._transaction(address, len(buf))
+        buf[:] = bytes(len(buf))
+
+    def writeto_mem(self, address, memaddr, buf, addrsize=8):
+        device = self._transaction(address, len(buf) + 1)
+        device.write(bytes([memaddr]) + bytes(buf))
+
+    def readfrom_mem(self, address, memaddr, nbytes, addrsize=8):
+        self._transaction(address, nbytes + 1)
+        return bytes(nbytes)
+
+    def readfrom_mem_into(self, address, memaddr, buf, addrsize=8):
+        self._transaction(address, len(buf) + 1)
+        buf[:] = bytes(len(buf))
+
+
+class UART:
+    '''UART, backed by a pseudo-terminal.
+
+    The host opens :attr:`port` (e.g., using ``serial.Serial``).  Writes
+    are not throttled to the baud rate.
+    '''
+    #: Open UARTs, by id (kept open across :func:`reset`).
+    OPEN = {}
+
+    def __init__(self, id, baudrate=115200, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        if id in self.OPEN:
+            self.master, self.slave = self.OPEN[id]
+        else:
+            self.master, self.slave = _inherited_fds().get(id) or \
+                os.openpty()
+            # Keep slave open, so reads of master do not fail while the host
+            # has the port closed.
+            tty.setraw(self.slave)
+            os.set_blocking(self.master, False)
+            self.OPEN[id] = (self.master, self.slave)
+        #: Path of pseudo-terminal.
+        self.port = os.ttyname(self.slave)
+
+    def init(self, baudrate=115200, **kwargs):
+        self.baudrate = baudrate
+
+    def fileno(self):
+        return self.master
+
+    def any(self):
+        return 0
+
+    def read(self, n=-1):
+        try:
+            return os.read(self.master, n if n > 0 else 4096)
+        except BlockingIOError:
+            return None
+
+    def readinto(self, buf, n=-1):
+        data = self.read(n if n > 0 else len(buf))
+        if data is None:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        line = b''
+        while not line.endswith(b'\n'):
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+        return line or None
+
+    def write(self, buf, off=0, sz=-1):
+        if isinstance(buf, str):
+            buf = buf.encode('utf8')
+        data = memoryview(buf)[off:] if sz < 0 else \
+            memoryview(buf)[off:off + sz]
+        try:
+            return os.write(self.master, data)
+        except BlockingIOError:
+            return None
+
+    def close(self):
+        # Pseudo-terminal stays open (see `OPEN`).
+        pass
+
+
+def _inherited_fds():
+    fds = {}
+    for entry in filter(None, os.environ.get(UART_FDS, '').split(';')):
+        id, master, slave = (int(value) for value in entry.split(','))
+        fds[id] = (master, slave)
+    return fds
+
+
+class Timer:
+    '''Hardware timer stand-in; callbacks run on a background thread (i.e.,
+    like interrupt handlers, they should only ``micropython.schedule()``
+    work).
+
+    Runs in real time; ``sim.virtual.install()`` replaces it with
+    ``sim.virtual.Timer``, driven by the virtual clock.
+    '''
+    ONE_SHOT = 0
+    PERIODIC = 1
+    #: Armed timers.
+    ARMED = set()
+
+    def __init__(self, id=-1):
+        self.id = id
+        self._thread = None
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        if freq is not None:
+            period = 1000 // freq
+        self.deinit()
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+        self._start()
+
+    def _start(self):
+        self.ARMED.add(self)
+        self._thread = threading.Timer(self.period * 1e-3, self._fire)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _fire(self):
+        self.ARMED.discard(self)
+        if self.mode == self.PERIODIC:
+            self._start()
+        if self.callback is not None:
+            self.callback(self)
+
+    def deinit(self):
+        if self._thread is not None:
+            self._thread.cancel()
+            self._thread = None
+        self.ARMED.discard(self)
+
+
+def reset():
+    '''Restart process with the same arguments (UARTs stay open).'''
+    fds = []
+    for id, (master, slave) in UART.OPEN.items():
+        os.set_inheritable(master, True)
+        os.set_inheritable(slave, True)
+        fds.append('%d,%d,%d' % (id, master, slave))
+    os.environ[UART_FDS] = ';'.join(fds)
+    sys.stdout.flush()
+    args = RESTART_ARGS or [sys.executable] + sys.argv
+    os.execv(args[0], args)
+
+
+def unique_id():
+    return b'\x24\x0a\xc4\x00\x00\x01'
+
+
+def freq():
+    return 240000000
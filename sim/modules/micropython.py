@@ -0,0 +1,26 @@
+'''Stand-in for MicroPython ``micropython`` module.'''
+import collections
+
+
+def const(value):
+    return value
+
+
+#: Callbacks scheduled by :func:`schedule`, run by :func:`run_scheduled`.
+SCHEDULED = collections.deque()
+
+
+def schedule(func, arg):
+    if len(SCHEDULED) >= 8:
+        raise RuntimeError('schedule queue full')
+    SCHEDULED.append((func, arg))
+
+
+def run_scheduled():
+    while SCHEDULED:
+        func, arg = SCHEDULED.popleft()
+        func(arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
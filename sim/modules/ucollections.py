@@ -0,0 +1,35 @@
+'''Stand-in for MicroPython ``ucollections`` module.'''
+import collections as _collections
+
+from collections import OrderedDict, namedtuple
+
+
+class deque:
+    '''Bounded deque; raises ``IndexError`` on overflow if ``flags`` is set.
+
+    (Without ``flags``, MicroPython silently drops the oldest item.)
+    '''
+    def __init__(self, iterable, maxlen, flags=0):
+        self.maxlen = maxlen
+        self.flags = flags
+        self.items = _collections.deque()
+        for item in iterable:
+            self.append(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def append(self, item):
+        if len(self.items) >= self.maxlen:
+            if self.flags:
+                raise IndexError('full')
+            self.items.popleft()
+        self.items.append(item)
+
+    def popleft(self):
+        if not self.items:
+            raise IndexError('empty')
+        return self.items.popleft()
@@ -0,0 +1,2 @@
+'''Stand-in for MicroPython ``uerrno`` module.'''
+from errno import *
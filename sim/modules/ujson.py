@@ -0,0 +1,10 @@
+'''Stand-in for MicroPython ``ujson`` module (``loads`` accepts buffers).'''
+import json as _json
+
+from json import dumps, dump, load
+
+
+def loads(data):
+    if isinstance(data, (memoryview, bytearray)):
+        data = bytes(data)
+    return _json.loads(data)
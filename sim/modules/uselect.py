@@ -0,0 +1,38 @@
+'''Stand-in for MicroPython ``uselect`` module (``poll`` only).'''
+import select as _select
+
+from select import POLLIN, POLLOUT, POLLHUP, POLLERR
+
+
+class poll:
+    def __init__(self):
+        self._poll = _select.poll()
+        self._objects = {}
+
+    def register(self, obj, eventmask=POLLIN | POLLOUT):
+        fd = obj.fileno()
+        if fd in self._objects:
+            self._poll.modify(fd, eventmask)
+        else:
+            self._poll.register(fd, eventmask)
+        self._objects[fd] = obj
+
+    def modify(self, obj, eventmask):
+        self._poll.modify(obj.fileno(), eventmask)
+
+    def unregister(self, obj):
+        fd = obj.fileno()
+        if self._objects.pop(fd, None) is not None:
+            self._poll.unregister(fd)
+
+    def poll(self, timeout=-1):
+        return [(self._objects[fd], event)
+                for fd, event in self._poll.poll(timeout)]
+
+    def ipoll(self, timeout=-1, flags=0):
+        result = self.poll(timeout)
+        if flags & 1:
+            # One-shot: disable object until registered (or modified) again.
+            for obj, event in result:
+                self._poll.modify(obj.fileno(), 0)
+        return result
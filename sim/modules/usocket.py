@@ -0,0 +1,49 @@
+'''Stand-in for MicroPython ``usocket`` module, with stream methods.'''
+import socket as _socket
+
+from socket import (getaddrinfo, AF_INET, SOCK_STREAM, SOL_SOCKET,
+                    SO_REUSEADDR)
+
+
+class socket(_socket.socket):
+    '''Socket with MicroPython stream methods (``read``, ``write``, ...).
+
+    In non-blocking mode, reads return ``None`` if no data is available.
+    '''
+    def accept(self):
+        fd, address = self._accept()
+        return socket(self.family, self.type, self.proto, fileno=fd), address
+
+    def read(self, n=-1):
+        try:
+            return self.recv(n if n > 0 else 4096)
+        except BlockingIOError:
+            return None
+
+    def readinto(self, buf, n=-1):
+        try:
+            return self.recv_into(buf, n if n > 0 else 0)
+        except BlockingIOError:
+            return None
+
+    def readline(self):
+        line = b''
+        while not line.endswith(b'\n'):
+            try:
+                data = self.recv(1)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            line += data
+        return line or None
+
+    def write(self, buf, off=0, sz=-1):
+        if isinstance(buf, str):
+            buf = buf.encode('utf8')
+        data = memoryview(buf)[off:] if sz < 0 else \
+            memoryview(buf)[off:off + sz]
+        try:
+            return self.send(data)
+        except BlockingIOError:
+            return None
@@ -0,0 +1,58 @@
+'''
+Stand-in for MicroPython ``utime`` module.
+
+Time is read from :data:`CLOCK`, which may be replaced by a virtual clock
+(see :class:`sim.virtual.VirtualClock`).
+'''
+import time as _time
+
+TICKS_PERIOD = 1 << 30
+_TICKS_HALF = TICKS_PERIOD // 2
+
+
+class MonotonicClock:
+    def us(self):
+        return int(_time.monotonic() * 1e6)
+
+    def sleep_us(self, us):
+        if us > 0:
+            _time.sleep(us * 1e-6)
+
+
+CLOCK = MonotonicClock()
+
+
+def ticks_us():
+    return CLOCK.us() & (TICKS_PERIOD - 1)
+
+
+def ticks_ms():
+    return (CLOCK.us() // 1000) & (TICKS_PERIOD - 1)
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & (TICKS_PERIOD - 1)
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALF) & (TICKS_PERIOD - 1)) - _TICKS_HALF
+
+
+def sleep_ms(ms):
+    CLOCK.sleep_us(ms * 1000)
+
+
+def sleep_us(us):
+    CLOCK.sleep_us(us)
+
+
+def sleep(seconds):
+    CLOCK.sleep_us(int(seconds * 1e6))
+
+
+def time():
+    return int(_time.time())
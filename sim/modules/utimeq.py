@@ -0,0 +1,42 @@
+'''Stand-in for MicroPython ``utimeq`` module.'''
+import utime
+
+
+class utimeq:
+    def __init__(self, size):
+        self.size = size
+        self.entries = []
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def push(self, time, callback, args):
+        if len(self.entries) >= self.size:
+            raise IndexError('queue overflow')
+        self.entries.append((time, self.counter, callback, args))
+        self.counter += 1
+
+    def _first(self):
+        if not self.entries:
+            raise IndexError('empty heap')
+        # Order by time (with wrap-around), then by insertion order.
+        first = self.entries[0]
+        for entry in self.entries[1:]:
+            diff = utime.ticks_diff(entry[0], first[0])
+            if diff < 0 or (diff == 0 and entry[1] < first[1]):
+                first = entry
+        return first
+
+    def peektime(self):
+        return self._first()[0]
+
+    def pop(self, result):
+        first = self._first()
+        self.entries.remove(first)
+        result[0] = first[0]
+        result[1] = first[2]
+        result[2] = first[3]
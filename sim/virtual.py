@@ -0,0 +1,201 @@
+'''
+Virtual time for simulated device code.
+
+:func:`install` replaces the ``utime`` clock with a :class:`VirtualClock` and
+makes ``uasyncio.get_event_loop()`` return a :class:`VirtualEventLoop`.
+Instead of sleeping, the loop advances the clock to the next scheduled task
+(or :class:`Timer` callback), so long protocols run in milliseconds of wall
+time, and the time of each step is exact.  ``machine.Timer`` is replaced by
+:class:`Timer`.
+
+    >>> from sim import virtual
+    >>> clock = virtual.install()
+    >>> import pump
+    >>> virtual.run(pump.pump(i2c, 16, 1, 125, on_ms=1000, off_ms=124000))
+    >>> clock.ms()
+    15625000
+
+Reading the clock advances it by ``read_us`` (default: 1 us), so that busy
+waits (e.g., ``while utime.ticks_diff(deadline, utime.ticks_us()) > 0``)
+terminate.
+'''
+from . import install as _install
+
+
+class VirtualClock:
+    '''Clock advanced only explicitly (and by ``read_us`` on each read).
+
+    Parameters
+    ----------
+    start_us : int, optional
+        Initial time (in microseconds).
+    read_us : int, optional
+        Time taken by each read of the clock (in microseconds).
+    '''
+    def __init__(self, start_us=0, read_us=1):
+        self.now = start_us
+        self.read_us = read_us
+        #: Armed timers (see :class:`Timer`).
+        self.timers = []
+
+    def us(self):
+        self.now += self.read_us
+        return self.now
+
+    def ms(self):
+        return self.now // 1000
+
+    def sleep_us(self, us):
+        if us > 0:
+            self.advance(us)
+
+    def advance(self, us):
+        '''Advance time, firing any timers that become due on the way.'''
+        end = self.now + us
+        while True:
+            timer = self.next_timer()
+            if timer is None or timer.due > end:
+                break
+            self.now = max(self.now, timer.due)
+            timer.fire()
+        self.now = max(self.now, end)
+
+    def next_timer(self):
+        '''Return armed timer due first (or ``None``).'''
+        first = None
+        for timer in self.timers:
+            if first is None or timer.due < first.due:
+                first = timer
+        return first
+
+
+#: Clock installed by :func:`install`.
+CLOCK = None
+
+
+class Timer:
+    '''Stand-in for ``machine.Timer``, driven by the virtual clock.
+
+    Callbacks are called when the clock reaches their due time, i.e., while
+    the event loop waits, or during ``utime.sleep_*()``.
+    '''
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, clock=None):
+        self.id = id
+        self.clock = CLOCK if clock is None else clock
+        self.due = None
+        self.callback = None
+        self.mode = None
+        self.period = None
+        #: Number of callbacks fired.
+        self.count = 0
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        if freq is not None:
+            period = 1000 // freq
+        self.deinit()
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+        self.due = self.clock.now + period * 1000
+        self.clock.timers.append(self)
+
+    def deinit(self):
+        if self in self.clock.timers:
+            self.clock.timers.remove(self)
+        self.due = None
+
+    def fire(self):
+        if self.mode == self.PERIODIC:
+            self.due += self.period * 1000
+        else:
+            self.deinit()
+        self.count += 1
+        if self.callback is not None:
+            self.callback(self)
+        # Callbacks are run "from interrupt"; run what they scheduled.
+        import micropython
+        micropython.run_scheduled()
+
+
+def install(app=True, start_us=0, read_us=1):
+    '''Install simulator with a virtual clock.
+
+    Returns
+    -------
+    VirtualClock
+        Clock read by ``utime`` (also available as :data:`CLOCK`).
+    '''
+    global CLOCK
+
+    SimEventLoop = _install(app)
+    import machine
+    import micropython
+    import utime
+    import uasyncio.core as core
+
+    class VirtualEventLoop(SimEventLoop):
+        '''Event loop advancing the virtual clock instead of sleeping.
+
+        Registered streams (e.g., sockets) are polled without blocking, and
+        only waited for (in real time) if nothing else is scheduled.
+        '''
+        def wait(self, delay):
+            micropython.run_scheduled()
+            if self.objmap:
+                queued = len(self.runq) + len(self.hiq)
+                super().wait(0)
+                if len(self.runq) + len(self.hiq) > queued:
+                    return
+            if delay == 0:
+                return
+            clock = utime.CLOCK
+            # Wake up at the start of the millisecond the next task is due,
+            # or when the next timer fires (whichever is first).
+            end = (clock.ms() + delay) * 1000 if delay > 0 else None
+            timer = clock.next_timer()
+            if timer is not None and (end is None or timer.due < end):
+                end = timer.due
+            if end is not None:
+                clock.advance(end - clock.now)
+            elif self.objmap:
+                super().wait(-1)
+            else:
+                raise RuntimeError('event loop has nothing to wait for')
+
+    core._event_loop_class = VirtualEventLoop
+    # Hardware timers (e.g., of the pulse engine) also run on virtual time.
+    machine.Timer = Timer
+    CLOCK = VirtualClock(start_us, read_us)
+    utime.CLOCK = CLOCK
+    return CLOCK
+
+
+def reset(start_us=0):
+    '''Reset clock, and discard event loop (and all of its tasks).'''
+    import uasyncio.core as core
+
+    CLOCK.now = start_us
+    del CLOCK.timers[:]
+    core._event_loop = None
+
+
+def run(coro, **loop_args):
+    '''Run coroutine to completion on the (virtual) event loop.
+
+    Returns
+    -------
+    object
+        Return value of coroutine.
+    '''
+    import uasyncio
+
+    result = []
+
+    async def main():
+        result.append(await coro)
+
+    uasyncio.get_event_loop(**loop_args).run_until_complete(main())
+    return result[0]
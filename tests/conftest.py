@@ -0,0 +1,40 @@
+'''
+Device code runs under CPython against a virtual clock (see
+:mod:`sim.virtual`); each test starts at time 0 on a fresh event loop.
+
+Motor boards are simulated on the I2C bus of the ``machine`` stand-in (see
+``sim/modules/machine.py``).
+'''
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from sim import virtual  # noqa: E402
+
+virtual.install()
+
+
+@pytest.fixture
+def clock():
+    virtual.reset()
+    yield virtual.CLOCK
+    virtual.reset()
+
+
+@pytest.fixture
+def i2c(clock):
+    '''I2C bus with motor boards at addresses 16 and 17.'''
+    import machine
+
+    devices = dict(machine.I2C.DEVICES)
+    latency_us, error_rate = machine.I2C.LATENCY_US, machine.I2C.ERROR_RATE
+    machine.I2C.DEVICES.clear()
+    machine.I2C.DEVICES.update({16: machine.MotorBoard(),
+                                17: machine.MotorBoard()})
+    yield machine.I2C(freq=400000)
+    machine.I2C.DEVICES.clear()
+    machine.I2C.DEVICES.update(devices)
+    machine.I2C.LATENCY_US, machine.I2C.ERROR_RATE = latency_us, error_rate
@@ -0,0 +1,31 @@
+import gc
+
+import machine
+import pytest
+
+import commands
+import i2cbus
+import motor
+import rpc
+
+
+@pytest.mark.parametrize('engine', [True, False])
+def test_register_commands(i2c, engine, monkeypatch):
+    # MicroPython-only `gc` functions (see `sim.device`).
+    monkeypatch.setattr(gc, 'mem_free', lambda: 0, raising=False)
+    monkeypatch.setattr(gc, 'mem_alloc', lambda: 0, raising=False)
+    bus = i2cbus.Bus(machine.Pin(22), machine.Pin(23), freq=400000)
+    motor_ctrl = motor.GroveMotorControl(bus, engine=engine)
+    registry = rpc.Registry()
+    commands.register_commands(motor_ctrl, bus, registry)
+    names = registry.describe()
+    # Opcodes follow registration order.
+    assert sorted(names, key=names.get)[:3] == ['motor_ctrl.pump',
+                                               'motor_ctrl.set_direction',
+                                               'motor_ctrl.state']
+    assert ('pulse.stats' in names) == engine
+    for name in ('program.run', 'recipes.run', 'i2c.scan', 'gc.collect',
+                 'util.exists', 'machine.reset', 'gcpolicy.stats'):
+        assert name in names
+    assert registry.lookup('i2c.scan')() == [16, 17]
+    assert registry.lookup('motor_ctrl.health')() == []
@@ -0,0 +1,109 @@
+import pytest
+import uasyncio as asyncio
+import utime
+
+from sim import virtual
+
+
+def _spinner(order, deadline_us):
+    async def spin():
+        # Yield until deadline (as the pulse engine runner does for
+        # sub-millisecond waits).
+        while utime.ticks_diff(deadline_us, utime.ticks_us()) > 0:
+            order.append('high')
+            await asyncio.sleep_ms(0)
+    return spin()
+
+
+def _worker(order, steps):
+    async def work():
+        for i in range(steps):
+            order.append('best-effort')
+            await asyncio.sleep_ms(0)
+    return work()
+
+
+def test_high_priority_yield_holds_off_best_effort_tasks(clock):
+    order = []
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        loop.create_task(_worker(order, 3))
+        loop.create_task(_spinner(order, 500), high=True)
+        await asyncio.sleep_ms(10)
+
+    virtual.run(main())
+    # Best-effort task only runs once the spinning task is done, i.e., for
+    # up to the time left to its deadline.
+    spins = order.index('best-effort')
+    assert spins > 1
+    assert order == ['high'] * spins + ['best-effort'] * 3
+
+
+def test_high_priority_task_runs_first_on_wake_up(clock):
+    order = []
+
+    async def high():
+        await asyncio.sleep_ms(5)
+        order.append(('high', utime.ticks_ms()))
+
+    async def busy():
+        while utime.ticks_ms() < 10:
+            clock.sleep_us(300)
+            order.append(('best-effort', utime.ticks_ms()))
+            await asyncio.sleep_ms(0)
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        loop.create_task(busy())
+        loop.create_task(high(), high=True)
+        await asyncio.sleep_ms(20)
+
+    virtual.run(main())
+    woken = order.index(('high', 5))
+    # Woken in the millisecond it is due, ahead of the busy task.
+    assert order[woken - 1][1] == 5 and order[woken + 1][1] <= 5
+
+
+def _noop():
+    pass
+
+
+def test_queues_grow_up_to_max_len(clock):
+    async def main():
+        loop = asyncio.get_event_loop()
+        sizes = []
+        # Wait queue: 4 -> 8 -> 10 (not limited to powers of 2 of the
+        # initial size).
+        for i in range(10):
+            loop.call_later_ms(100, _noop)
+            sizes.append(loop.waitq_len)
+        assert loop.grown == 2
+        with pytest.raises(IndexError, match='waitq overflow'):
+            loop.call_later_ms(100, _noop)
+        assert len(loop.waitq) == loop.waitq_len == 10
+        # Run queue (and high-priority queue) grow alike; callbacks take 2
+        # entries (with their arguments).
+        for i in range(5):
+            loop.call_soon(_noop)
+        with pytest.raises(IndexError, match='runq overflow'):
+            loop.call_soon(_noop)
+        assert loop.runq_len == 10 and loop.grown == 4
+        assert loop.queue_report()['grown'] == 4
+        return sizes
+
+    sizes = virtual.run(main(), runq_len=4, waitq_len=4, grow=True,
+                        max_len=10)
+    assert sizes == [4] * 4 + [8] * 4 + [10] * 2
+
+
+def test_queue_overflow_without_grow(clock):
+    async def main():
+        loop = asyncio.get_event_loop()
+        for i in range(4):
+            loop.call_later_ms(100, _noop)
+        with pytest.raises(IndexError, match='waitq overflow'):
+            loop.call_later_ms(100, _noop)
+        assert loop.waitq_len == 4 and loop.grown == 0
+
+    virtual.run(main(), runq_len=4, waitq_len=4)
@@ -0,0 +1,131 @@
+import json
+import socket
+import struct
+
+import pytest
+import uasyncio as asyncio
+import usocket
+
+import framing
+from sim import virtual
+
+
+MESSAGES = [{'result': None, 'id': 2},
+            {'command': 3, 'args': [16, 2, 125], 'kwargs': {'on_ms': 50}},
+            {'error': 'unknown command: `café`', 'command': 'café'},
+            [1.5, -3, True, 'x' * 300]]
+
+
+@pytest.mark.parametrize('framing_', [framing.JsonLines,
+                                      framing.LengthPrefixed])
+@pytest.mark.parametrize('message', MESSAGES)
+def test_dump_into_matches_dumps(framing_, message):
+    buf = bytearray(b'\xff' * 512)
+    end = framing_.dump_into(message, buf, 5)
+    expected = framing_.dumps(message)
+    if isinstance(expected, str):
+        expected = expected.encode('utf8')
+    assert bytes(buf[5:end]) == expected
+    # Nothing written outside of message.
+    assert buf[:5] == b'\xff' * 5 and buf[end:] == b'\xff' * (512 - end)
+
+
+def test_json_lines_dump_into_appends_line_terminator():
+    buf = bytearray(64)
+    end = framing.JsonLines.dump_into({'result': [15, 16]}, buf, 0)
+    assert buf[end - 2:end] == b'\r\n'
+    assert json.loads(bytes(buf[:end])) == {'result': [15, 16]}
+
+
+@pytest.mark.parametrize('framing_', [framing.JsonLines,
+                                      framing.LengthPrefixed])
+def test_dump_into_full_buffer(framing_):
+    message = {'result': 'x' * 100}
+    size = len(framing.JsonLines.dumps(message).encode('utf8'))
+    buf = bytearray(size + 10)
+    with pytest.raises(IndexError):
+        framing_.dump_into(message, buf, 20)
+    # The terminator must fit, too.
+    with pytest.raises(IndexError):
+        framing.JsonLines.dump_into(message, bytearray(size - 1), 0)
+
+
+@pytest.mark.parametrize('value', [
+    None, True, False, 0, 0x7f, 0x80, 0xff, 0x100, 0xffff, 0x10000,
+    0xffffffff, -1, -0x20, -0x21, -0x80, -0x81, -0x8000, -0x8001,
+    -0x80000000, 1.5, -0.25, '', 'x' * 0x1f, 'x' * 0x20, 'x' * 0x100,
+    'café', b'', b'\x00\xff', bytes(0x100), [], list(range(0x10)),
+    [None, [1, [2, 'a']], {'b': b'c'}], {}, {'x%d' % i: i for i in range(16)},
+    {'command': 3, 'args': [16, 2, 125], 'kwargs': {'on_ms': 50}}])
+def test_unpackb_round_trip(value):
+    assert framing.unpackb(framing.packb(value)) == value
+
+
+def test_packb_encodings():
+    assert framing.packb(5) == b'\x05'
+    assert framing.packb(-3) == b'\xfd'
+    assert framing.packb(200) == b'\xcc\xc8'
+    assert framing.packb(-200) == b'\xd1\xff\x38'
+    assert framing.packb('ab') == b'\xa2ab'
+    assert framing.packb((1, 2)) == b'\x92\x01\x02'
+    assert framing.packb({'a': None}) == b'\x81\xa1a\xc0'
+    # Tuples are unpacked as lists.
+    assert framing.unpackb(framing.packb((1, (2, )))) == [1, [2]]
+    # 32-bit floats (not produced by `packb()`).
+    assert framing.unpackb(b'\xca' + struct.pack('>f', 0.5)) == 0.5
+
+
+def test_pack_errors():
+    with pytest.raises(ValueError, match='out of range'):
+        framing.packb(1 << 32)
+    with pytest.raises(ValueError, match='out of range'):
+        framing.packb(-(1 << 31) - 1)
+    with pytest.raises(TypeError):
+        framing.packb(object())
+    with pytest.raises(ValueError, match='0xc1'):
+        framing.unpackb(b'\xc1')
+
+
+def _reader(*chunks):
+    '''Return stream reader of chunks (followed by end of stream).'''
+    a, b = socket.socketpair()
+    for chunk in chunks:
+        a.sendall(chunk)
+    a.close()
+    b.setblocking(False)
+    return asyncio.StreamReader(usocket.socket(fileno=b.detach()))
+
+
+def test_length_prefixed_read(clock):
+    messages = MESSAGES + [{'result': b'\x00' * 300}]
+    areader = _reader(b''.join(framing.LengthPrefixed.dumps(message)
+                               for message in messages))
+    buf = bytearray(512)
+
+    async def main():
+        received = []
+        while True:
+            message = await framing.LengthPrefixed.read(areader, buf)
+            if message is None:
+                return received
+            received.append(message)
+
+    assert virtual.run(main()) == messages
+
+
+def test_length_prefixed_read_message_too_large(clock):
+    areader = _reader(framing.LengthPrefixed.dumps({'result': 'x' * 100}),
+                      framing.LengthPrefixed.dumps({'result': 'ok'}),
+                      b'\x00\x05ab')
+    buf = bytearray(64)
+
+    async def main():
+        with pytest.raises(ValueError, match='too large'):
+            await framing.LengthPrefixed.read(areader, buf)
+        # Payload of large message was discarded.
+        assert (await framing.LengthPrefixed.read(areader, buf) ==
+                {'result': 'ok'})
+        # Truncated message.
+        assert await framing.LengthPrefixed.read(areader, buf) is None
+
+    virtual.run(main())
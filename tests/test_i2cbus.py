@@ -0,0 +1,84 @@
+import errno
+import json
+
+import machine
+import pytest
+
+import config
+import i2cbus
+from sim import virtual
+
+
+@pytest.fixture
+def bus(i2c):
+    return i2cbus.Bus(machine.Pin(22), machine.Pin(23), freq=400000)
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    '''Empty ``config.json`` settings, saved to a temporary directory.'''
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'CONFIG', {})
+    return tmp_path / 'config.json'
+
+
+def test_stats(bus):
+    assert bus.scan() == [16, 17]
+    bus.writeto(16, b'\x01\x01')
+    bus.writeto(16, b'\x01\x00')
+    with pytest.raises(OSError) as info:
+        bus.writeto(0x20, b'')
+    assert info.value.args[0] == errno.ENODEV
+    stats = bus.stats()
+    assert stats['freq'] == 400000
+    assert [(entry['address'], entry['transactions'], entry['errors'])
+            for entry in stats['addresses']] == [(16, 2, 0), (0x20, 1, 1)]
+    board_16 = stats['addresses'][0]
+    # Latency, and 3 bytes clocked at 400 kHz.
+    assert 167 <= board_16['mean_us'] <= board_16['max_us'] < 200
+    assert board_16['total_us'] >= 2 * 167
+    bus.reset()
+    assert bus.stats() == {'freq': 400000, 'addresses': []}
+
+
+def test_benchmark_selects_fastest_frequency(bus, settings, monkeypatch):
+    writeto = bus.i2c.writeto
+
+    def flaky_writeto(address, buf, stop=True):
+        # Transactions fail above 100 kHz.
+        if bus.i2c.freq > 100000:
+            raise OSError(errno.EIO)
+        return writeto(address, buf, stop)
+
+    monkeypatch.setattr(bus.i2c, 'writeto', flaky_writeto)
+    result = virtual.run(bus.benchmark(count=5))
+    assert result['selected'] == 100000
+    assert [(entry['freq'], entry['transactions'], entry['errors'])
+            for entry in result['results']] == [
+        (10000, 10, 0), (50000, 10, 0), (100000, 10, 0), (200000, 10, 10),
+        (400000, 10, 10)]
+    means = [entry['mean_us'] for entry in result['results'][:3]]
+    assert means == sorted(means, reverse=True)
+    assert bus.freq == bus.i2c.freq == 100000
+    assert json.loads(settings.read_text()) == {'i2c': {'freq': 100000}}
+    # Benchmark transactions are not counted.
+    assert bus.stats()['addresses'] == []
+
+
+def test_benchmark_all_errors(bus, settings):
+    result = virtual.run(bus.benchmark(freqs=[10000, 100000],
+                                       addresses=[0x20], count=2))
+    assert result['selected'] is None
+    assert [entry['errors'] for entry in result['results']] == [2, 2]
+    # Left at the current frequency; nothing saved.
+    assert bus.freq == bus.i2c.freq == 400000
+    assert not settings.exists()
+
+
+def test_benchmark_without_save(bus, settings):
+    result = virtual.run(bus.benchmark(freqs=[10000, 50000], count=1,
+                                       save=False))
+    assert result['selected'] == 50000
+    assert bus.freq == 50000
+    assert config.CONFIG == {}
+    assert not settings.exists()
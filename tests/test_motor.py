@@ -0,0 +1,140 @@
+import grove_i2c_motor as gm
+import machine
+import pytest
+import utime
+
+import motor
+
+
+class FlakyI2C(machine.I2C):
+    '''I2C bus on which the next :attr:`fail` transactions fail.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail = 0
+        #: ``(start_us, end_us)`` of each transaction.
+        self.transactions = []
+
+    def _transaction(self, address, size):
+        start = utime.ticks_us()
+        try:
+            device = super()._transaction(address, size)
+            if self.fail:
+                self.fail -= 1
+                raise OSError(5)
+            return device
+        finally:
+            self.transactions.append((start, utime.ticks_us()))
+
+
+@pytest.fixture
+def bus(i2c):
+    return FlakyI2C(freq=400000)
+
+
+def _board(bus, **options):
+    return motor.Board(bus, 16, (gm.IN1, gm.IN2, gm.IN3, gm.IN4), **options)
+
+
+def test_write_retried_with_doubling_backoff(bus):
+    board = _board(bus, retries=3, backoff_us=500)
+    bus.fail = 3
+    assert board.digital_write(gm.IN1, 1)
+    assert bus.DEVICES[16].outputs == [1, 0, 0, 0]
+    assert len(bus.transactions) == 4
+    gaps = [utime.ticks_diff(start, end) for (_, end), (start, _)
+            in zip(bus.transactions, bus.transactions[1:])]
+    # Backoff before each retry (plus a few clock reads).
+    for gap, backoff_us in zip(gaps, (500, 1000, 2000)):
+        assert backoff_us <= gap < backoff_us + 10
+    health = board.health()
+    assert health['state'] == motor.CLOSED
+    assert (health['writes'], health['errors'], health['retries'],
+            health['failures']) == (1, 3, 3, 0)
+    # Duration includes retries.
+    assert health['max_us'] > 3500
+
+
+def test_write_fails_after_retries(bus):
+    board = _board(bus, retries=2)
+    bus.fail = 10
+    with pytest.raises(OSError):
+        board.digital_write(gm.IN1, 1)
+    # First attempt and 2 retries.
+    assert len(bus.transactions) == 3
+    assert bus.DEVICES[16].outputs == [0, 0, 0, 0]
+    # Shadow state is only updated once a write succeeds.
+    assert board.outputs[0] is None
+    health = board.health()
+    assert health['state'] == motor.CLOSED
+    assert (health['writes'], health['errors'], health['retries'],
+            health['failures']) == (0, 3, 2, 1)
+
+
+def test_breaker_opens_after_max_failures(bus):
+    board = _board(bus, retries=1, max_failures=3, cooldown_ms=5000)
+    bus.fail = 2
+    with pytest.raises(OSError):
+        board.digital_write(gm.IN1, 1)
+    # A successful write resets the count of consecutive failures.
+    assert board.digital_write(gm.IN1, 1)
+    for i in range(3):
+        assert board.state == motor.CLOSED
+        bus.fail = 2
+        with pytest.raises(OSError):
+            board.digital_write(gm.IN2, 1)
+    assert board.state == motor.OPEN
+    assert board.health()['failures'] == 4
+
+
+def _open(bus, board):
+    bus.fail = board.max_failures * (board.retries + 1)
+    for i in range(board.max_failures):
+        with pytest.raises(OSError):
+            board.digital_write(gm.IN1, 1)
+    assert board.state == motor.OPEN
+    del bus.transactions[:]
+
+
+def test_open_breaker_rejects_writes(bus, clock):
+    board = _board(bus, max_failures=2, cooldown_ms=5000)
+    _open(bus, board)
+    clock.sleep_us(4990000)
+    start = utime.ticks_us()
+    with pytest.raises(OSError, match='circuit open'):
+        board.digital_write(gm.IN1, 1)
+    # The bus is not accessed.
+    assert bus.transactions == []
+    assert utime.ticks_diff(utime.ticks_us(), start) < 10
+    health = board.health()
+    assert health['state'] == motor.OPEN
+    assert health['rejected'] == 1
+
+
+def test_half_open_trial_closes_breaker(bus, clock):
+    board = _board(bus, max_failures=2, cooldown_ms=5000)
+    _open(bus, board)
+    clock.sleep_us(5000000)
+    assert board.digital_write(gm.IN1, 1)
+    assert len(bus.transactions) == 1
+    assert board.state == motor.CLOSED
+    assert board.consecutive == 0
+    assert bus.DEVICES[16].outputs == [1, 0, 0, 0]
+
+
+def test_half_open_trial_failure_reopens_breaker(bus, clock):
+    board = _board(bus, max_failures=2, cooldown_ms=5000)
+    _open(bus, board)
+    clock.sleep_us(5000000)
+    bus.fail = 1
+    with pytest.raises(OSError):
+        board.digital_write(gm.IN1, 1)
+    # Single trial write, without retries.
+    assert len(bus.transactions) == 1
+    assert board.state == motor.OPEN
+    # Cooldown restarts from the failed trial.
+    clock.sleep_us(4990000)
+    with pytest.raises(OSError, match='circuit open'):
+        board.digital_write(gm.IN1, 1)
+    clock.sleep_us(10000)
+    assert board.digital_write(gm.IN1, 1)
+    assert board.state == motor.CLOSED
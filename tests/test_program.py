@@ -0,0 +1,76 @@
+from array import array
+
+import pytest
+import uasyncio as asyncio
+import utime
+
+import motor
+import program
+import tasks
+from sim import virtual
+
+
+def _step(address, mask, values, duration):
+    return [address << 8 | mask << 4 | values, duration]
+
+
+#: Output 0 of board 16 on for 5 ms; outputs 0 and 1 of board 17 set to
+#: (0, 1) 500 us later, and both off after a wait-only step.  Each step
+#: is due (well) after the I2C write of the previous step.
+STEPS = (_step(16, 0x1, 0x1, 5) + _step(16, 0x1, 0x0, program.US | 500) +
+         _step(17, 0x3, 0x2, 10) + _step(0, 0, 0, 1) +
+         _step(17, 0x3, 0x0, 1))
+
+
+@pytest.mark.parametrize('encoding', ['list', 'array', 'bytes'])
+def test_run_steps_on_schedule(i2c, encoding):
+    steps = {'list': STEPS, 'array': array('H', STEPS),
+             'bytes': array('H', STEPS).tobytes()}[encoding]
+    interpreter = program.Interpreter(motor.GroveMotorControl(i2c))
+
+    async def main():
+        start = utime.ticks_us()
+        return start, await interpreter.run(steps)
+
+    start, result = virtual.run(main())
+    assert result['steps'] == 5
+    assert result['late_max_us'] < 10
+    expected = {16: [(0, [1, 0, 0, 0]), (5000, [0, 0, 0, 0])],
+                17: [(5500, [0, 1, 0, 0]), (16500, [0, 0, 0, 0])]}
+    for address, edges in expected.items():
+        board = i2c.DEVICES[address]
+        assert len(board.edges) == len(edges)
+        for (ticks, outputs), (due, expected_outputs) in zip(board.edges,
+                                                             edges):
+            assert outputs == expected_outputs
+            # Written within the bus latency of the deadline.
+            assert 0 <= utime.ticks_diff(ticks, start) - due < 500
+    # The run ends once the duration of the last step has elapsed.
+    assert utime.ticks_diff(utime.ticks_us(), start) >= 17500
+
+
+def test_odd_number_of_words(i2c):
+    interpreter = program.Interpreter(motor.GroveMotorControl(i2c))
+    with pytest.raises(ValueError, match='even number'):
+        virtual.run(interpreter.run(STEPS[:-1]))
+
+
+def test_cancel_turns_off_outputs(i2c):
+    motor_ctrl = motor.GroveMotorControl(i2c)
+    interpreter = program.Interpreter(motor_ctrl)
+    board = motor_ctrl.board(16)
+    # Output 3 was not turned on by the program, and is left on.
+    board.write(0x8, 0x8)
+
+    async def main():
+        handle = tasks.create(interpreter.run(_step(16, 0x5, 0x5, 100) +
+                                              _step(16, 0x5, 0x0, 0)))
+        await asyncio.sleep_ms(50)
+        assert i2c.DEVICES[16].outputs == [1, 0, 1, 1]
+        assert tasks.cancel(handle)
+        with pytest.raises(RuntimeError, match='cancelled'):
+            await tasks.join(handle)
+
+    virtual.run(main())
+    assert i2c.DEVICES[16].outputs == [0, 0, 0, 1]
+    assert utime.ticks_ms() < 100
@@ -0,0 +1,115 @@
+import machine
+import pytest
+import uasyncio as asyncio
+import utime
+
+import motor
+import tasks
+from sim import virtual
+
+
+def test_cancel_stops_run_at_once(i2c):
+    motor_ctrl = motor.GroveMotorControl(i2c)
+    board = i2c.DEVICES[16]
+
+    async def main():
+        handle = tasks.create(motor_ctrl.pump(16, 0, 125, on_ms=1000,
+                                              off_ms=124000))
+        await asyncio.sleep_ms(3000)
+        tasks.cancel(handle)
+        with pytest.raises(RuntimeError, match='cancelled'):
+            await tasks.join(handle)
+        return utime.ticks_ms()
+
+    assert virtual.run(main()) == 3000
+    assert board.outputs == [0, 0, 0, 0]
+    assert motor_ctrl.engine.channels == []
+    # On at 0 ms, off at 1000 ms, and nothing since.
+    assert [outputs for ticks, outputs in board.edges] == [[1, 0, 0, 0],
+                                                          [0, 0, 0, 0]]
+
+
+def test_board_error_ends_run_at_once(i2c):
+    motor_ctrl = motor.GroveMotorControl(i2c, retries=0)
+
+    async def main():
+        other = tasks.create(motor_ctrl.pump(17, 0, 3, on_ms=100,
+                                             off_ms=900))
+        run = tasks.create(motor_ctrl.pump(16, 0, 10, on_ms=100,
+                                           off_ms=900))
+        await asyncio.sleep_ms(150)
+        # Board 16 stops responding.
+        del i2c.DEVICES[16]
+        with pytest.raises(RuntimeError):
+            await tasks.join(run)
+        failed = utime.ticks_ms()
+        # The run on the other board goes on.
+        await tasks.join(other)
+        return failed, utime.ticks_ms()
+
+    # The failed write is the second pulse, at 1000 ms.
+    assert virtual.run(main()) == (1000, 3000)
+    assert motor_ctrl.engine.errors == 1
+
+
+def test_run_returns_edge_timing(i2c):
+    motor_ctrl = motor.GroveMotorControl(i2c)
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        # Other runs share the engine meanwhile.
+        for index in range(3):
+            loop.create_task(motor_ctrl.pump(16, index, 20, on_ms=10,
+                                             off_ms=40))
+        return await motor_ctrl.pump(17, 0, 10, on_ms=100, off_ms=400)
+
+    result = virtual.run(main())
+    assert set(result) == {'edges', 'late_edges', 'late_max_ms',
+                           'late_total_us', 'late_max_us'}
+    assert result['edges'] == 20
+    assert result['late_edges'] == result['late_max_ms'] == 0
+    assert 0 <= result['late_total_us'] <= 20 * result['late_max_us']
+    assert result['late_max_us'] < 1000
+    assert motor_ctrl.engine.edges == 3 * 40 + 20
+
+
+def test_timer_mode_runs_on_virtual_clock(i2c):
+    # As configured by `main.py` (`"pulse": {"timer": 0}`).
+    timer = machine.Timer(0)
+    assert isinstance(timer, virtual.Timer)
+    motor_ctrl = motor.GroveMotorControl(i2c, timer=timer)
+    board = i2c.DEVICES[16]
+
+    result = virtual.run(motor_ctrl.pump(16, 0, 25, on_ms=100, off_ms=900))
+    assert result['edges'] == 50
+    assert motor_ctrl.engine.stats()['mode'] == 'timer'
+    assert timer.count > 0 and timer.due is None
+    # The run starts at 0; its first edge is applied at once.
+    for i, (ticks, outputs) in enumerate(board.edges):
+        n, value = divmod(i, 2)
+        expected = n * 1000000 + (100000 if value else 0)
+        # Written within the bus latency of the deadline.
+        assert 0 <= ticks - expected < 500, i
+
+
+@pytest.mark.parametrize('mask_write', [False, True])
+def test_tick_writes_per_board(i2c, mask_write):
+    motor_ctrl = motor.GroveMotorControl(i2c, mask_write=mask_write)
+    board = i2c.DEVICES[16]
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        for index in range(1, 3):
+            loop.create_task(motor_ctrl.pump(16, index, 5, on_ms=10,
+                                             off_ms=40))
+        await motor_ctrl.pump(16, 0, 5, on_ms=10, off_ms=40)
+
+    virtual.run(main())
+    engine = motor_ctrl.engine
+    assert engine.edges == 30
+    # Edges of the three channels are merged in (fewer) ticks.
+    assert engine.ticks < 15
+    assert board.outputs == [0, 0, 0, 0]
+    # One I2C transaction per board per tick, or one per changed output.
+    assert board.writes == engine.writes == (engine.ticks if mask_write
+                                             else 30)
@@ -0,0 +1,76 @@
+import grove_i2c_motor as gm
+import pytest
+import uasyncio as asyncio
+import utime
+
+import pump
+import tasks
+from sim import virtual
+
+
+def test_edges_on_schedule(i2c, clock):
+    board = i2c.DEVICES[16]
+    on_ms, off_ms = 50, 150
+
+    async def busy():
+        # Competing task, busy for 0.5 ms of each 1 ms.
+        while True:
+            clock.sleep_us(500)
+            await asyncio.sleep_ms(0)
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        loop.create_task(busy())
+        await asyncio.sleep_ms(3)
+        return await pump.pump(i2c, 16, gm.IN1, 125, on_ms=on_ms,
+                               off_ms=off_ms)
+
+    result = virtual.run(main())
+    assert result == {'late_edges': 0, 'late_max_ms': 0}
+    assert len(board.edges) == 2 * 125
+    # The first edge is written at the start of the run.
+    start = board.edges[0][0] // 1000
+    for i, (ticks, outputs) in enumerate(board.edges):
+        n, value = divmod(i, 2)
+        expected = start + n * (on_ms + off_ms) + (on_ms if value else 0)
+        # Written within the millisecond the edge is due.
+        assert utime.ticks_diff(ticks // 1000, expected) == 0, i
+        assert outputs == [0 if value else 1, 0, 0, 0]
+    assert utime.ticks_diff(utime.ticks_ms(), start) == 125 * (on_ms + off_ms)
+
+
+class _FailingDriver:
+    '''Driver that fails every write after the first ``ok`` writes.'''
+    def __init__(self, ok):
+        self.ok = ok
+        self.writes = []
+
+    def digital_write(self, pin, value):
+        self.writes.append(value)
+        if len(self.writes) > self.ok:
+            raise OSError(len(self.writes))
+
+
+def test_cleanup_error_keeps_original(clock, capsys):
+    # The 2nd write (output off) fails, and so does the cleanup write.
+    driver = _FailingDriver(1)
+    with pytest.raises(OSError) as info:
+        virtual.run(pump.pump(None, 16, gm.IN1, 3, driver=driver))
+    assert info.value.args == (2, )
+    assert driver.writes == [1, 0, 0]
+    assert 'error turning off pin' in capsys.readouterr().out
+
+
+def test_cleanup_on_cancel(clock):
+    driver = _FailingDriver(100)
+
+    async def main():
+        handle = tasks.create(pump.pump(None, 16, gm.IN1, 3, driver=driver))
+        await asyncio.sleep_ms(20)
+        assert tasks.cancel(handle)
+        with pytest.raises(RuntimeError, match='cancelled'):
+            await tasks.join(handle)
+
+    virtual.run(main())
+    # Cancelled mid-pulse: output is turned off.
+    assert driver.writes == [1, 0]
@@ -0,0 +1,91 @@
+import pytest
+import uasyncio as asyncio
+import utime
+from uasyncio.queues import Queue, QueueEmpty, QueueFull
+
+import tasks
+from sim import virtual
+
+
+def test_nowait():
+    queue = Queue(maxsize=2)
+    assert queue.empty() and not queue.full()
+    with pytest.raises(QueueEmpty):
+        queue.get_nowait()
+    queue.put_nowait('a')
+    queue.put_nowait('b')
+    assert queue.full() and queue.qsize() == 2
+    with pytest.raises(QueueFull):
+        queue.put_nowait('c')
+    assert [queue.get_nowait(), queue.get_nowait()] == ['a', 'b']
+    assert queue.empty()
+
+
+def test_get_waits_for_put(clock):
+    queue = Queue()
+    received = []
+
+    async def consumer():
+        for i in range(2):
+            received.append((await queue.get(), utime.ticks_ms()))
+
+    async def main():
+        asyncio.get_event_loop().create_task(consumer())
+        await asyncio.sleep_ms(10)
+        await queue.put('a')
+        await asyncio.sleep_ms(10)
+        queue.put_nowait('b')
+        await asyncio.sleep_ms(1)
+
+    virtual.run(main())
+    assert received == [('a', 10), ('b', 20)]
+    assert not queue.getters
+
+
+def test_put_waits_while_full(clock):
+    queue = Queue(maxsize=2)
+    put = []
+
+    async def producer():
+        for i in range(5):
+            await queue.put(i)
+            put.append((i, utime.ticks_ms()))
+
+    async def main():
+        asyncio.get_event_loop().create_task(producer())
+        received = []
+        for i in range(5):
+            await asyncio.sleep_ms(10)
+            # Refilled by the producer (until all items are put).
+            assert queue.qsize() == min(2, 5 - i)
+            received.append(await queue.get())
+        return received
+
+    # Items are received in order; each put waits until an item is taken
+    # (once the queue is full).
+    assert virtual.run(main()) == [0, 1, 2, 3, 4]
+    assert put == [(0, 0), (1, 0), (2, 10), (3, 20), (4, 30)]
+
+
+def test_cancel_waiting_getter(clock):
+    queue = Queue()
+    received = []
+
+    async def consumer(name):
+        received.append((name, await queue.get()))
+
+    async def main():
+        first = tasks.create(consumer('first'))
+        tasks.create(consumer('second'))
+        await asyncio.sleep_ms(10)
+        assert len(queue.getters) == 2
+        assert tasks.cancel(first)
+        with pytest.raises(RuntimeError, match='cancelled'):
+            await tasks.join(first)
+        # The cancelled task no longer waits; the item goes to the other.
+        assert len(queue.getters) == 1
+        queue.put_nowait('a')
+        await asyncio.sleep_ms(1)
+
+    virtual.run(main())
+    assert received == [('second', 'a')]
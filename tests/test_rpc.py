@@ -0,0 +1,237 @@
+import json
+import socket
+import struct
+
+import pytest
+import uasyncio as asyncio
+import utime
+
+import events
+import rpc
+from sim import virtual
+
+
+async def _slow(delay_ms, size=0):
+    await asyncio.sleep_ms(delay_ms)
+    return 'x' * size
+
+
+rpc.REGISTRY.register('test.slow', _slow)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _request(sock, command, *args, **message):
+    message.update({'command': command, 'args': list(args)})
+    sock.sendall(json.dumps(message).encode('utf8') + b'\r\n')
+
+
+async def _response(sock, timeout_ms=10000):
+    '''Read a single response line (without blocking the loop).'''
+    sock.setblocking(False)
+    deadline = utime.ticks_add(utime.ticks_ms(), timeout_ms)
+    line = b''
+    while not line.endswith(b'\n'):
+        try:
+            data = sock.recv(1 << 16, socket.MSG_PEEK)
+        except BlockingIOError:
+            assert utime.ticks_diff(deadline, utime.ticks_ms()) > 0, \
+                'no response'
+            await asyncio.sleep_ms(1)
+            continue
+        assert data, 'connection closed'
+        # Consume up to the end of the line (if received).
+        line += sock.recv(data.find(b'\n') + 1 or len(data))
+    return json.loads(line)
+
+
+@pytest.fixture
+def server(clock):
+    '''Start RPC server on loopback; return its port.'''
+    port = _free_port()
+    started = []
+
+    async def start():
+        asyncio.get_event_loop().create_task(
+            asyncio.start_server(rpc.server(), '127.0.0.1', port))
+        await asyncio.sleep_ms(1)
+        started.append(port)
+
+    virtual.run(start())
+    yield started[0]
+    del events.SUBSCRIBERS[:]
+
+
+@pytest.mark.parametrize('reset', [False, True])
+def test_client_lost_while_command_in_flight(server, reset):
+    async def main():
+        client = socket.create_connection(('127.0.0.1', server))
+        _request(client, '__subscribe__', ['test.'], id=1)
+        assert (await _response(client))['result'] == ['test.']
+        _request(client, 'test.slow', 50, 100000, id=2, **{'async': True})
+        await asyncio.sleep_ms(10)
+        if reset:
+            # Connection reset (e.g., host crashed).
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                              struct.pack('ii', 1, 0))
+        client.close()
+        # Reply (and event) to lost client are dropped.
+        await asyncio.sleep_ms(100)
+        await events.publish('test.event', {'x': 1})
+
+        # Server still serves new clients.
+        client = socket.create_connection(('127.0.0.1', server))
+        _request(client, 'test.slow', 5, 3, id=3, **{'async': True})
+        response = await _response(client)
+        client.close()
+        await asyncio.sleep_ms(10)
+        return response
+
+    assert virtual.run(main()) == {'result': 'xxx', 'id': 3}
+    # Connection of lost client was dropped.
+    assert events.SUBSCRIBERS == []
+
+
+def test_client_lost_mid_reply(server):
+    async def main():
+        client = socket.create_connection(('127.0.0.1', server))
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        # Reply does not fit in socket buffers: server blocks writing it.
+        _request(client, 'test.slow', 0, 1 << 23, id=1, **{'async': True})
+        await asyncio.sleep_ms(50)
+        assert client.recv(100).startswith(b'{"result": "xxx')
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                          struct.pack('ii', 1, 0))
+        client.close()
+        await asyncio.sleep_ms(50)
+
+        client = socket.create_connection(('127.0.0.1', server))
+        _request(client, '__describe__', id=2)
+        response = await _response(client)
+        client.close()
+        await asyncio.sleep_ms(10)
+        return response
+
+    assert virtual.run(main())['id'] == 2
+
+
+def test_request_while_reply_blocked(server):
+    async def main():
+        client = socket.create_connection(('127.0.0.1', server))
+        # Reply does not fit in socket buffers: server blocks writing it,
+        # while waiting for the next request on the same connection.
+        _request(client, 'test.slow', 0, 1 << 24, id=1, **{'async': True})
+        await asyncio.sleep_ms(10)
+        _request(client, '__describe__', id=2)
+        responses = [await _response(client), await _response(client)]
+        client.close()
+        await asyncio.sleep_ms(10)
+        return responses
+
+    responses = virtual.run(main())
+    assert [response['id'] for response in responses] == [1, 2]
+    assert len(responses[0]['result']) == 1 << 24
+
+
+def test_registry():
+    registry = rpc.Registry()
+    assert registry.register('a', min) == 0
+    assert registry.register('b', max) == 1
+    # Registering a name again replaces its function, keeping its opcode.
+    assert registry.register('a', abs) == 0
+    assert registry.describe() == {'a': 0, 'b': 1}
+    assert registry.lookup(0) is abs and registry.lookup('b') is max
+    for command in (2, -1, 'c', None):
+        assert registry.lookup(command) is None
+
+
+def test_call_dispatch(clock, monkeypatch):
+    opcode = rpc.REGISTRY.describe()['test.slow']
+    monkeypatch.setitem(rpc.CONTEXT, 'double', lambda x: 2 * x)
+
+    async def main():
+        return [await rpc._call({'command': opcode, 'args': [0, 2],
+                                 'async': True}),
+                await rpc._call({'command': 'test.slow', 'args': [1],
+                                 'kwargs': {'size': 1}, 'async': True}),
+                await rpc._call({'command': 'double', 'args': [4],
+                                 'eval': True}),
+                # Registered commands are found without evaluation.
+                await rpc._call({'command': 'test.slow', 'args': [0],
+                                 'eval': True})]
+
+    result = virtual.run(main())
+    assert result[:3] == ['xx', 'x', 8]
+    # Not awaited (`async` not set).
+    result[3].close()
+
+
+def test_unknown_command(server):
+    async def main():
+        client = socket.create_connection(('127.0.0.1', server))
+        # Not evaluated unless `eval` is set.
+        _request(client, 'len([])', id=1)
+        _request(client, 1000, id=2)
+        responses = [await _response(client), await _response(client)]
+        client.close()
+        await asyncio.sleep_ms(10)
+        return responses
+
+    assert virtual.run(main()) == [
+        {'error': 'unknown command: `len([])`', 'command': 'len([])',
+         'id': 1},
+        {'error': 'unknown command: `1000`', 'command': 1000, 'id': 2}]
+
+
+@pytest.mark.parametrize('stop_on_error', [True, False, None])
+def test_batch(server, stop_on_error):
+    message = {'calls': [{'command': 'test.slow', 'args': [5, 1],
+                          'async': True},
+                         {'command': 'nope'},
+                         {'command': 'test.slow', 'args': [0, 2],
+                          'async': True}],
+               'id': 7}
+    if stop_on_error is not None:
+        message['stop_on_error'] = stop_on_error
+
+    async def main():
+        client = socket.create_connection(('127.0.0.1', server))
+        _request(client, '__batch__', **message)
+        response = await _response(client)
+        client.close()
+        await asyncio.sleep_ms(10)
+        return response
+
+    results = [{'result': 'x'},
+               {'error': 'unknown command: `nope`', 'command': 'nope'}]
+    if stop_on_error is False:
+        # Calls after the failed call are still executed, in order.
+        results.append({'result': 'xx'})
+    assert virtual.run(main()) == {'result': results, 'id': 7}
+
+
+def test_loopstats(server):
+    async def main():
+        client = socket.create_connection(('127.0.0.1', server))
+        responses = []
+        for i, action in enumerate(['reset', 'enable', None, 'reset',
+                                    'disable', 'reset']):
+            args = [] if action is None else [action]
+            _request(client, '__loopstats__', *args, id=i)
+            responses.append((await _response(client))['result'])
+        client.close()
+        await asyncio.sleep_ms(10)
+        return responses
+
+    responses = virtual.run(main())
+    for result in responses:
+        assert set(result['queues']) >= {'runq', 'waitq'}
+    # Reset is a no-op while instrumentation is disabled.
+    assert list(responses[0]) == ['queues']
+    assert responses[2]['steps'] > responses[1]['steps']
+    assert responses[3]['steps'] < responses[2]['steps']
+    assert list(responses[4]) == list(responses[5]) == ['queues']
@@ -0,0 +1,199 @@
+import socket
+
+import pytest
+import uasyncio as asyncio
+import usocket
+
+from sim import virtual
+
+
+def _pipe():
+    '''Return writer/reader on a socket pair, with the writer's socket send
+    buffer already full.'''
+    a, b = socket.socketpair()
+    a.setblocking(False)
+    b.setblocking(False)
+    backlog = 0
+    for size in (4096, 256, 1):
+        while True:
+            try:
+                backlog += a.send(bytes(size))
+            except BlockingIOError:
+                break
+    wsock = usocket.socket(fileno=a.detach())
+    rsock = usocket.socket(fileno=b.detach())
+    return (asyncio.StreamWriter(wsock, {}, buffer_size=1024, flush_ms=-1),
+            asyncio.StreamReader(rsock), backlog)
+
+
+async def _drain(areader, received, size):
+    # Start reading late, so the writer's flush blocks meanwhile.
+    await asyncio.sleep_ms(5)
+    while len(received) < size:
+        received.extend(await areader.read(4096))
+
+
+def test_aflush_waits_for_flush_in_progress(clock):
+    awriter, areader, backlog = _pipe()
+    received = bytearray()
+    done = []
+
+    async def first():
+        await awriter.awrite(b'a' * 100)
+        await awriter.aflush()
+        done.append(('first', awriter.olen))
+
+    async def second():
+        await awriter.awrite(b'b' * 100)
+        # `first` is still writing out the buffer.
+        assert awriter._flushing
+        await awriter.aflush()
+        done.append(('second', awriter.olen))
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        loop.create_task(_drain(areader, received, backlog + 200))
+        loop.create_task(first())
+        await asyncio.sleep_ms(1)
+        await second()
+        await asyncio.sleep_ms(1)
+        await awriter.aclose()
+
+    virtual.run(main())
+    # Both flushes returned once all their data was written out.
+    assert done == [('first', 0), ('second', 0)]
+    assert received[backlog:] == b'a' * 100 + b'b' * 100
+
+
+def test_aclose_waits_for_flush_in_progress(clock):
+    awriter, areader, backlog = _pipe()
+    received = bytearray()
+    closed = []
+
+    async def writer():
+        for i in range(10):
+            await awriter.awrite(b'%02d' % i * 50)
+        await awriter.aflush()
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        loop.create_task(_drain(areader, received, backlog + 1000))
+        loop.create_task(writer())
+        await asyncio.sleep_ms(1)
+        assert awriter._flushing
+        await awriter.aclose()
+        closed.append(awriter.olen)
+        await asyncio.sleep_ms(10)
+
+    virtual.run(main())
+    assert closed == [0]
+    assert received[backlog:] == b''.join(b'%02d' % i * 50
+                                          for i in range(10))
+
+
+def _reader():
+    '''Return raw socket to write to, and stream reader of its peer.'''
+    a, b = socket.socketpair()
+    b.setblocking(False)
+    return a, asyncio.StreamReader(usocket.socket(fileno=b.detach()))
+
+
+async def _feed(sock, *chunks):
+    # Each chunk arrives in a separate read.
+    for chunk in chunks:
+        await asyncio.sleep_ms(1)
+        sock.sendall(chunk)
+    await asyncio.sleep_ms(1)
+    sock.close()
+
+
+def test_readline_into_line_split_across_reads(clock):
+    sock, areader = _reader()
+    buf = bytearray(32)
+
+    async def main():
+        asyncio.get_event_loop().create_task(
+            _feed(sock, b'{"a":', b' 1}\r\n{"b"', b': 2}\n{"c": 3}'))
+        lines = []
+        while True:
+            line = bytes(await areader.readline_into(buf))
+            if not line:
+                return lines
+            lines.append(line)
+
+    # Last line has no newline at end of stream.
+    assert virtual.run(main()) == [b'{"a": 1}\r\n', b'{"b": 2}\n',
+                                   b'{"c": 3}']
+
+
+def test_readline_into_line_too_long(clock):
+    sock, areader = _reader()
+    buf = bytearray(16)
+
+    async def main():
+        asyncio.get_event_loop().create_task(
+            _feed(sock, b'x' * 20, b'y' * 20 + b'\nok\n', b'z' * 40))
+        with pytest.raises(ValueError, match='too long'):
+            await areader.readline_into(buf)
+        # Rest of long line was discarded.
+        assert bytes(await areader.readline_into(buf)) == b'ok\n'
+        # Long line at end of stream.
+        with pytest.raises(ValueError, match='too long'):
+            await areader.readline_into(buf)
+        assert bytes(await areader.readline_into(buf)) == b''
+
+    virtual.run(main())
+
+
+def test_readinto_mixed_with_readline_into(clock):
+    sock, areader = _reader()
+    buf = bytearray(64)
+
+    async def main():
+        asyncio.get_event_loop().create_task(
+            _feed(sock, b'line 1\n\x00\x05hel', b'lo', b'line 2\nab',
+                  b'cdef'))
+        assert bytes(await areader.readline_into(buf)) == b'line 1\n'
+        # Data read past the newline is returned first.
+        assert bytes(await areader.readinto(buf, 2)) == b'\x00\x05'
+        assert bytes(await areader.readinto(buf, 5)) == b'hello'
+        assert bytes(await areader.readline_into(buf)) == b'line 2\n'
+        assert await areader.readexactly(3) == b'abc'
+        # Shorter at end of stream.
+        assert bytes(await areader.readinto(buf, 10)) == b'def'
+        assert bytes(await areader.readline_into(buf)) == b''
+
+    virtual.run(main())
+
+
+def test_flush_timer_write_error(clock):
+    a, b = socket.socketpair()
+    a.setblocking(False)
+    awriter = asyncio.StreamWriter(usocket.socket(fileno=a.detach()), {},
+                                   buffer_size=256, flush_ms=5)
+    # Peer is gone.
+    b.close()
+    ticks = []
+
+    async def ticker():
+        for i in range(5):
+            await asyncio.sleep_ms(10)
+            ticks.append(i)
+
+    async def main():
+        asyncio.get_event_loop().create_task(ticker())
+        await awriter.awrite(b'lost')
+        # Flushed (and failed) by the flush timer, in another task.
+        await asyncio.sleep_ms(20)
+        assert awriter.olen == 0
+        # The error is raised by the next write (or flush).
+        with pytest.raises(OSError):
+            await awriter.awrite(b'more')
+        with pytest.raises(OSError):
+            await awriter.aflush()
+        await awriter.aclose()
+        await asyncio.sleep_ms(50)
+
+    virtual.run(main())
+    # The event loop kept running.
+    assert ticks == [0, 1, 2, 3, 4]
@@ -0,0 +1,77 @@
+import pytest
+import uasyncio as asyncio
+import utime
+
+import tasks
+from sim import virtual
+
+
+def test_cancel_wakes_sleeping_task(clock):
+    stopped = []
+
+    async def sleeper():
+        try:
+            await asyncio.sleep_ms(100000)
+        finally:
+            stopped.append(utime.ticks_ms())
+
+    async def main():
+        handle = tasks.create(sleeper())
+        await asyncio.sleep_ms(3000)
+        assert tasks.cancel(handle)
+        with pytest.raises(RuntimeError, match='cancelled'):
+            await tasks.join(handle)
+        return handle
+
+    handle = virtual.run(main())
+    assert stopped == [3000]
+    assert clock.ms() == 3000
+    assert tasks.status(handle)['status'] == tasks.CANCELLED
+    assert not tasks.cancel(handle)
+
+
+def test_cancel_waiting_task(clock):
+    event = asyncio.Event()
+    stopped = []
+
+    async def waiter():
+        try:
+            await event.wait()
+        finally:
+            stopped.append(utime.ticks_ms())
+
+    async def main():
+        handle = tasks.create(waiter())
+        await asyncio.sleep_ms(10)
+        tasks.cancel(handle)
+        with pytest.raises(RuntimeError, match='cancelled'):
+            await tasks.join(handle)
+
+    virtual.run(main())
+    assert stopped == [10]
+    assert event.waiting == []
+
+
+def test_join_timeout(clock):
+    async def sleeper():
+        await asyncio.sleep_ms(100)
+        return 'done'
+
+    async def main():
+        handle = tasks.create(sleeper())
+        with pytest.raises(asyncio.TimeoutError, match='still running'):
+            await tasks.join(handle, 20)
+        assert utime.ticks_ms() == 20
+        assert await tasks.join(handle) == 'done'
+        assert utime.ticks_ms() == 100
+
+    virtual.run(main())
+
+
+def test_wait_for_ms_wakes_sleeping_coroutine(clock):
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for_ms(asyncio.sleep_ms(60000), 50)
+        assert utime.ticks_ms() == 50
+
+    virtual.run(main())
@@ -0,0 +1,100 @@
+import uasyncio as asyncio
+import utime
+
+from sim import virtual
+
+
+def test_sleep_ms_wakes_at_exact_time(clock):
+    wakes = []
+
+    async def sleeper():
+        for delay in (10, 25, 1000, 3600000):
+            await asyncio.sleep_ms(delay)
+            wakes.append(utime.ticks_ms())
+
+    virtual.run(sleeper())
+    assert wakes == [10, 35, 1035, 3601035]
+
+
+def test_concurrent_sleepers_wake_in_deadline_order(clock):
+    wakes = []
+
+    async def sleeper(name, delay):
+        await asyncio.sleep_ms(delay)
+        wakes.append((utime.ticks_ms(), name))
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        for name, delay in (('a', 30), ('b', 10), ('c', 20), ('d', 10)):
+            loop.create_task(sleeper(name, delay))
+        await asyncio.sleep_ms(100)
+
+    virtual.run(main())
+    # Sleepers due at the same time wake in the order they went to sleep.
+    assert wakes == [(10, 'b'), (10, 'd'), (20, 'c'), (30, 'a')]
+    assert utime.ticks_ms() == 100
+
+
+def test_periodic_sleeper_does_not_drift(clock):
+    wakes = []
+
+    async def periodic():
+        for i in range(5):
+            # Busy for 0.3 ms of (virtual) time on each wake-up.
+            clock.sleep_us(300)
+            await asyncio.sleep_ms(20)
+            wakes.append(utime.ticks_ms())
+
+    virtual.run(periodic())
+    assert wakes == [20, 40, 60, 80, 100]
+
+
+def test_run_returns_result(clock):
+    async def answer():
+        await asyncio.sleep(2)
+        return 42
+
+    assert virtual.run(answer()) == 42
+    assert clock.ms() == 2000
+
+
+def test_timer_fires_at_due_time(clock):
+    fired = []
+    one_shot = virtual.Timer(0)
+    periodic = virtual.Timer(1)
+    one_shot.init(mode=one_shot.ONE_SHOT, period=15,
+                  callback=lambda timer: fired.append(('one', clock.now)))
+    periodic.init(mode=periodic.PERIODIC, period=10,
+                  callback=lambda timer: fired.append(('periodic',
+                                                       clock.now)))
+    clock.advance(35000)
+    assert fired == [('periodic', 10000), ('one', 15000),
+                     ('periodic', 20000), ('periodic', 30000)]
+    assert one_shot.count == 1 and one_shot.due is None
+    periodic.deinit()
+    clock.advance(100000)
+    assert periodic.count == 3
+
+
+def test_loop_wakes_for_timer(clock):
+    armed = []
+    fired = []
+    timer = virtual.Timer(0)
+
+    async def main():
+        timer.init(mode=timer.ONE_SHOT, period=7,
+                   callback=lambda timer: fired.append(clock.now))
+        armed.append(clock.now)
+        await asyncio.sleep_ms(50)
+
+    virtual.run(main())
+    assert fired == [armed[0] + 7000]
+    assert clock.ms() == 50
+
+
+def test_sleep_us_advances_clock(clock):
+    start = utime.ticks_us()
+    utime.sleep_us(250)
+    utime.sleep_ms(2)
+    # Each read of the clock takes `read_us` (1 us).
+    assert utime.ticks_diff(utime.ticks_us(), start) == 2251
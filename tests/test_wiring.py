@@ -0,0 +1,49 @@
+import pytest
+import uasyncio as asyncio
+
+import config
+import wiring
+from sim import virtual
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    '''Empty ``config.json`` settings, restored after the test.'''
+    monkeypatch.setattr(config, 'CONFIG', {})
+    return config.CONFIG
+
+
+def test_defaults(i2c, settings):
+    bus = wiring.i2c_bus()
+    assert bus.freq == 10000
+    motor_ctrl = wiring.motor_control(bus)
+    assert motor_ctrl.engine is not None
+    assert motor_ctrl.engine.timer is None
+    assert motor_ctrl.engine.tolerance_ms == 2
+    assert motor_ctrl.board_options == {'mask_write': False}
+    loop = wiring.event_loop()
+    assert loop is asyncio.get_event_loop()
+    assert loop.budget_us == 5000
+    assert loop.stats is None
+
+
+def test_settings(i2c, settings):
+    settings.update({'i2c': {'freq': 400000},
+                     'pulse': {'tolerance_ms': 0, 'mask_write': True,
+                               'timer': 0},
+                     'motor': {'retries': 1},
+                     'loop': {'budget_us': 0, 'instrument': True}})
+    bus = wiring.i2c_bus()
+    assert bus.freq == 400000
+    motor_ctrl = wiring.motor_control(bus)
+    assert isinstance(motor_ctrl.engine.timer, virtual.Timer)
+    assert motor_ctrl.engine.tolerance_ms == 0
+    assert motor_ctrl.board_options == {'mask_write': True, 'retries': 1}
+    # `motor` settings are not modified.
+    assert settings['motor'] == {'retries': 1}
+    loop = wiring.event_loop()
+    assert loop.budget_us == 0
+    assert loop.stats is not None
+
+    settings['pulse']['enabled'] = False
+    assert wiring.motor_control(bus).engine is None